@@ -22,9 +22,11 @@
 """dismantle.py: Disassemble a binary ROM image file.
 """
 
+import os
 import sys
 import argparse
 import textwrap
+import zipfile
 
 import dismantler
 
@@ -76,9 +78,68 @@ if __name__ == '__main__':
                         choices=dismantler.cpus,
                         help='(REQUIRED) Specify CPU type.')
 
-    parser.add_argument('-B', '--base_address', action='store', type=parse_int, default=0,
+    parser.add_argument('--detect_cpu', '--detect-cpu', action='store_true',
+                        help="""Disassemble the image with every supported CPU type in parallel,
+                                and output a ranked verdict of the most plausible types
+                                instead of the listing. -c is not needed.""")
+
+    parser.add_argument('--detect_base', '--detect-base', action='store_true',
+                        help="""Guess the base address of the image from its absolute jump
+                                and call targets, and output a ranked list of candidate
+                                base addresses instead of the listing.""")
+
+    parser.add_argument('-B', '--base_address', action='store', type=parse_int, default=None,
                         metavar='ADDRESS',
-                        help='Specify base address of ROM image. Default = 0x0000.')
+                        help="""Specify base address of ROM image. Default = 0x0000 for raw
+                                binary files, or the lowest address in hex files.""")
+
+    parser.add_argument('--format', action='store', choices=dismantler.loaders.formats,
+                        dest='image_format',
+                        help="""Specify image file format. By default it is chosen by file
+                                name extension: .hex, .ihx, .ihex, .h86 and .a43 are Intel HEX;
+                                .s19, .s28, .s37, .srec, .mot and .sx are Motorola S-records;
+                                anything else is raw binary.""")
+
+    parser.add_argument('--zip_member', action='append',
+                        metavar='PATTERN', dest='zip_members',
+                        help="""Select members of zip archive image files by shell-style
+                                name PATTERN, e.g. '*u12*.bin'. Members are read into memory
+                                without extracting them. Members matching several patterns
+                                are taken in pattern order. Default is every member.
+                                Flag may be used multiple times.""")
+
+    parser.add_argument('--batch', action='store',
+                        metavar='DIR',
+                        help="""Disassemble each image file, or each selected archive member,
+                                separately in parallel worker processes, writing listings
+                                to DIR named after the file, or after the archive and
+                                member, e.g. DIR/boards.zip_u12.bin.lst. Only entry,
+                                breakpoint, label and port options apply.""")
+
+    parser.add_argument('--jobs', action='store', type=parse_int, default=None,
+                        metavar='N',
+                        help="""Number of worker processes for --batch and --detect_cpu.
+                                Default = number of CPUs, or of CPU types.""")
+
+    parser.add_argument('--listing_jobs', '--listing-jobs', action='store', type=parse_int, default=1,
+                        metavar='N',
+                        help="""Render each listing in chunks by N worker processes.
+                                0 = number of CPUs. The output is the same as from
+                                one process. Default = 1.""")
+
+    parser.add_argument('--traversal_jobs', '--traversal-jobs', action='store', type=parse_int,
+                        default=1, metavar='N',
+                        help="""Disassemble groups of entry points speculatively in N
+                                worker processes. 0 = number of CPUs. The output is
+                                the same as from one process. Default = 1.""")
+
+    parser.add_argument('--interleave', action='store_true',
+                        help="""Combine several image files as byte-interleaved chips
+                                (even, odd, ...) instead of concatenating them.""")
+
+    parser.add_argument('--address_width', action='store', type=parse_int, default=16,
+                        metavar='BITS',
+                        help='Specify number of bits in a memory address, for formatting. Default = 16.')
 
     parser.add_argument('-e', '--entry', action='append', type=parse_int,
                         metavar='ADDRESS', dest='entries',
@@ -107,26 +168,224 @@ if __name__ == '__main__':
                                 Only applicable to CPUs with a separate IO space.
                                 If no labels are defined, default labels vary by CPU type.""")
 
-    parser.add_argument('-d', '--data8', action='append', type=parse_int,
-                        metavar='ADDRESS',
-                        help='Classify location as 8-bit data prior to disassembly.')
+    parser.add_argument('--symbols', action='append', type=argparse.FileType('r'),
+                        metavar='FILE', dest='symbol_files',
+                        help="""Read memory address labels from an assembler symbol file
+                                (NAME EQU VALUE, NAME = VALUE, ADDRESS NAME, etc.).
+                                Flag may be used multiple times.""")
+
+    parser.add_argument('--annotations', action='append', type=argparse.FileType('r'),
+                        metavar='FILE', dest='annotation_files',
+                        help="""Read labels, ports, comments, entries, breakpoints and
+                                classifications from an annotation file.
+                                Flag may be used multiple times.""")
 
-    parser.add_argument('-w', '--data16', action='append', type=parse_int,
+    parser.add_argument('-d', '--data8', action='append', type=dismantler.util.parse_span,
+                        metavar='SPAN',
+                        help="""Classify location(s) as 8-bit data prior to disassembly.
+                                SPAN is ADDRESS, START..END (inclusive) or START:COUNT bytes.""")
+
+    parser.add_argument('-w', '--data16', action='append', type=dismantler.util.parse_span,
+                        metavar='SPAN',
+                        help="""Classify location(s) as 16-bit data prior to disassembly.
+                                SPAN is ADDRESS, START..END (inclusive) or START:COUNT words.""")
+
+    parser.add_argument('-v', '--vector', action='append', type=dismantler.util.parse_span,
+                        metavar='SPAN', dest='vectors',
+                        help="""Classify location(s) as vectors pointing to executable code.
+                                Contents of locations are added to entry list, and are subject
+                                to label substitution and creation.
+                                SPAN is ADDRESS, START..END (inclusive) or START:COUNT vectors.""")
+
+    parser.add_argument('--string', action='append', type=dismantler.util.parse_span,
+                        metavar='SPAN', dest='strings',
+                        help="""Classify NUL-terminated string(s) as text prior to disassembly.
+                                SPAN is ADDRESS (one string), START..END (strings filling range)
+                                or START:COUNT strings.""")
+
+    parser.add_argument('--string_bit7', action='append', type=dismantler.util.parse_span,
+                        metavar='SPAN', dest='strings_bit7',
+                        help="""Classify string(s) terminated by a character with bit 7 set
+                                as text prior to disassembly. SPAN is as for --string.""")
+
+    parser.add_argument('--entropy_map', '--entropy-map', action='store_true',
+                        help="""Output a table of fill, text, high-entropy and other regions
+                                of the image instead of the listing.""")
+
+    parser.add_argument('--exclude_high_entropy', '--exclude-high-entropy', action='store_true',
+                        help="""Classify high-entropy regions of 256 bytes or more, such as
+                                compressed data, as 8-bit data before disassembly, and do not
+                                disassemble within them.""")
+
+    parser.add_argument('--find_vectors', '--find-vectors', action='store',
+                        choices=['propose', 'apply'], metavar='MODE',
+                        help="""After disassembly, search unreachable locations for runs of
+                                four or more words pointing at plausible instruction starts.
+                                MODE propose outputs them as -v flags instead of the listing;
+                                MODE apply classifies them as vector tables and disassembles
+                                from their targets.""")
+
+    parser.add_argument('--find_data', '--find-data', action='store_true',
+                        help="""After disassembly, scan unreachable and 8-bit data locations
+                                for strings, referenced page-aligned 256-byte tables and
+                                monotonic tables, and list them as text and multi-byte
+                                DB lines.""")
+
+    parser.add_argument('--code_likelihood', '--code-likelihood', action='store',
+                        choices=['annotate', 'suggest'], metavar='MODE',
+                        help="""After disassembly, score runs of unreachable locations as code
+                                or data with a code model. MODE annotate adds a code
+                                likelihood comment to each code-like and data-like span;
+                                MODE suggest outputs the starts of likely code spans as -e
+                                flags instead of the listing.""")
+
+    parser.add_argument('--code_model', '--code-model', action='store', type=argparse.FileType('r'),
+                        metavar='FILE',
+                        help="""Score with the code model in FILE. Default is the model shipped
+                                with the CPU module if any, otherwise one trained on the code
+                                and data classified in the image itself.""")
+
+    parser.add_argument('--train_model', '--train-model', action='store', metavar='FILE',
+                        help="""After disassembly, add the byte pairs of the code and data
+                                classified in the image to the code model in FILE, creating
+                                it if needed.""")
+
+    parser.add_argument('--inline', action='append', nargs=2,
+                        metavar=('ADDRESS', 'RULE'), dest='inline_rules',
+                        help="""Declare inline arguments following calls to the subroutine at
+                                ADDRESS. RULE is bytes:N, string (NUL-terminated),
+                                string:TERMINATOR, string_bit7 or vectors:N.
+                                Execution resumes after the arguments, which are
+                                classified as data. Flag may be used multiple times.""")
+
+    parser.add_argument('-n', '--no_return', action='append', type=parse_int,
                         metavar='ADDRESS',
-                        help='Classify location as 16-bit data prior to disassembly.')
+                        help="""Declare that the subroutine at ADDRESS never returns, so that
+                                bytes following calls to it are not disassembled.
+                                Flag may be used multiple times.""")
 
-    parser.add_argument('-v', '--vector', action='append', type=parse_int,
-                        metavar='ADDRESS', dest='vectors',
-                        help="""Classify location as a vector pointing to executable code.
-                                Contents of location are added to entry list, and are subject
-                                to label substitution and creation.""")
+    parser.add_argument('-N', '--infer_no_return', action='store_true',
+                        help="""Find subroutines from which no return is reachable, and redo
+                                disassembly without following calls to them.""")
+
+    parser.add_argument('--resolve_overlaps', '--resolve-overlaps', action='store_true',
+                        help="""Decode every possible instruction start first, then resolve
+                                overlapping instructions by their entries, references and
+                                valid opcodes rather than by which was reached first, so
+                                that the listing does not depend on the order of -e flags.""")
+
+    parser.add_argument('--emulate', action='store', type=parse_int, metavar='N',
+                        help="""After disassembly, emulate up to N instructions from the first
+                                entry address, and disassemble from every ROM address
+                                executed. 8080, 8085 and Z80 only.""")
+
+    parser.add_argument('--emulate_ram', '--emulate-ram', action='append',
+                        type=dismantler.util.parse_span, metavar='SPAN',
+                        help="""Declare SPAN (START..END or START:COUNT) as RAM for --emulate.
+                                By default every address outside the ROM image is RAM.
+                                Flag may be used multiple times.""")
+
+    parser.add_argument('--io_script', '--io-script', action='store', type=argparse.FileType('r'),
+                        metavar='FILE',
+                        help="""Script input port values for --emulate; see the
+                                dismantler.emulate module for the format. Unscripted
+                                ports read as FFh.""")
+
+    parser.add_argument('--emulate_interrupt', '--emulate-interrupt', action='store', nargs=2,
+                        type=parse_int, metavar=('PERIOD', 'ADDRESS'),
+                        help="""Interrupt to ADDRESS every PERIOD emulated instructions
+                                while interrupts are enabled.""")
+
+    parser.add_argument('--relocate', action='append', nargs=2,
+                        metavar=('SPAN', 'ADDRESS'), dest='relocations',
+                        help="""Declare that the ROM bytes in SPAN (START..END or START:COUNT)
+                                are copied to and executed at ADDRESS. They are analyzed
+                                and listed at ADDRESS, with labels and cross-references
+                                shared with the rest of the ROM. Data classifications from
+                                -d, -w, --string and annotations, and breakpoints from -b,
+                                apply to ROM addresses only and do not stop or classify
+                                code at ADDRESS. Flag may be used multiple times.""")
+
+    parser.add_argument('--bank_window', action='store', type=dismantler.util.parse_span,
+                        metavar='SPAN',
+                        help="""Treat the image as banks mapped one at a time into the
+                                window START..END or START:SIZE, following any --common
+                                region. All banks are disassembled in one analysis, with
+                                bank-qualified labels and one listing per bank.""")
+
+    parser.add_argument('--common', action='store', type=dismantler.util.parse_span,
+                        metavar='SPAN',
+                        help="""With --bank_window, the first bytes of the image form a
+                                common region always mapped at START..END or START:SIZE.""")
+
+    parser.add_argument('--bank', action='store', default='0',
+                        metavar='BANK',
+                        help="""With --bank_window, name or number of the bank mapped at
+                                reset. Default = 0.""")
+
+    parser.add_argument('--bank_stub', action='append', nargs=3,
+                        metavar=('ADDRESS', 'BANK', 'TARGET'), dest='bank_stubs',
+                        help="""With --bank_window, declare that a jump or call to ADDRESS
+                                continues at TARGET in BANK. Flag may be used multiple times.""")
+
+    parser.add_argument('--bank_entry', action='append', nargs=2,
+                        metavar=('BANK', 'ADDRESS'), dest='bank_entries',
+                        help="""With --bank_window, specify an entry point in a bank.
+                                Flag may be used multiple times.""")
+
+    parser.add_argument('--bank_listing', action='store',
+                        metavar='DIR',
+                        help="""With --bank_window, write the listing of each region to
+                                DIR/NAME.lst (or NAME.asm with -s) instead of stdout.""")
 
     parser.add_argument('-s', '--source', action='store_true',
                         help='Output assembler source format instead of listing format.')
 
-    parser.add_argument('bin_file', action='store', type=argparse.FileType('rb'),
-                        nargs='?', default=None,
-                        help='Binary file containing image of ROM to be disassembled.')
+    parser.add_argument('--warnings_only', '--warnings-only', action='store_true',
+                        help="""Output a summary and list of diagnostics instead of the listing.""")
+
+    parser.add_argument('--max_warnings', '--max-warnings', action='store', type=parse_int,
+                        metavar='N',
+                        help="""If more than N warnings and errors are found, output the
+                                diagnostics report to stderr instead of the listing
+                                and exit with an error code.""")
+
+    parser.add_argument('--cfg', action='store', type=argparse.FileType('w'),
+                        metavar='FILE', dest='cfg_file',
+                        help="""Write basic blocks and control flow graph to FILE, in Graphviz
+                                DOT format if FILE ends with .dot, otherwise in JSON format.""")
+
+    parser.add_argument('--callgraph', action='store', type=argparse.FileType('w'),
+                        metavar='FILE', dest='callgraph_file',
+                        help="""Write subroutines and call graph to FILE, in Graphviz
+                                DOT format if FILE ends with .dot, otherwise in JSON format.""")
+
+    parser.add_argument('--call_report', action='store', type=parse_int,
+                        metavar='N',
+                        help="""Output a report of the N most-called subroutines instead
+                                of the listing.""")
+
+    parser.add_argument('--cycles', action='store_true',
+                        help="""Annotate the listing with the clock cycles of each instruction,
+                                basic block and loop iteration. Conditional instructions
+                                show cycles when not taken/taken.""")
+
+    parser.add_argument('--loop_report', '--loop-report', action='store', type=parse_int,
+                        metavar='N',
+                        help="""Output a report of the N loops with the most expensive
+                                iterations, in clock cycles, instead of the listing.""")
+
+    parser.add_argument('--explain', action='append', type=parse_int,
+                        metavar='ADDRESS',
+                        help="""Output the chain of instructions, entries, vectors or user
+                                flags which caused the location to be classified, instead
+                                of the listing. Flag may be used multiple times.""")
+
+    parser.add_argument('bin_files', action='store', type=argparse.FileType('rb'),
+                        nargs='*', metavar='bin_file',
+                        help="""File containing image of ROM to be disassembled. Several
+                                files, such as the chips of a split or interleaved ROM,
+                                are combined into one image.""")
 
     def arg_error(msg):
         """Print error message, print usage summary, and exit with error code."""
@@ -140,81 +399,538 @@ if __name__ == '__main__':
     # List CPUs and exit if --list_cpus is specified
     if (args.list_cpus == 1):
         print('Supported CPUs:')
-        for cpu in sorted(list(dismantler.cpus.keys())):
-            print('  {:8} {:}'.format(cpu, dismantler.cpus[cpu].description))
+        # Descriptions come from registry metadata, so no decoders are imported.
+        for cpu in dismantler.registry.keys():
+            print('  {:8} {:}'.format(cpu, dismantler.registry.description(cpu)))
         exit(0)
 
+    def selected_members(archive):
+        """Return names of selected members of a zip archive, in pattern order."""
+
+        names = []
+        for pattern in (args.zip_members or ['*']):
+            for name in dismantler.loaders.archive_members(archive, pattern):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def load_images():
+        """Read and combine image files, returning (list of loaded images, segments)."""
+
+        loaded = []
+        try:
+            for f in args.bin_files:
+                if dismantler.loaders.is_archive(f.name):
+                    for member in selected_members(f):
+                        loaded.append(dismantler.loaders.load_member(f, member, args.image_format))
+                else:
+                    loaded.append(dismantler.loaders.load(f, f.name, args.image_format))
+                f.close()
+            if not loaded:
+                arg_error('No archive members match --zip_member.')
+            if len(loaded) == 1:
+                segments = loaded[0][0]
+            else:
+                segments = [dismantler.loaders.combine([dismantler.loaders.flatten(chip)
+                                                        for chip, start in loaded],
+                                                       args.interleave)]
+        except (ValueError, zipfile.BadZipFile) as e:
+            arg_error(str(e))
+        if not segments:
+            arg_error('Image file contains no data.')
+        return (loaded, segments)
+
     # Make sure necessary arguments are present
-    if args.bin_file is None:
+    if not args.bin_files:
         arg_error('You need to specify a binary file to be disassembled.')
-    if args.cpu is None:
+    if (args.cpu is None) and not args.detect_cpu:
         arg_error('You need to specify the CPU type with the -c/--cpu flag.')
 
+    # Rank CPU types by plausibility without disassembling if requested
+    if args.detect_cpu:
+        loaded, segments = load_images()
+        base_address, rom_data = dismantler.loaders.flatten(segments)
+        if args.base_address is not None:
+            base_address = args.base_address
+        results = dismantler.detect.detect(rom_data, base_address, entries=args.entries,
+                                           processes=args.jobs)
+        sys.stdout.write(dismantler.detect.report(results))
+        exit(0)
+
+    # Rank candidate base addresses without disassembling if requested
+    if args.detect_base:
+        loaded, segments = load_images()
+        base_address, rom_data = dismantler.loaders.flatten(segments)
+        results = dismantler.detect.detect_base(dismantler.cpus[args.cpu], rom_data,
+                                                args.address_width)
+        sys.stdout.write(dismantler.detect.base_report(results, args.address_width))
+        exit(0)
+
+    # Read symbol and annotation files. Their labels and ports count as
+    # user-provided, and -l/-p flags take precedence over them.
+    ann = dismantler.annotations.annotations()
+    try:
+        for f in (args.symbol_files or []):
+            ann.read_symbols(f, f.name)
+            f.close()
+        for f in (args.annotation_files or []):
+            ann.read_annotations(f, f.name)
+            f.close()
+    except ValueError as e:
+        arg_error(str(e))
+    for warning in ann.warnings:
+        sys.stderr.write('WARNING: {:s}\n'.format(warning))
+
     # Use default label map if auto label mode is requested
     # and there are no user-provided labels.
-    if args.auto_label and (args.labels is None):
-        labels = dismantler.default_labels[args.cpu]
+    if args.auto_label and (args.labels is None) and (len(ann.labels) == 0):
+        labels = dict(dismantler.default_labels[args.cpu])
     else:
         labels = {}
+    labels.update(ann.labels)
     if args.labels is not None:
         for address in args.labels:
             labels[address] = args.labels[address]
 
     # Use default port map if auto label mode is requested
     # and there are no user-provided ports.
-    if args.auto_label and (args.ports is None):
-        ports = dismantler.default_ports[args.cpu]
+    if args.auto_label and (args.ports is None) and (len(ann.ports) == 0):
+        ports = dict(dismantler.default_ports[args.cpu])
     else:
         ports = {}
+    ports.update(ann.ports)
     if args.ports is not None:
         for port in args.ports:
             ports[port] = args.ports[port]
             
     # Use default entry list for CPU if no entries are specified
-    if args.entries is None:
+    if (args.entries is None) and (len(ann.entries) == 0):
         entries = dismantler.default_entries[args.cpu]
     else:
-        entries=args.entries
+        entries = (args.entries or []) + ann.entries
 
-    if args.breakpoints is not None:
-        breakpoints = args.breakpoints
-    else:
-        breakpoints = []
+    breakpoints = (args.breakpoints or []) + ann.breakpoints
 
+    # Single vectors keep their one-at-a-time handling; spans become tables
+    # whose targets are all queued in one batch.
+    vectors       = []
+    vector_tables = list(ann.vector_tables)
     if args.vectors is not None:
-        vectors = args.vectors
-    else:
-        vectors = []
-
-    # Read the binary ROM image
-    rom_data = bytearray(args.bin_file.read())
-    args.bin_file.close()
+        for span in args.vectors:
+            if span == (span[0], None, 1):
+                vectors.append(span[0])
+            else:
+                vector_tables.append(dismantler.util.span_words(span))
+
+    # Disassemble each image, or each selected archive member, separately
+    if args.batch is not None:
+        jobs = []
+        try:
+            for f in args.bin_files:
+                f.close()
+                if dismantler.loaders.is_archive(f.name):
+                    jobs.extend([dismantler.batch.job(f.name, member)
+                                 for member in selected_members(f.name)])
+                else:
+                    jobs.append(dismantler.batch.job(f.name))
+        except zipfile.BadZipFile as e:
+            arg_error(str(e))
+        user_entries = (args.entries is not None) or (len(ann.entries) > 0)
+        opts = dismantler.batch.options(args.cpu,
+                                        entries=entries if user_entries else None,
+                                        labels=labels, ports=ports,
+                                        auto_label=args.auto_label,
+                                        breakpoints=breakpoints, source=args.source,
+                                        fmt=args.image_format,
+                                        address_width=args.address_width,
+                                        listing_processes=args.listing_jobs or None,
+                                        traversal_processes=args.traversal_jobs or None)
+        suffix = '.asm' if args.source else '.lst'
+        names  = {}
+        for job in jobs:
+            name = job.file_name() + suffix
+            if name in names:
+                arg_error('--batch would write {:s} for both {:s} and {:s}.'.format(
+                    name, names[name].name(), job.name()))
+            names[name] = job
+        failed = 0
+        for name, (job, listing, error) in zip(names, dismantler.batch.run(jobs, opts, args.jobs)):
+            if error is not None:
+                sys.stderr.write('ERROR: {:s}\n'.format(error))
+                failed = failed + 1
+                continue
+            with open(os.path.join(args.batch, name), 'w') as f:
+                f.write(listing)
+        exit(1 if failed else 0)
+
+    # Read the ROM image file(s)
+    loaded, segments = load_images()
+
+    # A start address from a hex file is an entry point unless entries were specified
+    if (args.entries is None) and (len(ann.entries) == 0):
+        for chip, start in loaded:
+            if (start is not None) and (start not in entries):
+                entries = list(entries) + [start]
+
+    base_address, rom_data = segments[0]
+    if args.base_address is not None:
+        if len(segments) > 1:
+            arg_error('-B cannot be used with an image of several segments.')
+        base_address = args.base_address
+
+    # Summarize the image without disassembling if requested
+    if args.entropy_map:
+        for address, data in segments:
+            regions = dismantler.entropy.regions(data, address)
+            sys.stdout.write(dismantler.entropy.report(
+                regions, lambda address: dismantler.util.hex_intel(address, args.address_width)))
+        exit(0)
 
-    # Prepare the ROM image
-    rom = dismantler.cpus[args.cpu](rom=rom_data,
-                                    base_address=args.base_address,
-                                    label_map=labels,
-                                    port_map=ports)
+    # Breakpoints are also added for excluded regions, so look them up quickly
+    if args.exclude_high_entropy:
+        breakpoints = set(breakpoints)
+
+    def configure_processes(rom):
+        """Set the worker processes used by a ROM object."""
+
+        rom.listing_processes   = args.listing_jobs or None
+        rom.traversal_processes = args.traversal_jobs or None
+
+    def configure(rom):
+        """Apply annotations and command line classifications to a ROM object."""
+
+        configure_processes(rom)
+
+        # Exclude compressed and other high-entropy data from disassembly
+        if args.exclude_high_entropy:
+            regions = dismantler.entropy.regions(rom.rom, rom.base_address)
+            for start, end in dismantler.entropy.high_spans(regions):
+                rom.set_data8_range(start, end)
+                rom.comments[start - rom.base_address] += 'High entropy data. '
+                breakpoints.update(range(start, end + 1))
+
+        # Apply file annotations first, so that command line flags override them
+        ann.apply(rom)
+
+        # Classify data locations
+        if args.data8 is not None:
+            for start, end, count in args.data8:
+                if end is None:
+                    end = start + count - 1
+                rom.set_data8_range(start, end)
+
+        if args.data16 is not None:
+            for span in args.data16:
+                rom.set_data16_array(*dismantler.util.span_words(span))
+
+        for spans, terminator in ((args.strings, 0x00), (args.strings_bit7, None)):
+            if spans is not None:
+                for start, end, count in spans:
+                    if end is not None:
+                        count = None
+                    rom.set_strings(start, count, terminator, end)
+
+        if args.no_return is not None:
+            rom.no_return.update(args.no_return)
+
+        for routine, rule in inline_rules:
+            rom.set_inline_args(routine, *rule)
+
+    def find_data(roms):
+        """Classify strings and tables found in unreachable and data locations."""
+
+        for each in roms:
+            dismantler.datascan.apply(each, dismantler.datascan.scan(each))
+
+    def image_roms():
+        """Return the ROM objects of a disassembled image other than a banked one."""
+
+        if len(segments) > 1:
+            return image.segments
+        elif args.relocations is not None:
+            return [rom] + [reloc.rom for reloc in image.regions]
+        return [rom]
+
+    inline_rules = []
+    if args.inline_rules is not None:
+        for address, rule in args.inline_rules:
+            try:
+                inline_rules.append((parse_int(address),
+                                     dismantler.annotations.parse_inline_rule(rule)))
+            except ValueError as e:
+                arg_error(str(e))
+
+    # Disassemble a bank-switched image as a whole, then output it per region
+    if args.bank_window is not None:
+        if args.relocations is not None:
+            arg_error('--relocate is not supported with --bank_window.')
+        if (args.find_vectors is not None) or (args.code_likelihood is not None) \
+           or (args.train_model is not None) or args.resolve_overlaps \
+           or (args.emulate is not None):
+            arg_error('--find_vectors, --code_likelihood, --train_model, --resolve_overlaps '
+                      'and --emulate are not supported with --bank_window.')
+        base_address, rom_data = dismantler.loaders.flatten(segments)
+        if (args.cfg_file is not None) or (args.callgraph_file is not None) \
+           or (args.call_report is not None) or (args.explain is not None) \
+           or args.infer_no_return or args.cycles or (args.loop_report is not None):
+            arg_error('--cfg, --callgraph, --call_report, --explain, -N, --cycles and '
+                      '--loop_report are not supported with --bank_window.')
+        start, end, count = args.bank_window
+        window = (start, count if end is None else end - start + 1)
+        common = None
+        if args.common is not None:
+            start, end, count = args.common
+            common = (start, count if end is None else end - start + 1)
+        try:
+            image = dismantler.banked.banked_image(dismantler.cpus[args.cpu], rom_data,
+                                                   window=window, common=common,
+                                                   label_map=labels, port_map=ports)
+            for address, bank, target in (args.bank_stubs or []):
+                image.add_stub(parse_int(address), bank, parse_int(target))
+            bank_entries = [(bank, parse_int(address)) for bank, address in (args.bank_entries or [])]
+            image.region_hooks.append(configure)
+            image.disassemble(entries=entries, bank=args.bank, bank_entries=bank_entries,
+                              create_labels=args.auto_label, breakpoints=breakpoints,
+                              vectors=vectors, vector_tables=vector_tables)
+        except ValueError as e:
+            arg_error(str(e))
+        if args.find_data:
+            find_data(image.regions.values())
+
+        if args.warnings_only:
+            sys.stdout.write(image.diagnostic_report())
+            exit(0)
+
+        if args.max_warnings is not None:
+            n_warnings = len(image.filter_diagnostics(min_severity=dismantler.rom_base.severity_warning))
+            if n_warnings > args.max_warnings:
+                sys.stderr.write(image.diagnostic_report(max_lines=args.max_warnings,
+                                                         min_severity=dismantler.rom_base.severity_warning))
+                sys.stderr.write('ERROR: {:d} warnings exceed limit of {:d}.\n'.format(n_warnings,
+                                                                                     args.max_warnings))
+                exit(1)
+
+        for name, text in image.listings(source=args.source):
+            if args.bank_listing is not None:
+                suffix = '.asm' if args.source else '.lst'
+                with open(os.path.join(args.bank_listing, name + suffix), 'w') as f:
+                    f.write(text)
+            else:
+                sys.stdout.write(text)
+        exit(0)
 
+    # Analyze a sparse image segment by segment
+    if len(segments) > 1:
+        if (args.cfg_file is not None) or (args.callgraph_file is not None) \
+           or (args.call_report is not None) or (args.explain is not None) \
+           or args.infer_no_return or (args.relocations is not None) or args.resolve_overlaps \
+           or args.cycles or (args.loop_report is not None):
+            arg_error('--cfg, --callgraph, --call_report, --cycles, --loop_report, --explain, -N, '
+                      '--relocate and --resolve_overlaps are not supported with an image of '
+                      'several segments.')
+        image = dismantler.segments.segmented_image(dismantler.cpus[args.cpu],
+                                                    address_width=args.address_width,
+                                                    label_map=labels, port_map=ports)
+        image.region_hooks.append(configure)
+        try:
+            for address, data in segments:
+                image.add_segment(address, data)
+        except ValueError as e:
+            arg_error(str(e))
+        rom = None
 
+    # Prepare the ROM image
+    else:
+        rom = dismantler.cpus[args.cpu](rom=rom_data,
+                                        base_address=base_address,
+                                        label_map=labels,
+                                        port_map=ports)
+
+        rom.address_width = args.address_width
+
+        if args.explain is not None:
+            rom.track_provenance()
+
+        configure(rom)
+        image = rom
+
+    # Analyze relocated ranges in their own address spaces if requested
+    if args.relocations is not None:
+        if args.infer_no_return or args.resolve_overlaps:
+            arg_error('-N and --resolve_overlaps are not supported with --relocate.')
+        image = dismantler.relocated.relocated_image(rom)
+
+        # Classifications are given as ROM addresses, while regions are
+        # analyzed at their runtime addresses
+        image.region_hooks.append(configure_processes)
+        try:
+            for span, runtime in args.relocations:
+                start, end, count = dismantler.util.parse_span(span)
+                if end is None:
+                    end = start + count - 1
+                image.add_region(start, end, parse_int(runtime))
+        except ValueError as e:
+            arg_error(str(e))
 
-    # Classify data locations
-    if args.data8 is not None:
-        for address in args.data8:
-            rom.set_data8(address)
+    # Disassemble the ROM image
+    if args.infer_no_return:
+        dismantler.noreturn.disassemble(rom,
+                                        entries=entries,
+                                        create_labels=args.auto_label,
+                                        breakpoints=breakpoints,
+                                        vectors=vectors,
+                                        vector_tables=vector_tables,
+                                        resolve_overlaps=args.resolve_overlaps)
+    elif args.resolve_overlaps:
+        rom.disassemble(entries=entries,
+                        create_labels=args.auto_label,
+                        breakpoints=breakpoints,
+                        vectors=vectors,
+                        vector_tables=vector_tables,
+                        resolve_overlaps=True)
+    else:
+        image.disassemble(entries=entries,
+                          create_labels=args.auto_label,
+                          breakpoints=breakpoints,
+                          vectors=vectors,
+                          vector_tables=vector_tables)
+
+    # Discover code reached through computed jumps by running the ROM
+    if args.emulate is not None:
+        if image is not rom:
+            arg_error('--emulate is not supported with --relocate or an image of several segments.')
+        try:
+            ram = None
+            if args.emulate_ram is not None:
+                ram = [(start, start + count - 1 if end is None else end)
+                       for start, end, count in args.emulate_ram]
+            io = None
+            if args.io_script is not None:
+                io = dismantler.emulate.read_io_script(args.io_script, args.io_script.name)
+            emu = dismantler.emulate.emulator(rom, ram=ram, io=io)
+        except ValueError as e:
+            arg_error(str(e))
+        reason = emu.run(entry=entries[0] if entries else rom.base_address,
+                         budget=args.emulate, interrupt=args.emulate_interrupt)
+        dismantler.emulate.apply(rom, emu, create_labels=args.auto_label, breakpoints=breakpoints)
+        if rom.base_address <= emu.pc <= rom.max_address:
+            rom.comments[emu.pc - rom.base_address] += 'Emulation stopped by {:s} after {:d} instructions. '.format(
+                dismantler.emulate.stop_names[reason], emu.n_executed)
+
+    # Find vector tables among unreachable locations
+    if args.find_vectors is not None:
+        if image is not rom:
+            arg_error('--find_vectors is not supported with --relocate or an image of several segments.')
+        if args.find_vectors == 'propose':
+            for address, count in dismantler.datascan.find_vector_tables(rom):
+                sys.stdout.write('-v {:s}:{:d}\n'.format(hex(address), count))
+            exit(0)
+        dismantler.datascan.apply_vector_tables(rom, create_labels=args.auto_label,
+                                                breakpoints=breakpoints)
+
+    # Classify strings and tables left among unreachable and data locations
+    if args.find_data:
+        find_data(image_roms())
+
+    # Train a code model on this disassembly if requested
+    if args.train_model is not None:
+        model = dismantler.codemodel.code_model(args.cpu)
+        try:
+            if os.path.exists(args.train_model):
+                with open(args.train_model, 'r') as f:
+                    model = dismantler.codemodel.load(f)
+            if model.cpu != args.cpu:
+                arg_error('Code model in {:s} is for CPU {:s}.'.format(args.train_model, str(model.cpu)))
+            for each in image_roms():
+                model.train(each)
+        except ValueError as e:
+            arg_error(str(e))
+        with open(args.train_model, 'w') as f:
+            model.save(f)
+
+    # Score unreachable locations as code or data
+    if args.code_likelihood is not None:
+        try:
+            if args.code_model is not None:
+                model = dismantler.codemodel.load(args.code_model)
+                if model.cpu != args.cpu:
+                    arg_error('Code model in {:s} is for CPU {:s}.'.format(args.code_model.name,
+                                                                          str(model.cpu)))
+            else:
+                model = dismantler.codemodel.for_cpu(dismantler.cpus[args.cpu])
+            if model is None:
+                model = dismantler.codemodel.code_model(args.cpu)
+                for each in image_roms():
+                    model.train(each)
+            scored = [(each, dismantler.codemodel.score(each, model)) for each in image_roms()]
+        except ValueError as e:
+            arg_error(str(e))
+        if args.code_likelihood == 'suggest':
+            for each, spans in scored:
+                for address in dismantler.codemodel.suggest_entries(spans):
+                    sys.stdout.write('-e {:s}\n'.format(hex(address)))
+            exit(0)
+        for each, spans in scored:
+            dismantler.codemodel.annotate(each, spans)
+
+    # Export control flow graph and call graph, and count cycles, if requested
+    if (args.cfg_file is not None) or (args.callgraph_file is not None) \
+       or (args.call_report is not None) or args.cycles or (args.loop_report is not None):
+        graph = dismantler.flowgraph.flowgraph(rom)
+        if args.cfg_file is not None:
+            if args.cfg_file.name.endswith('.dot'):
+                args.cfg_file.write(graph.to_dot())
+            else:
+                args.cfg_file.write(graph.to_json())
+            args.cfg_file.close()
+        if (args.callgraph_file is not None) or (args.call_report is not None):
+            calls = dismantler.callgraph.callgraph(graph)
+            if args.callgraph_file is not None:
+                if args.callgraph_file.name.endswith('.dot'):
+                    args.callgraph_file.write(calls.to_dot())
+                else:
+                    args.callgraph_file.write(calls.to_json())
+                args.callgraph_file.close()
+            if args.call_report is not None:
+                sys.stdout.write(calls.report(args.call_report))
+                exit(0)
+        if args.cycles or (args.loop_report is not None):
+            try:
+                counts = dismantler.cycles.cycle_counts(graph)
+            except ValueError as e:
+                arg_error(str(e))
+            if args.loop_report is not None:
+                sys.stdout.write(counts.report(args.loop_report))
+                exit(0)
+            counts.annotate()
+
+    # Explain classifications without generating the listing if requested
+    if args.explain is not None:
+        for address in args.explain:
+            sys.stdout.write('; Provenance of {:s}:\n'.format(rom.format_address(address)))
+            for step, type_name, kind, parent in rom.explain(address):
+                sys.stdout.write(';   {:s}  {:12s} {:10s} {:s}\n'.format(
+                    rom.format_address(step), type_name, kind,
+                    rom.label_map.get(step, '')))
+            sys.stdout.write('\n')
+        exit(0)
 
-    if args.data16 is not None:
-        for address in args.data16:
-            rom.set_data16(address)
+    # Report diagnostics without generating the listing if requested
+    if args.warnings_only:
+        sys.stdout.write(image.diagnostic_report())
+        exit(0)
 
-    # Disassemble the ROM image
-    rom.disassemble(entries=entries,
-                    create_labels=args.auto_label,
-                    breakpoints=breakpoints,
-                    vectors=vectors)
+    if args.max_warnings is not None:
+        n_warnings = len(image.filter_diagnostics(min_severity=dismantler.rom_base.severity_warning))
+        if n_warnings > args.max_warnings:
+            sys.stderr.write(image.diagnostic_report(max_lines=args.max_warnings,
+                                                     min_severity=dismantler.rom_base.severity_warning))
+            sys.stderr.write('ERROR: {:d} warnings exceed limit of {:d}.\n'.format(n_warnings,
+                                                                                 args.max_warnings))
+            exit(1)
 
     # Generate and output the listing
-    sys.stdout.write(rom.listing(source=args.source))
+    sys.stdout.write(image.listing(source=args.source))
 
     # Done!
     exit(0)
@@ -19,27 +19,17 @@
 #  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
 ##########################################################################
 
-"""Python binding for the hidapi library."""
+"""Extensible disassembler with semiautomatic code/data identification."""
 
-__all__       = ['rom_base', 'util', 'rom_1802', 'rom_8080', 'rom_8085', 'rom_z80']
+__all__       = ['rom_base', 'util', 'registry', 'annotations', 'flowgraph', 'callgraph', 'noreturn', 'banked', 'relocated', 'segments', 'loaders', 'batch', 'detect', 'datascan', 'entropy', 'codemodel', 'emulate', 'cycles', 'rom_1802', 'rom_8080', 'rom_8085', 'rom_z80']
 __version__   = '0.3.0'
 __copyright__ = 'Copyright (C) 2015, 2017 Mark J. Blair, released under GPLv3'
 __pkg_url__   = 'http://www.nf6x.net/tags/dismantler/'
 __dl_url__    = 'https://github.com/NF6X/dismantler'
 
-from dismantler import *
-import sys
+import importlib
 
-# This program uses deep recursion. Whether that is good or
-# bad is open for debate, but as currently implemented, the
-# default recursion limit may be too small.
-#
-# Increase the recursion limit for now, and consider changing
-# implementation to avoid recursion later.
-#
-_recursionlimit = 65536
-if sys.getrecursionlimit() < _recursionlimit:
-    sys.setrecursionlimit(_recursionlimit)
+from . import registry
 
 # You can use the following dictionary to create a new object
 # derived from rom_base, given a CPU type string, like this example:
@@ -47,26 +37,27 @@ if sys.getrecursionlimit() < _recursionlimit:
 #   rom = dismantler.cpus['8085'](rom=mybuffer, base_address=0x0000,
 #                                 label_map={0x0000:'RESET'},
 #                                 port_map={0xF0:'UART0', 0xF8:'UART1'})
-cpus = {'1802': rom_1802.rom_1802,
-        '8080': rom_8080.rom_8080,
-        '8085': rom_8085.rom_8085,
-        'z80':  rom_z80.rom_z80}
+#
+# The CPU module is only imported when its key is first looked up.
+# Third-party CPU modules registered in the 'dismantler.cpus' entry point
+# group appear here too; see dismantler.registry.
+cpus = registry.lazy_map(registry.cpu_class)
 
 # Similarly, these maps provide the default label maps and entry points
 # for each CPU type:
-default_labels = {'1802': rom_1802.default_labels,
-                  '8080': rom_8080.default_labels,
-                  '8085': rom_8085.default_labels,
-                  'z80':  rom_z80.default_labels}
+default_labels = registry.lazy_map(
+    lambda key: getattr(registry.cpu_module(key), 'default_labels', {}))
+
+default_entries = registry.lazy_map(
+    lambda key: getattr(registry.cpu_module(key), 'default_entries', []))
+
+default_ports = registry.lazy_map(
+    lambda key: getattr(registry.cpu_module(key), 'default_ports', {}))
 
-default_entries = {'1802': rom_1802.default_entries,
-                   '8080': rom_8080.default_entries,
-                   '8085': rom_8085.default_entries,
-                   'z80':  rom_z80.default_entries}
 
-default_ports = {'1802': rom_1802.default_ports,
-                 '8080': rom_8080.default_ports,
-                 '8085': rom_8085.default_ports,
-                 'z80':  rom_z80.default_ports}
+def __getattr__(name):
+    """Import submodules such as dismantler.rom_8080 on first attribute access."""
 
-    
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module {:s} has no attribute {:s}'.format(__name__, name))
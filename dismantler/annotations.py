@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Import labels, ports, comments and classifications from files.
+
+Two kinds of file are understood. Symbol files, as written by common
+assemblers and linkers, contain one symbol per line in any of these forms:
+
+    NAME EQU 1234h        NAME: EQU 0x1234      NAME = $1234
+    1234 NAME             00:1234 NAME          NAME 1234
+
+Bare numbers in EQU/= lines follow assembler conventions (decimal unless
+marked as hex); bare numbers in the column forms are hexadecimal.
+
+Annotation files are a simple sidecar format, one directive per line:
+
+    label       ADDRESS NAME
+    port        PORT NAME
+    comment     ADDRESS TEXT...
+    entry       ADDRESS
+    breakpoint  ADDRESS
+    data8       SPAN
+    data16      SPAN
+    vector      SPAN
+    string      SPAN
+    string_bit7 SPAN
+    inline      ADDRESS RULE
+    no_return   ADDRESS
+
+SPAN is ADDRESS, START..END or START:COUNT as on the dismantle.py command
+line. RULE describes the inline arguments following calls to the
+subroutine at ADDRESS: bytes:N, string (NUL-terminated), string:TERMINATOR,
+string_bit7 or vectors:N. Numbers may be written as 0x1234, $1234, 1234h or decimal.
+Everything following '#' or ';' is ignored, except in comment text.
+
+Each file is parsed in a single streaming pass. Duplicate definitions are
+silently merged; conflicting ones keep the first definition and are
+reported in the warnings list. Symbol file lines which cannot be read,
+such as EQU with an expression, are skipped and reported there too.
+"""
+
+import re
+
+from . import rom_base
+from . import util
+
+# Symbol file line forms
+_equ_re  = re.compile(r'^\s*([A-Za-z_.?@$][\w.?@$]*):?\s+(?:\.?EQU|\.?SET|=)\s+(\S+)', re.IGNORECASE)
+_asg_re  = re.compile(r'^\s*([A-Za-z_.?@$][\w.?@$]*)\s*=\s*(\S+)')
+_bank_re = re.compile(r'^\s*[0-9A-Fa-f]+:([0-9A-Fa-f]+)\s+(\S+)')
+_pair_re = re.compile(r'^\s*(\S+)\s+(\S+)\s*$')
+_hex_re  = re.compile(r'^[0-9A-Fa-f]+$')
+_name_re = re.compile(r'^[A-Za-z_.?@$][\w.?@$]*:?$')
+
+# Annotation directives which classify a span of locations
+_span_directives = ('data8', 'data16', 'string', 'string_bit7')
+
+
+def parse_number(text, implied_hex=False):
+    """Parse number in C, Motorola, Intel or plain notation.
+
+    Keyword arguments:
+    text        -- String such as '0x1234', '$1234', '1234h' or '4660'.
+    implied_hex -- If True, bare digits are hexadecimal rather than decimal.
+
+    Returns:
+    Integer value. Raises ValueError if text is not a number."""
+
+    if text[:1] == '$':
+        return int(text[1:], 16)
+    if text[-1:] in ('h', 'H') and _hex_re.match(text[:-1]):
+        return int(text[:-1], 16)
+    if text[:2] in ('0x', '0X'):
+        return int(text, 16)
+    if implied_hex:
+        return int(text, 16)
+    return int(text, 10)
+
+
+def _is_number(text):
+    """Return True if text parses as a number with implied hexadecimal."""
+
+    try:
+        parse_number(text, True)
+    except ValueError:
+        return False
+    return True
+
+
+def _symbol_pair(first, second):
+    """Return (address, name) from the two fields of an ADDRESS NAME or NAME ADDRESS line.
+
+    A name cannot start with a digit, so a field such as ADD or BEEF is
+    only read as an address if the other field is a name and this one
+    is not. If both orders fit, ADDRESS NAME is preferred.
+    """
+
+    address_first = _is_number(first) and (_name_re.match(second) is not None)
+    name_first    = _is_number(second) and (_name_re.match(first) is not None)
+    if address_first:
+        return (parse_number(first, True), second)
+    if name_first:
+        return (parse_number(second, True), first)
+    raise ValueError('no address and name fields')
+
+
+def _parse_span(text):
+    """Parse SPAN argument using parse_number() for each number."""
+
+    if '..' in text:
+        start, end = text.split('..', 1)
+        start, end = parse_number(start), parse_number(end)
+        if end < start:
+            raise ValueError('range end precedes start: {:s}'.format(text))
+        return (start, end, None)
+    if ':' in text:
+        start, count = text.split(':', 1)
+        return (parse_number(start), None, parse_number(count))
+    return (parse_number(text), None, 1)
+
+
+def parse_inline_rule(text):
+    """Parse inline argument rule such as 'bytes:2', 'string' or 'vectors:4'.
+
+    Returns:
+    Tuple of (inline kind, value) for rom_base.set_inline_args()."""
+
+    fields = text.split(':', 1)
+    if fields[0] not in rom_base.inline_names:
+        raise ValueError('unknown inline argument rule {:s}'.format(text))
+    kind = rom_base.inline_names.index(fields[0])
+    if len(fields) > 1:
+        value = parse_number(fields[1])
+    elif kind is rom_base.inline_string:
+        value = 0x00
+    elif kind is rom_base.inline_string_bit7:
+        value = None
+    else:
+        raise ValueError('inline argument rule {:s} needs a count'.format(text))
+    return (kind, value)
+
+
+def _strip_comment(line):
+    """Remove trailing '#' or ';' comment from line."""
+
+    for mark in ('#', ';'):
+        pos = line.find(mark)
+        if pos >= 0:
+            line = line[:pos]
+    return line
+
+
+class annotations(object):
+    """Labels, ports, comments, entries and classifications read from files."""
+
+    def __init__(self):
+        """Annotations constructor. All collections start out empty."""
+
+        self.labels          = {}  # Address -> label name
+        self.ports           = {}  # Port number -> port name
+        self.comments        = {}  # Address -> list of comment strings
+        self.entries         = []  # Entry point addresses
+        self.breakpoints     = []  # Breakpoint addresses
+        self.classifications = []  # (directive, span) tuples, in file order
+        self.vector_tables   = []  # (address, count) tuples for disassemble()
+        self.inline_args     = {}  # Subroutine address -> (inline kind, value)
+        self.no_return       = []  # Addresses of subroutines which never return
+        self.warnings        = []  # Duplicate/conflict messages
+        self._label_names    = {}  # Label name -> address
+        self._port_names     = {}  # Port name -> port number
+
+    def _define(self, table, names, kind, key, name, where):
+        """Add name for key to table, detecting duplicates and conflicts."""
+
+        if key in table:
+            if table[key] != name:
+                self.warnings.append('{:s}: {:s} {:s} already named {:s}, ignoring {:s}'.format(
+                    where, kind, util.hex16_intel(key), table[key], name))
+            return
+        if (name in names) and (names[name] != key):
+            self.warnings.append('{:s}: {:s} name {:s} already defined as {:s}, ignoring {:s}'.format(
+                where, kind, name, util.hex16_intel(names[name]), util.hex16_intel(key)))
+            return
+        table[key]  = name
+        names[name] = key
+
+    def add_label(self, address, name, where='?'):
+        """Define memory address label.
+
+        Keyword arguments:
+        address -- Memory address.
+        name    -- Label name.
+        where   -- Source location used in warning messages.
+        """
+
+        self._define(self.labels, self._label_names, 'address', address, name, where)
+
+    def add_port(self, port, name, where='?'):
+        """Define IO port label.
+
+        Keyword arguments:
+        port    -- IO port number.
+        name    -- Port name.
+        where   -- Source location used in warning messages.
+        """
+
+        self._define(self.ports, self._port_names, 'port', port, name, where)
+
+    def add_comment(self, address, text):
+        """Attach comment text to an address."""
+
+        if address in self.comments:
+            self.comments[address].append(text)
+        else:
+            self.comments[address] = [text]
+
+    def read_symbols(self, f, filename='<symbols>'):
+        """Read assembler symbol file, adding each symbol as a memory label.
+
+        Keyword arguments:
+        f        -- Open text file or other iterable of lines.
+        filename -- Name used in warning and error messages.
+        """
+
+        for lineno, line in enumerate(f, 1):
+            line = _strip_comment(line)
+            if not line.strip():
+                continue
+            where = '{:s}:{:d}'.format(filename, lineno)
+            m = _equ_re.match(line) or _asg_re.match(line)
+            try:
+                if m:
+                    name, address = m.group(1), parse_number(m.group(2))
+                else:
+                    m = _bank_re.match(line)
+                    if m:
+                        address, name = int(m.group(1), 16), m.group(2)
+                    else:
+                        m = _pair_re.match(line)
+                        if m is None:
+                            raise ValueError('unrecognized symbol line')
+                        address, name = _symbol_pair(m.group(1), m.group(2))
+            except ValueError as e:
+                # Skip lines such as EQU with an expression, keeping the rest of the file
+                self.warnings.append('{:s}: {:s}, ignoring: {:s}'.format(where, str(e), line.strip()))
+                continue
+            self.add_label(address, name.rstrip(':'), where)
+
+    def read_annotations(self, f, filename='<annotations>'):
+        """Read sidecar annotation file.
+
+        Keyword arguments:
+        f        -- Open text file or other iterable of lines.
+        filename -- Name used in warning and error messages.
+        """
+
+        for lineno, line in enumerate(f, 1):
+            fields = line.split(None, 2)
+            if (not fields) or (fields[0][0] in '#;'):
+                continue
+            where     = '{:s}:{:d}'.format(filename, lineno)
+            directive = fields[0].lower()
+            try:
+                if directive == 'comment':
+                    if len(fields) < 3:
+                        raise ValueError('comment needs ADDRESS TEXT')
+                    self.add_comment(parse_number(fields[1]), fields[2].strip())
+                    continue
+                fields = _strip_comment(line).split()
+                if directive in ('label', 'port'):
+                    if len(fields) != 3:
+                        raise ValueError('{:s} needs ADDRESS NAME'.format(directive))
+                    if directive == 'label':
+                        self.add_label(parse_number(fields[1]), fields[2], where)
+                    else:
+                        self.add_port(parse_number(fields[1]), fields[2], where)
+                elif directive in ('entry', 'breakpoint'):
+                    if len(fields) != 2:
+                        raise ValueError('{:s} needs ADDRESS'.format(directive))
+                    if directive == 'entry':
+                        self.entries.append(parse_number(fields[1]))
+                    else:
+                        self.breakpoints.append(parse_number(fields[1]))
+                elif directive == 'inline':
+                    if len(fields) != 3:
+                        raise ValueError('inline needs ADDRESS RULE')
+                    self.inline_args[parse_number(fields[1])] = parse_inline_rule(fields[2])
+                elif directive == 'no_return':
+                    if len(fields) != 2:
+                        raise ValueError('no_return needs ADDRESS')
+                    self.no_return.append(parse_number(fields[1]))
+                elif directive == 'vector':
+                    if len(fields) != 2:
+                        raise ValueError('vector needs SPAN')
+                    self.vector_tables.append(util.span_words(_parse_span(fields[1])))
+                elif directive in _span_directives:
+                    if len(fields) != 2:
+                        raise ValueError('{:s} needs SPAN'.format(directive))
+                    self.classifications.append((directive, _parse_span(fields[1])))
+                else:
+                    raise ValueError('unknown directive {:s}'.format(fields[0]))
+            except ValueError as e:
+                raise ValueError('{:s}: {:s}'.format(where, str(e)))
+
+    def apply(self, rom):
+        """Apply classifications and comments to a ROM object.
+
+        Inline argument rules and non-returning subroutines are applied
+        too. Labels, ports, entries, breakpoints and vector tables are not
+        applied here, since they are normally merged with other sources and
+        passed to the ROM constructor and disassemble().
+
+        Keyword arguments:
+        rom -- Object derived from rom_base.
+        """
+
+        for directive, span in self.classifications:
+            start, end, count = span
+            if directive == 'data8':
+                if end is None:
+                    end = start + count - 1
+                rom.set_data8_range(start, end)
+            elif directive == 'data16':
+                rom.set_data16_array(*util.span_words(span))
+            else:
+                if end is not None:
+                    count = None
+                if directive == 'string':
+                    rom.set_strings(start, count, 0x00, end)
+                else:
+                    rom.set_strings(start, count, None, end)
+
+        for routine in self.inline_args:
+            rom.set_inline_args(routine, *self.inline_args[routine])
+        rom.no_return.update(self.no_return)
+
+        for address in self.comments:
+            idx = address - rom.base_address
+            if (idx >= 0) and (idx < rom.rom_len):
+                for text in self.comments[address]:
+                    rom.comments[idx] += text + ' '
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Bank-switched memory model.
+
+Many boards map one of several ROM banks into the same window of the
+CPU address space, often alongside a common region which is always
+visible. A banked_image splits one image file into an optional common
+region followed by window-sized banks, and disassembles them all in a
+single analysis.
+
+Each region is disassembled by its own CPU object, created when the
+region is first reached, so classification state is kept per bank and
+only for banks which are actually entered. Control flow from a bank into
+the common region continues there, and flow within the window stays in
+the same bank. Control only passes into another bank through declared
+bank-switch stubs, each naming the bank and address at which execution
+continues. Flow from the common region into the window cannot be
+attributed to a bank without a stub, and is recorded as unresolved.
+
+Automatically created labels within a bank are qualified with the bank
+name, e.g. C_B03_4000, so that listings of different banks can be
+assembled and cross-referenced without name clashes.
+
+Example:
+    image = dismantler.banked.banked_image(dismantler.cpus['z80'], data,
+                                           window=(0x4000, 0x4000),
+                                           common=(0x0000, 0x4000))
+    image.add_stub(0x0100, 3, 0x4000)
+    image.disassemble(entries=[0x0000])
+    for name, text in image.listings():
+        ...
+"""
+
+from . import rom_base
+from . import util
+
+
+class banked_image(object):
+    """Image made of a common region and banks sharing one address window."""
+
+    def __init__(self, cpu_class, image, window, common=None,
+                 label_map={}, port_map={}, bank_names=None):
+        """Banked image constructor.
+
+        Keyword arguments:
+        cpu_class  -- Class derived from rom_base used for every region.
+        image      -- Binary image: the common region, if any, followed by the banks.
+        window     -- Tuple of (address, size) of the bank-switched window.
+        common     -- If specified, tuple of (address, size) of the common region,
+                      taken from the start of the image.
+        label_map  -- Dictionary of address->label mappings, copied into every region.
+        port_map   -- Dictionary of IO port->name mappings, shared by every region.
+        bank_names -- If specified, list of bank names. Default is B00, B01, ...
+        """
+
+        self.cpu_class    = cpu_class
+        self.image        = memoryview(image)
+        self.label_map    = label_map
+        self.port_map     = port_map
+        self.window_start, self.window_size = window
+        if common is not None:
+            self.common_start, self.common_size = common
+        else:
+            self.common_start, self.common_size = (0, 0)
+
+        offset  = self.common_size
+        n_banks = max(0, (len(image) - offset + self.window_size - 1) // self.window_size)
+        self.bank_offsets = [offset + n*self.window_size for n in range(n_banks)]
+        if bank_names is None:
+            bank_names = ['B{:02X}'.format(n) for n in range(n_banks)]
+        elif len(bank_names) != n_banks:
+            raise ValueError('Expected {:d} bank names.'.format(n_banks))
+        self.bank_names   = bank_names
+
+        self.regions      = {}  # Region key -> rom object; key None is the common region
+        self.stubs        = {}  # Stub address -> (bank number, target address)
+        self.unresolved   = []  # (source address, dest address) from common region into window
+        self.region_hooks = []  # Functions called with each newly created region
+        self._scanned     = {}  # Region key -> number of successors already routed
+
+    def bank_number(self, bank):
+        """Return bank number for a bank name or number.
+
+        Keyword arguments:
+        bank -- Bank name, or bank number as an integer or numeric string.
+        """
+
+        if bank in self.bank_names:
+            return self.bank_names.index(bank)
+        number = int(bank, 0) if isinstance(bank, str) else bank
+        if (number < 0) or (number >= len(self.bank_offsets)):
+            raise ValueError('No such bank: {:}'.format(bank))
+        return number
+
+    def add_stub(self, address, bank, target):
+        """Declare a bank-switch stub.
+
+        Any jump or call to the stub continues execution at target in bank.
+
+        Keyword arguments:
+        address -- Address of the stub.
+        bank    -- Bank name or number selected by the stub.
+        target  -- Address at which execution continues.
+        """
+
+        self.stubs[address] = (self.bank_number(bank), target)
+
+    def in_common(self, address):
+        """Return True if address is within the common region."""
+
+        return (address >= self.common_start) and (address < self.common_start + self.common_size)
+
+    def in_window(self, address):
+        """Return True if address is within the bank-switched window."""
+
+        return (address >= self.window_start) and (address < self.window_start + self.window_size)
+
+    def region_name(self, key):
+        """Return display name of a region."""
+
+        if key is None:
+            return 'COMMON'
+        return self.bank_names[key]
+
+    def region_keys(self):
+        """Return list of all region keys, common region first."""
+
+        keys = list(range(len(self.bank_offsets)))
+        if self.common_size > 0:
+            keys.insert(0, None)
+        return keys
+
+    def _new_region(self, key):
+        """Return new rom object for a region."""
+
+        if key is None:
+            data, base = self.image[:self.common_size], self.common_start
+        else:
+            offset = self.bank_offsets[key]
+            data, base = self.image[offset:offset + self.window_size], self.window_start
+        rom = self.cpu_class(rom=data, base_address=base,
+                             label_map=dict(self.label_map), port_map=self.port_map)
+        if key is not None:
+            rom.label_qualifier = self.bank_names[key]
+        return rom
+
+    def region(self, key):
+        """Return rom object for a region, creating it on first use.
+
+        Keyword arguments:
+        key -- None for the common region, or a bank number.
+        """
+
+        if key not in self.regions:
+            rom = self._new_region(key)
+            self.regions[key] = rom
+            for hook in self.region_hooks:
+                hook(rom)
+        return self.regions[key]
+
+    def _share_labels(self, key):
+        """Give a region the labels other regions created for common region addresses.
+
+        Labels of the common region are shared by every region, so that a
+        place reached from a bank has the same name in every listing.
+        """
+
+        rom = self.regions[key]
+        for other_key in self.region_keys():
+            other = self.regions.get(other_key)
+            if (other_key == key) or (other is None):
+                continue
+            for address, label in list(other.label_map.items()):
+                if self.in_common(address) and (address not in rom.label_map):
+                    rom.label_map[address] = label
+
+    def _region_of(self, address, bank):
+        """Return key of region reached at address from a bank, or False if none."""
+
+        if self.in_common(address):
+            return None
+        if self.in_window(address) and (bank is not None):
+            return bank
+        return False
+
+    def disassemble(self, entries=[0], bank=0, bank_entries=[], create_labels=True,
+                    breakpoints=[], vectors=[], vector_tables=[]):
+        """Disassemble all regions reachable from the entry points.
+
+        Keyword arguments:
+        entries       -- List of entry point addresses, in the common region or
+                         in the window of the initial bank.
+        bank          -- Bank name or number initially mapped into the window.
+        bank_entries  -- List of (bank, address) tuples of additional entry points.
+        create_labels -- Create labels for referenced memory locations.
+        breakpoints   -- List of addresses at which disassembly stops, in every region.
+        vectors       -- List of vector addresses, as for rom_base.disassemble().
+        vector_tables -- List of (address, count) vector tables, as for
+                         rom_base.disassemble().
+        """
+
+        bank    = self.bank_number(bank) if len(self.bank_offsets) > 0 else None
+        pending = {}   # Region key -> list of (address, create label) to visit
+        extra   = {}   # Region key -> vectors and vector tables for its first pass
+
+        def queue(key, address, label):
+            if key is not False:
+                pending.setdefault(key, []).append((address, label))
+
+        for address in entries:
+            queue(self._region_of(address, bank), address, False)
+        for entry_bank, address in bank_entries:
+            queue(self._region_of(address, self.bank_number(entry_bank)), address, False)
+        for address in vectors:
+            key = self._region_of(address, bank)
+            if key is not False:
+                extra.setdefault(key, {'vectors': [], 'vector_tables': []})['vectors'].append(address)
+                pending.setdefault(key, [])
+        for address, count in vector_tables:
+            key = self._region_of(address, bank)
+            if key is not False:
+                extra.setdefault(key, {'vectors': [], 'vector_tables': []})['vector_tables'].append(
+                    (address, count))
+                pending.setdefault(key, [])
+
+        # Visit regions in a fixed order, batching all entries queued for each
+        while pending:
+            key = min(pending, key=lambda k: -1 if k is None else k)
+            rom = self.region(key)
+            batch = pending.pop(key)
+            self._share_labels(key)
+            if create_labels:
+                for address, label in batch:
+                    if label:
+                        rom.lookup_address(address, True)
+            kwargs = extra.pop(key, {})
+            rom.disassemble(entries=[address for address, label in batch],
+                            create_labels=create_labels, breakpoints=breakpoints, **kwargs)
+
+            # Route control flow which leaves the region
+            items = list(rom.successors.items())
+            for source, dests in items[self._scanned.get(key, 0):]:
+                for dest in dests:
+                    if dest in self.stubs:
+                        stub_bank, target = self.stubs[dest]
+                        queue(self._region_of(target, stub_bank), target, True)
+                    if (dest >= rom.base_address) and (dest <= rom.max_address):
+                        continue
+                    dest_key = self._region_of(dest, key)
+                    if dest_key is not False:
+                        queue(dest_key, dest, True)
+                    elif (key is None) and self.in_window(dest) and (dest not in self.stubs):
+                        self.unresolved.append((source, dest))
+            self._scanned[key] = len(items)
+
+        # Name common region locations as the banks referring to them do
+        if None in self.regions:
+            self._share_labels(None)
+
+    def filter_diagnostics(self, **kwargs):
+        """Return list of (region name, diagnostic) tuples from all regions.
+
+        Keyword arguments are passed to rom_base.filter_diagnostics().
+        """
+
+        diags = []
+        for key in self.region_keys():
+            if key in self.regions:
+                name = self.region_name(key)
+                diags.extend([(name, diag) for diag in self.regions[key].filter_diagnostics(**kwargs)])
+        return diags
+
+    def diagnostic_report(self, max_lines=None, min_severity=rom_base.severity_info):
+        """Return diagnostic reports of all disassembled regions, and unresolved flow.
+
+        Keyword arguments are as for rom_base.diagnostic_report().
+        """
+
+        report = ''
+        for key in self.region_keys():
+            if key in self.regions:
+                report = report + '; Region {:s}:\n'.format(self.region_name(key))
+                report = report + self.regions[key].diagnostic_report(max_lines, min_severity)
+        if self.unresolved:
+            report = report + '; Unresolved flow from common region into window:\n'
+            for source, dest in self.unresolved[:max_lines]:
+                report = report + ';   {:s} -> {:s}\n'.format(util.hex16_intel(source),
+                                                          util.hex16_intel(dest))
+        return report
+
+    def listings(self, source=False):
+        """Iterate over listings of every region as (region name, listing) tuples.
+
+        Banks which were never entered are listed as unreachable.
+
+        Keyword arguments:
+        source -- If True, output assembler source format.
+        """
+
+        for key in self.region_keys():
+            rom = self.regions.get(key)
+            if rom is None:
+                rom = self._new_region(key)
+                for hook in self.region_hooks:
+                    hook(rom)
+            if key is None:
+                offset = 0
+            else:
+                offset = self.bank_offsets[key]
+            header = '; {:s}: image offset 0x{:05X}, {:d} bytes at {:s}\n\n'.format(
+                self.region_name(key), offset, rom.rom_len, util.hex16_intel(rom.base_address))
+            yield (self.region_name(key), header + rom.listing(source=source))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Batch disassembly of many images in parallel worker processes.
+
+Each job names an image file, or a member of a zip archive, rather than
+carrying its contents, so that workers read their own input. Each
+worker opens an archive once, on its first job from that archive, and
+reads members straight into memory.
+
+Example:
+    jobs = [dismantler.batch.job('boards.zip', member)
+            for member in dismantler.loaders.archive_members('boards.zip', '*.bin')]
+    options = dismantler.batch.options('8085', auto_label=True)
+    for job, listing, error in dismantler.batch.run(jobs, options, processes=4):
+        ...
+"""
+
+import multiprocessing
+import os
+import zipfile
+
+from . import loaders
+from . import registry
+
+
+class options(object):
+    """Disassembly options shared by every job of a batch."""
+
+    def __init__(self, cpu, entries=None, labels=None, ports=None, auto_label=False,
+                 breakpoints=[], source=False, fmt=None, address_width=16,
+                 listing_processes=1, traversal_processes=1):
+        """Batch options constructor.
+
+        Keyword arguments:
+        cpu                 -- CPU type key.
+        entries             -- List of entry points. Default varies by CPU type.
+        labels              -- Dictionary of address->label mappings. If None, CPU
+                               default labels are used when auto_label is set.
+        ports               -- Dictionary of IO port->name mappings, defaulting as for labels.
+        auto_label          -- Create labels for referenced memory locations.
+        breakpoints         -- List of addresses at which disassembly stops.
+        source              -- If True, output assembler source format.
+        fmt                 -- Image format, or None to choose by file name extension.
+        address_width       -- Number of bits in a memory address.
+        listing_processes   -- Worker processes rendering each listing, or None for
+                               one per CPU. Applies only to jobs run in this process,
+                               as worker processes cannot start their own.
+        traversal_processes -- Worker processes disassembling each image, or None
+                               for one per CPU, applying as for listing_processes.
+        """
+
+        self.cpu                 = cpu
+        self.entries             = entries
+        self.labels              = labels
+        self.ports               = ports
+        self.auto_label          = auto_label
+        self.breakpoints         = breakpoints
+        self.source              = source
+        self.fmt                 = fmt
+        self.address_width       = address_width
+        self.listing_processes   = listing_processes
+        self.traversal_processes = traversal_processes
+
+
+class job(object):
+    """One image to disassemble: a file, or a member of a zip archive."""
+
+    def __init__(self, path, member=None):
+        """Job constructor.
+
+        Keyword arguments:
+        path   -- Path of image file or zip archive.
+        member -- Name of archive member, or None for a plain file.
+        """
+
+        self.path   = path
+        self.member = member
+
+    def name(self):
+        """Return a name for the job's image, such as 'boards.zip:cpu/u12.bin'."""
+
+        if self.member is None:
+            return self.path
+        return '{:s}:{:s}'.format(self.path, self.member)
+
+    def file_name(self):
+        """Return a file name for the job's listing, such as 'boards.zip_cpu_u12.bin'."""
+
+        name = os.path.basename(self.path)
+        if self.member is not None:
+            name = '{:s}_{:s}'.format(name, self.member.replace('/', '_'))
+        return name
+
+
+# Zip archives opened by this process: path -> ZipFile
+_archives = {}
+
+
+def _load(job, fmt):
+    """Load a job's image, opening its archive on first use in this process."""
+
+    if job.member is None:
+        with open(job.path, 'rb') as f:
+            return loaders.load(f, job.path, fmt)
+    if job.path not in _archives:
+        _archives[job.path] = zipfile.ZipFile(job.path)
+    return loaders.load_member(_archives[job.path], job.member, fmt)
+
+
+def disassemble(job, opts):
+    """Disassemble one job's image and return its listing.
+
+    Keyword arguments:
+    job  -- job object.
+    opts -- options object.
+
+    Returns:
+    Listing string. Raises ValueError if the image cannot be loaded.
+    """
+
+    segments, start = _load(job, opts.fmt)
+    base, data = loaders.flatten(segments)
+    module = registry.cpu_module(opts.cpu)
+
+    labels = opts.labels
+    if labels is None:
+        labels = getattr(module, 'default_labels', {}) if opts.auto_label else {}
+    ports = opts.ports
+    if ports is None:
+        ports = getattr(module, 'default_ports', {}) if opts.auto_label else {}
+    entries = opts.entries
+    if entries is None:
+        entries = list(getattr(module, 'default_entries', []))
+        if (start is not None) and (start not in entries):
+            entries.append(start)
+
+    rom = registry.cpu_class(opts.cpu)(rom=data, base_address=base,
+                                       label_map=dict(labels), port_map=dict(ports))
+    rom.address_width = opts.address_width
+    rom.listing_processes   = opts.listing_processes
+    rom.traversal_processes = opts.traversal_processes
+    rom.disassemble(entries=entries, create_labels=opts.auto_label,
+                    breakpoints=opts.breakpoints)
+    return rom.listing(source=opts.source)
+
+
+def _work(task):
+    """Worker process entry point: return (job, listing, error message)."""
+
+    job, opts = task
+    try:
+        return (job, disassemble(job, opts), None)
+    except (ValueError, IndexError, NotImplementedError, KeyError, zipfile.BadZipFile) as e:
+        message = str(e)
+        if not message.startswith(job.name()):
+            message = '{:s}: {:s}'.format(job.name(), message)
+        return (job, None, message)
+
+
+def run(jobs, opts, processes=None):
+    """Disassemble jobs in parallel, yielding results in job order.
+
+    Keyword arguments:
+    jobs      -- List of job objects.
+    opts      -- options object.
+    processes -- Number of worker processes. Default is the number of CPUs;
+                 1 runs every job in this process.
+
+    Returns:
+    Iterator over (job, listing, error message) tuples. Exactly one of
+    listing and error message is None.
+    """
+
+    tasks = [(each, opts) for each in jobs]
+    if (processes == 1) or (len(tasks) <= 1):
+        for task in tasks:
+            yield _work(task)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(_work, tasks):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
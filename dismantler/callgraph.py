@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Subroutine discovery and call graph of a disassembled ROM image.
+
+Subroutines start at call targets, entry points and vector destinations.
+Each block of the control flow graph is owned by the first subroutine
+found to reach it through fall-through and jump edges, so the whole
+analysis is linear in the size of the graph. A block reached from a
+subroutine other than its owner is a shared tail; a jump to another
+subroutine's entry is a tail call and counts as a call.
+
+Example:
+    graph = dismantler.callgraph.callgraph(dismantler.flowgraph.flowgraph(rom))
+    sys.stdout.write(graph.report(20))
+"""
+
+import json
+
+from . import flowgraph
+
+
+class subroutine(object):
+    """Properties of one subroutine."""
+
+    def __init__(self, entry, kind):
+        """Subroutine constructor.
+
+        Keyword arguments:
+        entry -- Entry address.
+        kind  -- 'CALL', 'ENTRY' or 'VECTOR', describing why this is a subroutine.
+        """
+
+        self.entry        = entry
+        self.kind         = kind
+        self.blocks       = []     # Indices of blocks owned by this subroutine
+        self.size         = 0      # Bytes in owned blocks
+        self.instructions = 0      # Instructions in owned blocks
+        self.callers      = set()  # Entries of subroutines calling this one
+        self.callees      = set()  # Entries of subroutines called by this one
+        self.call_sites   = 0      # Number of call instructions targeting this one
+        self.shared_tails = set()  # Block indices reached but owned by another subroutine
+        self.returns      = False  # True if any owned block contains a return
+
+
+class callgraph(object):
+    """Subroutines of a ROM image and the calls between them."""
+
+    def __init__(self, graph):
+        """Infer subroutine boundaries and build the call graph.
+
+        Keyword arguments:
+        graph -- flowgraph object for the ROM.
+        """
+
+        self.graph = graph
+        rom = graph.rom
+
+        # Subroutine entries, in address order. Calls take precedence.
+        kinds = {}
+        for dest in rom.entry_addrs:
+            kinds[dest] = 'ENTRY'
+        for dest in rom.vector_dests:
+            kinds[dest] = 'VECTOR'
+        for dest in rom.call_sites.values():
+            kinds[dest] = 'CALL'
+        self.subroutines = {}
+        for entry in sorted(kinds):
+            if entry in graph.block_index:
+                self.subroutines[entry] = subroutine(entry, kinds[entry])
+
+        # Entry blocks belong to their own subroutine from the start, so that
+        # other subroutines stop there rather than absorbing them.
+        owner = [None] * len(graph)
+        for entry in self.subroutines:
+            owner[graph.block_index[entry]] = entry
+
+        # Blocks containing a return. A conditional return does not end its
+        # block, and a block without successors may end in a jump elsewhere.
+        return_blocks = set()
+        for site in rom.return_sites:
+            block = graph.block_at(site)
+            if block is not None:
+                return_blocks.add(block)
+
+        edge_first, edge_block, edge_kind = graph.edge_first, graph.edge_block, graph.edge_kind
+        for entry, sub in self.subroutines.items():
+            work = [graph.block_index[entry]]
+            while work:
+                block = work.pop()
+                sub.blocks.append(block)
+                if block in return_blocks:
+                    sub.returns = True
+                lo, hi = edge_first[block], edge_first[block + 1]
+                for j in range(lo, hi):
+                    dest_block = edge_block[j]
+                    if dest_block < 0:
+                        continue
+                    if edge_kind[j] is flowgraph.edge_call:
+                        continue
+                    dest_owner = owner[dest_block]
+                    if dest_owner is None:
+                        owner[dest_block] = entry
+                        work.append(dest_block)
+                    elif dest_owner != entry:
+                        if graph.block_start[dest_block] == dest_owner:
+                            # Tail call into another subroutine
+                            sub.callees.add(dest_owner)
+                        else:
+                            sub.shared_tails.add(dest_block)
+        self.owner = owner
+
+        # Sizes and calls, one pass over owned blocks
+        for entry, sub in self.subroutines.items():
+            sub.blocks.sort()
+            for block in sub.blocks:
+                sub.size         = sub.size + graph.block_size[block]
+                sub.instructions = sub.instructions + graph.block_insns[block]
+                for j in range(edge_first[block], edge_first[block + 1]):
+                    if (edge_kind[j] is flowgraph.edge_call) and (graph.edge_dest[j] in self.subroutines):
+                        sub.callees.add(graph.edge_dest[j])
+                        self.subroutines[graph.edge_dest[j]].call_sites += 1
+            for callee in sub.callees:
+                self.subroutines[callee].callers.add(entry)
+
+    def _name(self, address):
+        """Return label or hex string for address."""
+
+        return self.graph.rom.label_map.get(address, self.graph.rom.format_address(address))
+
+    def ranked(self):
+        """Return list of subroutines, most-called first."""
+
+        return sorted(self.subroutines.values(),
+                      key=lambda sub: (-sub.call_sites, -len(sub.callers), sub.entry))
+
+    def report(self, count=None):
+        """Return text report of the most-called subroutines.
+
+        Keyword arguments:
+        count -- If specified, maximum number of subroutines to report.
+        """
+
+        report = '; Most-called subroutines:\n;\n'
+        report = report + '; {:17s} {:>6s} {:>7s} {:>7s} {:>6s} {:>6s}\n'.format(
+            'Subroutine', 'Calls', 'Callers', 'Callees', 'Bytes', 'Insns')
+        for sub in self.ranked()[:count]:
+            report = report + '; {:17s} {:6d} {:7d} {:7d} {:6d} {:6d}\n'.format(
+                self._name(sub.entry), sub.call_sites, len(sub.callers),
+                len(sub.callees), sub.size, sub.instructions)
+        return report
+
+    def to_dot(self):
+        """Return call graph in Graphviz DOT format."""
+
+        lines = ['digraph callgraph {', '  node [shape=box, fontname="monospace"];']
+        for entry, sub in sorted(self.subroutines.items()):
+            lines.append('  "{:04X}" [label="{:s}\\n{:d} bytes, {:d} insns"];'.format(
+                entry, self._name(entry), sub.size, sub.instructions))
+        for entry, sub in sorted(self.subroutines.items()):
+            for callee in sorted(sub.callees):
+                lines.append('  "{:04X}" -> "{:04X}";'.format(entry, callee))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """Return call graph as a JSON string."""
+
+        subs = []
+        for entry, sub in sorted(self.subroutines.items()):
+            subs.append({'entry': entry, 'label': self.graph.rom.label_map.get(entry),
+                         'kind': sub.kind, 'size': sub.size,
+                         'instructions': sub.instructions, 'call_sites': sub.call_sites,
+                         'returns': sub.returns,
+                         'callers': sorted(sub.callers), 'callees': sorted(sub.callees),
+                         'blocks': [self.graph.block_start[block] for block in sub.blocks],
+                         'shared_tails': sorted(self.graph.block_start[block]
+                                                for block in sub.shared_tails)})
+        return json.dumps({'subroutines': subs}, indent=1) + '\n'
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Statistical code/data classifier for unknown locations of a ROM.
+
+A code model counts pairs of consecutive bytes, as a first-order Markov
+chain, separately within code (instructions and their operands) and
+within data of disassembled ROMs. Finished disassemblies, with their
+annotations applied, are the training corpus; a model may be saved to a
+compact file and loaded again for other images of the same CPU. A CPU
+module may ship a trained model as its code_model class attribute. If
+no model is available, one can be trained on the code and data already
+classified in the image being disassembled.
+
+Each pair of bytes is scored by the log odds of the second following the
+first in code rather than in data, looked up in one 64K-entry table.
+Scores along each run of unknown locations are summed over a sliding
+window with cumulative sums, and the run is split into code-like and
+data-like spans. Starts of likely code spans are suggested as entries.
+
+Example:
+    rom.disassemble(entries=[0])
+    model = dismantler.codemodel.code_model('8085')
+    model.train(rom)
+    spans = dismantler.codemodel.score(rom, model)
+    dismantler.codemodel.annotate(rom, spans)
+    entries = dismantler.codemodel.suggest_entries(spans)
+"""
+
+import array
+import base64
+import itertools
+import json
+import math
+import operator
+import re
+import sys
+import zlib
+
+from . import rom_base
+
+# Kinds of span
+kind_data, kind_code = list(range(2))
+
+kind_names = ['DATA', 'CODE']
+
+# Number of byte pairs each score is averaged over
+window = 16
+
+# Mean log odds per byte pair, in bits, above which a window is code-like.
+# Random bytes score a little above zero under a model trained without data.
+min_bits = 0.25
+
+# Minimum number of bytes in a run of unknown locations to score,
+# and in a code span to suggest as an entry
+min_length = 16
+
+# Minimum likelihood of a code span suggested as an entry
+min_likelihood = 0.8
+
+# Minimum number of code byte pairs needed to score with a model
+min_training = 256
+
+# Smoothing added to every pair count
+_prior = 1.0
+
+_code_types = (rom_base.type_instruction, rom_base.type_operand)
+
+
+def _pack(counts):
+    """Return counts array as compressed base64 text."""
+
+    counts = array.array('I', counts)
+    if sys.byteorder == 'big':
+        counts.byteswap()
+    return base64.b64encode(zlib.compress(counts.tobytes(), 9)).decode('ascii')
+
+
+def _unpack(text):
+    """Return counts array from text returned by _pack()."""
+
+    counts = array.array('I')
+    counts.frombytes(zlib.decompress(base64.b64decode(text)))
+    if sys.byteorder == 'big':
+        counts.byteswap()
+    if len(counts) != 0x10000:
+        raise ValueError('Code model table has {:d} entries instead of 65536.'.format(len(counts)))
+    return counts
+
+
+class code_model(object):
+    """Counts of consecutive byte pairs in code and in data for one CPU.
+
+    code[a << 8 | b] counts byte b following byte a within code,
+    and data[a << 8 | b] within data.
+    """
+
+    def __init__(self, cpu=None):
+        """Create an empty model.
+
+        Keyword arguments:
+        cpu -- Name of the CPU the model is trained for, or None.
+        """
+
+        self.cpu  = cpu
+        self.code = array.array('I', bytes(4*0x10000))
+        self.data = array.array('I', bytes(4*0x10000))
+        self._log_odds = None
+
+    def n_code(self):
+        """Return number of code byte pairs trained on."""
+
+        return sum(self.code)
+
+    def n_data(self):
+        """Return number of data byte pairs trained on."""
+
+        return sum(self.data)
+
+    def train(self, rom):
+        """Add the byte pairs of a disassembled ROM to the model.
+
+        Pairs of consecutive locations which are both code, or both data,
+        are counted. Unknown and error locations are not.
+
+        Keyword arguments:
+        rom -- Object derived from rom_base, after disassemble().
+        """
+
+        data  = bytes(rom.rom)
+        kinds = bytes(1 if t in _code_types else 2 if t in rom_base.data_types else 0
+                      for t in rom.data_type)
+        for counts, kind in ((self.code, b'\x01'), (self.data, b'\x02')):
+            for m in re.finditer(re.escape(kind) + b'{2,}', kinds):
+                chunk = data[m.start():m.end()]
+                for a, b in zip(chunk, chunk[1:]):
+                    counts[a << 8 | b] += 1
+        self._log_odds = None
+
+    def merge(self, other):
+        """Add the counts of another model to this one."""
+
+        if (self.cpu is not None) and (other.cpu is not None) and (self.cpu != other.cpu):
+            raise ValueError('Cannot merge a {:s} code model into a {:s} one.'.format(other.cpu, self.cpu))
+        for idx in range(0x10000):
+            self.code[idx] += other.code[idx]
+            self.data[idx] += other.data[idx]
+        self._log_odds = None
+
+    def log_odds(self):
+        """Return list of log odds, in bits, of each byte pair being code rather than data.
+
+        Each row of the code and data counts is smoothed and normalized to
+        the probability of the second byte given the first. Without data
+        counts, data is taken to be uniformly random bytes.
+        """
+
+        if self._log_odds is None:
+            table = []
+            for a in range(0x100):
+                row_code = self.code[a << 8:(a + 1) << 8]
+                row_data = self.data[a << 8:(a + 1) << 8]
+                norm = (math.log(sum(row_data) + 0x100*_prior, 2)
+                        - math.log(sum(row_code) + 0x100*_prior, 2))
+                table.extend(math.log((c + _prior)/(d + _prior), 2) + norm
+                             for c, d in zip(row_code, row_data))
+            self._log_odds = table
+        return self._log_odds
+
+    def dumps(self):
+        """Return model as compact JSON text."""
+
+        return json.dumps({'cpu': self.cpu, 'code': _pack(self.code), 'data': _pack(self.data)}) + '\n'
+
+    def save(self, f):
+        """Write model to an open text file."""
+
+        f.write(self.dumps())
+
+
+def loads(text):
+    """Return code_model from text returned by code_model.dumps()."""
+
+    try:
+        fields = json.loads(text)
+        model = code_model(fields.get('cpu'))
+        model.code = _unpack(fields['code'])
+        model.data = _unpack(fields['data'])
+    except (AttributeError, KeyError, TypeError, ValueError, zlib.error) as e:
+        raise ValueError('Bad code model: {:s}'.format(str(e)))
+    return model
+
+
+def load(f):
+    """Return code_model read from an open text file."""
+
+    try:
+        text = f.read()
+    except UnicodeDecodeError as e:
+        raise ValueError('Bad code model: {:s}'.format(str(e)))
+    return loads(text)
+
+
+def for_cpu(cpu_class):
+    """Return the code model shipped with a CPU module, or None."""
+
+    if cpu_class.code_model is None:
+        return None
+    return loads(cpu_class.code_model)
+
+
+def _unknown_runs(rom, length):
+    """Yield (start, end) index pairs of runs of at least length unknown locations."""
+
+    unknown = bytes(1 if t is rom_base.type_unknown else 0 for t in rom.data_type)
+    for m in re.finditer(b'\x01{%d,}' % length, unknown):
+        yield (m.start(), m.end())
+
+
+def score(rom, model, window=window, min_length=min_length):
+    """Score the runs of unknown locations of a ROM as code or data.
+
+    Keyword arguments:
+    rom        -- Object derived from rom_base, usually after disassemble().
+    model      -- Trained code_model.
+    window     -- Number of byte pairs each score is averaged over.
+    min_length -- Minimum number of bytes in a run of unknown locations.
+
+    Returns:
+    List of (start address, end address, kind, likelihood) tuples in
+    address order. Likelihood is the probability that the span is code,
+    taking its mean score over a window of bytes as evidence.
+    """
+
+    if model.n_code() < min_training:
+        raise ValueError('Code model has {:d} code byte pairs; at least {:d} are needed.'.format(
+            model.n_code(), min_training))
+
+    base  = rom.base_address
+    data  = bytes(rom.rom)
+    table = model.log_odds()
+    spans = []
+    for lo, hi in _unknown_runs(rom, min_length):
+        chunk = data[lo:hi]
+        n     = len(chunk) - 1
+        w     = min(window, n)
+
+        # Score every pair with table lookups and cumulative sums, without
+        # a Python loop per location
+        pairs = map(operator.or_, map(operator.lshift, chunk, itertools.repeat(8)), chunk[1:])
+        total = [0.0] + list(itertools.accumulate(map(table.__getitem__, pairs)))
+
+        # A location is code-like if the window of pairs centered on it
+        # scores above min_bits per pair
+        sums  = map(operator.sub, total[w:], total)
+        flags = bytes(map(operator.gt, sums, itertools.repeat(min_bits*w)))
+        code  = flags[:1]*(w//2) + flags + flags[-1:]*(w - w//2)
+
+        # Absorb spans shorter than the window into their surroundings
+        code = re.sub(b'(?<=\x00)\x01{1,%d}(?=\x00)' % (w - 1), lambda m: bytes(len(m.group())), code)
+        code = re.sub(b'(?<=\x01)\x00{1,%d}(?=\x01)' % (w - 1), lambda m: b'\x01'*len(m.group()), code)
+
+        for m in re.finditer(b'\x00+|\x01+', code):
+            start, end = m.start(), min(m.end(), n)
+            mean = (total[end] - total[start]) / max(1, end - start)
+            bits = max(-60.0, min(60.0, (mean - min_bits)*w))
+            spans.append((base + lo + m.start(), base + lo + m.end() - 1,
+                          kind_code if code[start] else kind_data,
+                          1.0/(1.0 + 2.0**-bits)))
+    return spans
+
+
+def annotate(rom, spans):
+    """Add a code likelihood comment at the start of each scored span."""
+
+    for start, end, kind, likelihood in spans:
+        rom.comments[start - rom.base_address] += 'Code likelihood {:d}%. '.format(
+            int(round(100*likelihood)))
+
+
+def suggest_entries(spans, min_length=min_length, min_likelihood=min_likelihood):
+    """Return start addresses of likely code spans.
+
+    Keyword arguments:
+    spans          -- List of spans from score().
+    min_length     -- Minimum number of bytes in a suggested span.
+    min_likelihood -- Minimum likelihood of a suggested span.
+    """
+
+    return [start for start, end, kind, likelihood in spans
+            if (kind is kind_code) and (end - start + 1 >= min_length)
+            and (likelihood >= min_likelihood)]
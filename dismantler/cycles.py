@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Clock cycle counts of instructions, basic blocks and loops.
+
+Each instruction is counted with one lookup in the cycle table of its
+CPU module, which gives its cycles when the condition of a conditional
+jump, call, return or repeat is met and when it is not. A block costs
+the sum of its instructions, so leaving a block by its jump edge costs
+its taken cycles and by falling through its not-taken cycles.
+
+Loops are found by decomposing the control flow graph, without call
+edges, into nested strongly connected components. Each loop has a
+header block; edges back to a header close an iteration. The cost of
+one iteration is the range of path costs from the header back to it,
+counting each inner loop once. Called subroutines are not counted.
+
+Example:
+    graph  = dismantler.flowgraph.flowgraph(rom)
+    counts = dismantler.cycles.cycle_counts(graph)
+    counts.annotate()
+    sys.stdout.write(counts.report(20))
+"""
+
+import array
+
+from . import flowgraph
+from . import rom_base
+
+
+class loop(object):
+    """Properties of one loop."""
+
+    def __init__(self, header, blocks, depth):
+        """Loop constructor.
+
+        Keyword arguments:
+        header -- Index of header block.
+        blocks -- Indices of blocks in the loop, including inner loops.
+        depth  -- Nesting depth, 1 for an outermost loop.
+        """
+
+        self.header       = header
+        self.blocks       = blocks
+        self.depth        = depth
+        self.instructions = 0  # Instructions in the loop's blocks
+        self.calls        = 0  # Call edges leaving the loop's blocks
+        self.min_cycles   = 0  # Cycles of the cheapest iteration
+        self.max_cycles   = 0  # Cycles of the most expensive iteration
+
+
+class cycle_counts(object):
+    """Clock cycles of the blocks and loops of a control flow graph.
+
+    Block i costs cycles[i] when left by falling through, and taken[i]
+    when left by a jump or call.
+    """
+
+    def __init__(self, graph):
+        """Count block cycles and find loops.
+
+        Keyword arguments:
+        graph -- flowgraph object for the ROM.
+        """
+
+        rom = graph.rom
+        if rom.cycle_table is None:
+            raise ValueError('No cycle counts for {:s}.'.format(rom.description))
+        self.graph = graph
+
+        # Cycles of each block, and of its instructions
+        self.cycles = array.array('l')
+        self.taken  = array.array('l')
+        self.insn_cycles = {}
+        for start, end, n_insns in graph.blocks():
+            body    = 0
+            address = start
+            while True:
+                if rom.data_type[address - rom.base_address] is rom_base.type_error:
+                    # Invalid opcodes take no cycles
+                    cycles = (0, 0)
+                else:
+                    cycles = rom.cycles(address)
+                    self.insn_cycles[address] = cycles
+                if address >= end:
+                    break
+                body    = body + cycles[0]
+                address = address + rom._insn_length(address)
+            self.cycles.append(body + cycles[0])
+            self.taken.append(body + cycles[1])
+
+        # Successors of each block, without calls
+        edge_first, edge_block, edge_kind = graph.edge_first, graph.edge_block, graph.edge_kind
+        self.succ = []
+        for block in range(len(graph)):
+            self.succ.append([(edge_block[j], edge_kind[j])
+                              for j in range(edge_first[block], edge_first[block + 1])
+                              if (edge_block[j] >= 0) and (edge_kind[j] is not flowgraph.edge_call)])
+
+        self.loops = self._find_loops()
+
+    def edge_cycles(self, block, kind):
+        """Return cycles of a block when left by an edge of the given kind."""
+
+        if kind is flowgraph.edge_fall:
+            return self.cycles[block]
+        return self.taken[block]
+
+    def _components(self, nodes):
+        """Return strongly connected components of the subgraph of a set of blocks.
+
+        Uses Tarjan's algorithm with an explicit stack.
+        """
+
+        index    = {}
+        lowlink  = {}
+        on_stack = set()
+        stack    = []
+        sccs     = []
+        for root in sorted(nodes):
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+                if i == 0:
+                    index[node] = lowlink[node] = len(index)
+                    stack.append(node)
+                    on_stack.add(node)
+                succ = self.succ[node]
+                while i < len(succ):
+                    dest = succ[i][0]
+                    i = i + 1
+                    if dest not in nodes:
+                        continue
+                    if dest not in index:
+                        work.append((node, i))
+                        work.append((dest, 0))
+                        break
+                    if dest in on_stack:
+                        lowlink[node] = min(lowlink[node], index[dest])
+                else:
+                    if lowlink[node] == index[node]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            scc.append(member)
+                            if member == node:
+                                break
+                        sccs.append(scc)
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+        return sccs
+
+    def _find_loops(self):
+        """Return list of loops, outermost first."""
+
+        preds = [[] for block in range(len(self.succ))]
+        for block, succ in enumerate(self.succ):
+            for dest, kind in succ:
+                preds[dest].append(block)
+
+        loops = []
+        work  = [(set(range(len(self.succ))), 1)]
+        while work:
+            nodes, depth = work.pop(0)
+            for scc in self._components(nodes):
+                members = set(scc)
+                if (len(scc) == 1) and all(dest != scc[0] for dest, kind in self.succ[scc[0]]):
+                    continue
+                # The header is the first block entered from outside the loop
+                entered = [block for block in scc if any(pred not in members for pred in preds[block])]
+                header  = min(entered or scc)
+                loops.append(loop(header, sorted(scc), depth))
+                members.discard(header)
+                if members:
+                    work.append((members, depth + 1))
+
+        # Edges back to a header from inside its loop close an iteration;
+        # without them the graph is acyclic.
+        back = set()
+        for each in loops:
+            for block in each.blocks:
+                if any(dest == each.header for dest, kind in self.succ[block]):
+                    back.add((block, each.header))
+        for each in loops:
+            self._iteration_cycles(each, back)
+        return loops
+
+    def _iteration_cycles(self, each, back):
+        """Set instruction, call and iteration cycle counts of a loop."""
+
+        graph   = self.graph
+        members = set(each.blocks)
+        for block in each.blocks:
+            each.instructions = each.instructions + graph.block_insns[block]
+            for j in range(graph.edge_first[block], graph.edge_first[block + 1]):
+                if graph.edge_kind[j] is flowgraph.edge_call:
+                    each.calls = each.calls + 1
+
+        # Topological order of the loop's blocks without back edges
+        degree = dict((block, 0) for block in each.blocks)
+        for block in each.blocks:
+            for dest, kind in self.succ[block]:
+                if (dest in members) and ((block, dest) not in back):
+                    degree[dest] = degree[dest] + 1
+        order = [block for block in each.blocks if degree[block] == 0]
+        for block in order:
+            for dest, kind in self.succ[block]:
+                if (dest in members) and ((block, dest) not in back):
+                    degree[dest] = degree[dest] - 1
+                    if degree[dest] == 0:
+                        order.append(dest)
+
+        # Cheapest and most expensive paths from the header
+        lo = {each.header: 0}
+        hi = {each.header: 0}
+        iterations = []
+        for block in order:
+            if block not in lo:
+                continue
+            for dest, kind in self.succ[block]:
+                if dest not in members:
+                    continue
+                cost = self.edge_cycles(block, kind)
+                if dest == each.header:
+                    iterations.append((lo[block] + cost, hi[block] + cost))
+                elif (block, dest) not in back:
+                    lo[dest] = min(lo.get(dest, lo[block] + cost), lo[block] + cost)
+                    hi[dest] = max(hi.get(dest, hi[block] + cost), hi[block] + cost)
+        if iterations:
+            each.min_cycles = min(cost for cost, high in iterations)
+            each.max_cycles = max(high for cost, high in iterations)
+
+    def _text(self, cycles, taken):
+        """Return cycle count text, with taken cycles if they differ."""
+
+        if cycles == taken:
+            return '{:d}'.format(cycles)
+        return '{:d}/{:d}'.format(cycles, taken)
+
+    def annotate(self, instructions=True):
+        """Add cycle counts to the comments of the ROM.
+
+        Loop headers are annotated with the cycles of one iteration, block
+        starts with the cycles of the block, and each instruction with its
+        own cycles, taken cycles second where they differ.
+
+        Keyword arguments:
+        instructions -- If False, annotate only loops and blocks.
+        """
+
+        rom  = self.graph.rom
+        base = rom.base_address
+        for each in self.loops:
+            rom.comments[self.graph.block_start[each.header] - base] += \
+                'Loop {:d}..{:d} cycles per iteration. '.format(each.min_cycles, each.max_cycles)
+        for block, start in enumerate(self.graph.block_start):
+            rom.comments[start - base] += 'Block {:s} cycles. '.format(
+                self._text(self.cycles[block], self.taken[block]))
+        if instructions:
+            for address, (cycles, taken) in self.insn_cycles.items():
+                rom.comments[address - base] += '{:s} cycles. '.format(self._text(cycles, taken))
+
+    def _name(self, address):
+        """Return label or hex string for address."""
+
+        return self.graph.rom.label_map.get(address, self.graph.rom.format_address(address))
+
+    def ranked(self):
+        """Return list of loops, most expensive iteration first."""
+
+        return sorted(self.loops, key=lambda each: (-each.max_cycles, -each.min_cycles,
+                                                    self.graph.block_start[each.header]))
+
+    def report(self, count=None):
+        """Return text report of the most expensive loops.
+
+        Keyword arguments:
+        count -- If specified, maximum number of loops to report.
+        """
+
+        report = '; Most expensive loops, in clock cycles per iteration:\n;\n'
+        report = report + '; {:17s} {:>5s} {:>6s} {:>6s} {:>7s} {:>7s} {:>5s}\n'.format(
+            'Loop', 'Depth', 'Blocks', 'Insns', 'Min', 'Max', 'Calls')
+        for each in self.ranked()[:count]:
+            report = report + '; {:17s} {:5d} {:6d} {:6d} {:7d} {:7d} {:5d}\n'.format(
+                self._name(self.graph.block_start[each.header]), each.depth, len(each.blocks),
+                each.instructions, each.min_cycles, each.max_cycles, each.calls)
+        return report
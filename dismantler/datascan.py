@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Find strings and tables in the unclassified and data areas of a ROM.
+
+After disassembly, locations which are still unknown or plain 8-bit
+data are scanned for:
+
+    strings          -- Runs of printable ASCII terminated by NUL, CR
+                        (optionally followed by LF and NUL), LF, or a
+                        last character with bit 7 set, mostly made of
+                        letters, digits and spaces.
+    page tables      -- 256-byte pages starting on a page boundary,
+                        whose address is labeled or is the operand of
+                        an instruction, with no byte filling more than
+                        half of the page and no strings in them.
+    monotonic tables -- Runs of strictly increasing or strictly
+                        decreasing bytes.
+
+Unknown locations may also be searched for vector tables: runs of
+consecutive 16-bit words, in the CPU's byte order, which all point at
+plausible instruction starts within the image. Found tables are
+classified with set_vector_table() through disassemble(), so that all
+of their targets are queued for traversal in one batch.
+
+Each area is scanned with regular expressions over its bytes rather
+than byte by byte, and findings are classified in bulk, as strings with
+set_strings() and as tables with set_table(), so that they are listed
+as DB 'text' and multi-byte DB lines.
+
+Example:
+    rom.disassemble(entries=[0])
+    dismantler.datascan.apply_vector_tables(rom)
+    dismantler.datascan.apply(rom, dismantler.datascan.scan(rom))
+"""
+
+import re
+import struct
+
+from . import rom_base
+
+# Kinds of finding
+kind_string, kind_page_table, kind_monotonic = list(range(3))
+
+kind_names = ['STRING', 'PAGE_TABLE', 'MONOTONIC_TABLE']
+
+# Minimum number of characters in a string, not counting the terminator
+min_string = 4
+
+# Minimum fraction of letters, digits and spaces in a string
+min_text_ratio = 0.75
+
+# Maximum number of locations of a page table holding the same byte
+max_page_fill = 0x80
+
+# Minimum number of bytes in a monotonic table
+min_monotonic = 8
+
+# Minimum number of consecutive words in a vector table
+min_vectors = 4
+
+_scannable = (rom_base.type_unknown, rom_base.type_data8)
+
+_text_re = re.compile(b'[A-Za-z0-9 ]')
+
+
+def _string_re(length):
+    """Return pattern matching terminated strings of at least length characters."""
+
+    return re.compile(b'[\\x20-\\x7E]{%d,}(?:\\x0D\\x0A?\\x00?|\\x0A\\x00?|\\x00)'
+                      b'|[\\x20-\\x7E]{%d,}[\\xA0-\\xFE]' % (length, length - 1))
+
+
+def _monotonic_runs(data, length):
+    """Yield (start, end) index pairs of strictly monotonic runs in data."""
+
+    rising  = bytes(1 if b > a else 0 for a, b in zip(data, data[1:]))
+    falling = bytes(1 if b < a else 0 for a, b in zip(data, data[1:]))
+    pattern = re.compile(b'\x01{%d,}' % (length - 1))
+    runs = [(m.start(), m.end()) for m in pattern.finditer(rising)]
+    runs = runs + [(m.start(), m.end()) for m in pattern.finditer(falling)]
+    for start, end in sorted(runs):
+        yield (start, end)
+
+
+def _referenced(rom, data, address):
+    """Return True if address is labeled or is a 16-bit operand of an instruction."""
+
+    if address in rom.label_map:
+        return True
+    order = '>' if rom.big_endian else '<'
+    for m in re.finditer(re.escape(struct.pack(order + 'H', address)), data):
+        if (rom.data_type[m.start()] is rom_base.type_operand) \
+           and (rom.data_type[m.start() + 1] is rom_base.type_operand):
+            return True
+    return False
+
+
+def scan(rom, strings=True, page_tables=True, monotonic=True):
+    """Find strings and tables in the unknown and 8-bit data locations of a ROM.
+
+    Keyword arguments:
+    rom         -- Object derived from rom_base, usually after disassemble().
+    strings     -- Find strings.
+    page_tables -- Find page-aligned 256-byte tables.
+    monotonic   -- Find monotonic tables.
+
+    Returns:
+    List of (kind, start address, end address) tuples in address order.
+    Found areas do not overlap.
+    """
+
+    base = rom.base_address
+    data = bytes(rom.rom)
+
+    # One byte per location: 0 if still available for a finding
+    taken = bytearray(0 if t in _scannable else 1 for t in rom.data_type)
+    findings = []
+
+    def free_runs():
+        return [(m.start(), m.end()) for m in re.finditer(b'\x00+', taken)]
+
+    if strings:
+        pattern = _string_re(min_string)
+        for lo, hi in free_runs():
+            for m in pattern.finditer(data, lo, hi):
+                text = m.group().rstrip(b'\x00\x0A\x0D')
+                if len(_text_re.findall(text)) >= min_text_ratio*len(text):
+                    findings.append((kind_string, m.start(), m.end() - 1))
+        for kind, start, end in findings:
+            taken[start:end + 1] = b'\x01'*(end - start + 1)
+
+    if page_tables:
+        pages = []
+        for lo, hi in free_runs():
+            start = lo + (-(base + lo) % 0x100)
+            while start + 0x100 <= hi:
+                page = data[start:start + 0x100]
+                if (max(page.count(value) for value in set(page)) <= max_page_fill) \
+                   and _referenced(rom, data, base + start):
+                    pages.append((kind_page_table, start, start + 0xFF))
+                start = start + 0x100
+        for kind, start, end in pages:
+            taken[start:end + 1] = b'\x01'*(end - start + 1)
+        findings = findings + pages
+
+    if monotonic:
+        tables = []
+        for lo, hi in free_runs():
+            end = lo - 1
+            for start, stop in _monotonic_runs(data[lo:hi], min_monotonic):
+                if lo + start > end:
+                    end = lo + stop
+                    tables.append((kind_monotonic, lo + start, end))
+        findings = findings + tables
+
+    return sorted(((kind, start + base, end + base) for kind, start, end in findings),
+                  key=lambda finding: finding[1])
+
+
+def apply(rom, findings):
+    """Classify findings of scan() in a ROM.
+
+    Keyword arguments:
+    rom      -- Object derived from rom_base.
+    findings -- List of (kind, start address, end address) tuples.
+    """
+
+    for kind, start, end in findings:
+        if kind is kind_string:
+            last = rom.rom[end - rom.base_address]
+            rom.set_strings(start, None, last if last < 0x80 else None, end)
+        else:
+            rom.set_table(start, end)
+
+
+
+def _plausible_targets(rom, data):
+    """Return one byte per location: 1 if a vector pointing there is plausible.
+
+    Instructions are plausible targets, and so are unknown locations other
+    than fill bytes or the start of a string.
+    """
+
+    strings   = _string_re(min_string)
+    plausible = bytearray(len(data))
+    for idx, t in enumerate(rom.data_type):
+        if t is rom_base.type_instruction:
+            plausible[idx] = 1
+        elif (t is rom_base.type_unknown) and (data[idx] not in (0x00, 0xFF)) \
+             and (strings.match(data, idx) is None):
+            plausible[idx] = 1
+    return plausible
+
+
+def find_vector_tables(rom, count=min_vectors):
+    """Find runs of words in unknown locations which point at plausible instruction starts.
+
+    Keyword arguments:
+    rom   -- Object derived from rom_base, usually after disassemble().
+    count -- Minimum number of consecutive vectors in a table.
+
+    Returns:
+    List of non-overlapping (address, count) tuples in address order,
+    suitable for the vector_tables argument of disassemble().
+    """
+
+    base    = rom.base_address
+    data    = bytes(rom.rom)
+    order   = '>' if rom.big_endian else '<'
+    unknown = bytearray(1 if t is rom_base.type_unknown else 0 for t in rom.data_type)
+    plausible = None
+
+    # Targets leave room for the longest instruction before the end of the image
+    last = rom.max_address - rom.max_insn_length + 1
+
+    found = []
+    run   = re.compile(b'\x01{%d,}' % count)
+    for m in re.finditer(b'\x01{%d,}' % (2*count), unknown):
+        if plausible is None:
+            plausible = _plausible_targets(rom, data)
+        for start in (m.start(), m.start() + 1):
+            n = (m.end() - start) // 2
+            if n < count:
+                continue
+            words = struct.unpack_from('{:s}{:d}H'.format(order, n), data, start)
+            hits  = bytes(1 if (word not in (0x0000, 0xFFFF)) and (word >= base)
+                          and (word <= last) and plausible[word - base]
+                          else 0 for word in words)
+            for r in run.finditer(hits):
+                # Mostly distinct targets, as in dispatch and interrupt tables
+                if 2*len(set(words[r.start():r.end()])) >= r.end() - r.start():
+                    found.append((base + start + 2*r.start(), r.end() - r.start()))
+
+    # Both word alignments may find a table in the same place; keep the longest
+    tables = []
+    taken  = set()
+    for address, n in sorted(found, key=lambda table: (-table[1], table[0])):
+        span = set(range(address, address + 2*n))
+        if not (span & taken):
+            tables.append((address, n))
+            taken.update(span)
+    return sorted(tables)
+
+
+def apply_vector_tables(rom, create_labels=True, breakpoints=[], count=min_vectors, rounds=8):
+    """Find vector tables and disassemble from their targets.
+
+    Code reached through one round of tables may reveal more tables, so
+    searching is repeated until no more are found, up to rounds times.
+    Tables leading to code which cannot be decoded are not applied.
+
+    Keyword arguments:
+    rom           -- Object derived from rom_base, after disassemble().
+    create_labels -- Create labels for vector destinations and referenced locations.
+    breakpoints   -- As for disassemble().
+    count         -- Minimum number of consecutive vectors in a table.
+    rounds        -- Maximum number of searches.
+
+    Returns:
+    List of (address, count) tuples of all tables applied.
+    """
+
+    applied  = []
+    rejected = set()
+    for n in range(rounds):
+        tables = [table for table in find_vector_tables(rom, count) if table not in rejected]
+        if not tables:
+            break
+        state = rom.save_state()
+        try:
+            rom.disassemble(entries=[], create_labels=create_labels,
+                            breakpoints=breakpoints, vector_tables=tables)
+        except (IndexError, NotImplementedError):
+            # A guessed table led into code which cannot be decoded; try each
+            # table on its own and keep those which can
+            rom.restore_state(state)
+            rejected.update(tables)
+            tables = [table for table in tables
+                      if _try_vector_table(rom, table, create_labels, breakpoints)]
+            rejected.difference_update(tables)
+            if not tables:
+                break
+        applied = applied + tables
+    return applied
+
+
+def _try_vector_table(rom, table, create_labels, breakpoints):
+    """Disassemble from one vector table, undoing it and returning False if decoding fails."""
+
+    state = rom.save_state()
+    try:
+        rom.disassemble(entries=[], create_labels=create_labels,
+                        breakpoints=breakpoints, vector_tables=[table])
+    except (IndexError, NotImplementedError):
+        rom.restore_state(state)
+        return False
+    return True
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Guess the CPU type of an undocumented ROM image.
+
+Every registered decoder disassembles the image from its own default
+entry points, in parallel worker processes, and the result is scored
+for plausibility:
+
+    valid    -- 1 minus ten times the rate of invalid or reserved opcodes
+                among decoded instructions, floored at 0.
+    aligned  -- Fraction of jump and call targets within the image which
+                land on instruction starts rather than inside operands.
+    code     -- Fraction of the image reached as code, not counting fill
+                (runs of 16 or more identical bytes).
+    vectors  -- Fraction of default entry points (reset and interrupt
+                vectors) which hold a valid instruction other than fill.
+
+The score is a weighted sum of these, reduced if the decoder failed
+with an exception other than an unimplemented instruction. Since the
+8080, 8085 and Z80 share most opcodes, code for one of them often
+scores nearly as well on the others; the confidence reflects the margin
+over the runner-up.
+
+The base address of an image is guessed from one quick linear decode.
+Jump and call targets which do not move when the image does are the
+absolute ones; a histogram of target minus instruction start offset,
+over every pair which agrees modulo the alignment, counts for each
+candidate base how many targets would land on an instruction start.
+
+Example:
+    results = dismantler.detect.detect(data)
+    sys.stdout.write(dismantler.detect.report(results))
+    bases = dismantler.detect.detect_base(dismantler.cpus['8085'], data)
+    sys.stdout.write(dismantler.detect.base_report(bases))
+"""
+
+import bisect
+import collections
+import multiprocessing
+import re
+
+from . import registry
+from . import rom_base
+from . import util
+
+# Weights of the valid, aligned, code and vectors measures
+weights = (0.40, 0.25, 0.20, 0.15)
+
+# Score factor for decoders which failed, e.g. by running off the image
+error_penalty = 0.8
+
+# Runs of identical bytes at least this long are fill rather than code
+_fill_re = re.compile(b'(.)\\1{15,}', re.DOTALL)
+
+# Minimum score margins over the runner-up for high and medium confidence
+margin_high   = 0.10
+margin_medium = 0.03
+
+# Alignment of candidate base addresses. A multiple of 0x100 keeps
+# page-relative branches, as on the 1802, in place.
+base_alignment = 0x100
+
+_invalid_codes = (rom_base.diag_invalid_opcode, rom_base.diag_reserved_opcode)
+
+
+class candidate(object):
+    """Plausibility measures of one CPU type for an image."""
+
+    def __init__(self, key):
+        """Candidate constructor.
+
+        Keyword arguments:
+        key -- CPU type key.
+        """
+
+        self.key          = key
+        self.instructions = 0     # Number of instructions decoded
+        self.valid        = 0.0   # Measures described in the module docstring
+        self.aligned      = 0.0
+        self.code         = 0.0
+        self.vectors      = 0.0
+        self.score        = 0.0
+        self.error        = None  # Message of an exception which stopped disassembly
+        self.failed       = False # True if that exception was not an unimplemented instruction
+
+    def measure(self, rom, entries):
+        """Compute the measures from a disassembled ROM object."""
+
+        data_type = rom.data_type
+        base      = rom.base_address
+        self.instructions = len(rom.successors)
+
+        invalid = set(diag[1] for diag in rom.diagnostics if diag[0] in _invalid_codes)
+        invalid.update(address for address in rom.successors
+                       if data_type[address - base] is rom_base.type_error)
+        rate = float(len(invalid)) / max(1, self.instructions)
+        self.valid = max(0.0, 1.0 - 10.0*rate)
+
+        targets = [dest for dest in rom.xref if base <= dest <= rom.max_address]
+        if targets:
+            hits = sum(1 for dest in targets if data_type[dest - base] is rom_base.type_instruction)
+            self.aligned = float(hits) / len(targets)
+        else:
+            self.aligned = 0.5
+
+        is_code = [(t is rom_base.type_instruction) or (t is rom_base.type_operand) for t in data_type]
+        code    = sum(is_code)
+        size    = rom.rom_len
+        for m in _fill_re.finditer(bytes(rom.rom)):
+            code = code - sum(is_code[m.start():m.end()])
+            size = size - (m.end() - m.start())
+        self.code = float(code) / max(1, size)
+
+        entries = [entry for entry in entries if base <= entry <= rom.max_address]
+        if entries:
+            sane = sum(1 for entry in entries
+                       if (data_type[entry - base] is rom_base.type_instruction)
+                       and (entry not in invalid)
+                       and (rom.rom[entry - base] not in (0x00, 0xFF)))
+            self.vectors = float(sane) / len(entries)
+        else:
+            self.vectors = 0.5
+
+        self.score = sum(w*m for w, m in zip(weights, (self.valid, self.aligned,
+                                                        self.code, self.vectors)))
+        if self.failed:
+            self.score = self.score * error_penalty
+
+
+def score_cpu(key, data, base_address=0, entries=None):
+    """Disassemble an image with one CPU type and return its candidate.
+
+    Keyword arguments:
+    key          -- CPU type key.
+    data         -- Binary image.
+    base_address -- Address of first byte of image.
+    entries      -- Entry points. Default is the CPU type's default entries.
+    """
+
+    module = registry.cpu_module(key)
+    if entries is None:
+        entries = list(getattr(module, 'default_entries', [base_address]))
+    rom    = registry.cpu_class(key)(rom=data, base_address=base_address,
+                                     label_map={}, port_map={})
+    result = candidate(key)
+    try:
+        rom.disassemble(entries=entries, create_labels=False)
+    except Exception as e:
+        # Score whatever was decoded before the decoder gave up
+        result.error  = '{:s}: {:s}'.format(type(e).__name__, str(e))
+        result.failed = not isinstance(e, NotImplementedError)
+    result.measure(rom, entries)
+    return result
+
+
+def _work(task):
+    """Worker process entry point."""
+
+    return score_cpu(*task)
+
+
+def detect(data, base_address=0, keys=None, entries=None, processes=None):
+    """Score every CPU type for an image, in parallel worker processes.
+
+    Keyword arguments:
+    data         -- Binary image.
+    base_address -- Address of first byte of image.
+    keys         -- CPU type keys to try. Default is every registered type.
+    entries      -- Entry points. Default is each CPU type's default entries.
+    processes    -- Number of worker processes. Default is one per CPU type;
+                    1 scores every type in this process.
+
+    Returns:
+    List of candidate objects, best first.
+    """
+
+    if keys is None:
+        keys = registry.keys()
+    data  = bytes(data)
+    tasks = [(key, data, base_address, entries) for key in keys]
+    if (processes == 1) or (len(tasks) <= 1):
+        results = [_work(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes or len(tasks))
+        try:
+            results = pool.map(_work, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return sorted(results, key=lambda result: (-result.score, result.key))
+
+
+def confidence(results):
+    """Return 'high', 'medium' or 'low' confidence in the best candidate."""
+
+    if len(results) < 2:
+        return 'high'
+    margin = results[0].score - results[1].score
+    if margin >= margin_high:
+        return 'high'
+    if margin >= margin_medium:
+        return 'medium'
+    return 'low'
+
+
+def report(results):
+    """Return ranked text report of candidates, ending with the verdict."""
+
+    text = '; CPU detection:\n;\n'
+    text = text + '; {:4s} {:8s} {:>6s} {:>6s} {:>7s} {:>6s} {:>7s} {:>6s}\n'.format(
+        'Rank', 'CPU', 'Score', 'Valid', 'Aligned', 'Code', 'Vectors', 'Insns')
+    for rank, result in enumerate(results, 1):
+        text = text + '; {:4d} {:8s} {:6.3f} {:6.1%} {:7.1%} {:6.1%} {:7.1%} {:6d}'.format(
+            rank, result.key, result.score, result.valid, result.aligned,
+            result.code, result.vectors, result.instructions)
+        if result.error is not None:
+            text = text + '  (stopped: {:s})'.format(result.error)
+        text = text + '\n'
+    if results:
+        best = results[0]
+        margin = best.score - results[1].score if len(results) > 1 else best.score
+        text = text + ';\n; Verdict: {:s} ({:s}), confidence {:s}, margin {:.3f}\n'.format(
+            best.key, registry.description(best.key), confidence(results), margin)
+    return text
+
+
+class base_candidate(object):
+    """How well one candidate base address fits the absolute targets of an image."""
+
+    def __init__(self, base, hits, inside, total):
+        """Base candidate constructor.
+
+        Keyword arguments:
+        base   -- Candidate base address.
+        hits   -- Number of targets landing on instruction starts.
+        inside -- Number of targets landing within the image.
+        total  -- Number of absolute targets found.
+        """
+
+        self.base   = base
+        self.hits   = hits
+        self.inside = inside
+        self.total  = total
+        self.score  = float(hits) / max(1, total)
+
+
+def _decode(rom, address):
+    """Decode one instruction, returning its computable next addresses."""
+
+    try:
+        return rom.disasm_single(address, False)
+    except NotImplementedError:
+        return []
+
+
+def absolute_targets(cpu_class, data):
+    """Decode an image linearly and return its absolute jump and call targets.
+
+    The image is decoded from its first byte at address 0, and each
+    instruction with next addresses is decoded again one alignment step
+    higher. Fall-through and relative targets move with the instruction
+    and are dropped. Instructions within fill runs are ignored.
+
+    Keyword arguments:
+    cpu_class -- Class derived from rom_base.
+    data      -- Binary image.
+
+    Returns:
+    Tuple of (list of instruction start offsets, list of targets, one per
+    referencing instruction).
+    """
+
+    rom    = cpu_class(rom=data, base_address=0, label_map={}, port_map={})
+    starts = []
+    found  = {}  # Instruction offset -> next addresses
+    address = 0
+    while address < len(data):
+        try:
+            next_addrs = _decode(rom, address)
+        except IndexError:
+            # Operands run off the end of the image
+            break
+        starts.append(address)
+        if next_addrs:
+            found[address] = next_addrs
+        address = address + rom._insn_length(address)
+
+    fill = set()
+    for m in _fill_re.finditer(bytes(data)):
+        fill.update(range(m.start(), m.end()))
+
+    shifted = cpu_class(rom=data, base_address=base_alignment, label_map={}, port_map={})
+    targets = []
+    for source in starts:
+        if (source not in found) or (source in fill):
+            continue
+        same = _decode(shifted, source + base_alignment)
+        targets.extend(dest for dest in found[source] if dest in same)
+    return (starts, targets)
+
+
+def detect_base(cpu_class, data, address_width=16, alignment=base_alignment):
+    """Score candidate base addresses of an image, best first.
+
+    Keyword arguments:
+    cpu_class     -- Class derived from rom_base.
+    data          -- Binary image.
+    address_width -- Number of bits in a memory address.
+    alignment     -- Candidate bases are multiples of this.
+
+    Returns:
+    List of base_candidate objects, one per aligned base at which the
+    image fits in the address space. Candidates with equal hits are
+    ordered by targets within the image, then by base.
+    """
+
+    starts, targets = absolute_targets(cpu_class, data)
+    limit = (1 << address_width) - len(data)
+
+    # Correlate targets with instruction starts: base = target - start
+    by_residue = {}
+    for start in starts:
+        by_residue.setdefault(start % alignment, []).append(start)
+    hits = collections.Counter()
+    for dest in targets:
+        for start in by_residue.get(dest % alignment, ()):
+            base = dest - start
+            if (base >= 0) and (base <= limit):
+                hits[base] += 1
+
+    ordered = sorted(targets)
+    results = []
+    for base in range(0, limit + 1, alignment):
+        inside = bisect.bisect_right(ordered, base + len(data) - 1) - bisect.bisect_left(ordered, base)
+        results.append(base_candidate(base, hits[base], inside, len(targets)))
+    # Among equal hits, prefer the base keeping more targets within the image
+    return sorted(results, key=lambda result: (-result.hits, -result.inside, result.base))
+
+
+def base_report(results, address_width=16, count=8):
+    """Return text report of the best candidate base addresses.
+
+    Keyword arguments:
+    results       -- List of base_candidate objects, best first.
+    address_width -- Number of bits in a memory address.
+    count         -- Number of candidates to report.
+    """
+
+    total = results[0].total if results else 0
+    text = '; Base address detection: {:d} absolute jump and call targets\n;\n'.format(total)
+    text = text + '; {:4s} {:>8s} {:>6s} {:>7s} {:>6s}\n'.format('Rank', 'Base', 'Hits', 'Inside', 'Score')
+    for rank, result in enumerate(results[:count], 1):
+        text = text + '; {:4d} {:>8s} {:6d} {:7d} {:6.1%}\n'.format(
+            rank, util.hex_intel(result.base, address_width), result.hits, result.inside, result.score)
+    if results:
+        best = results[0]
+        runner_up = results[1].score if len(results) > 1 else 0.0
+        tied = [result for result in results[1:]
+                if (result.hits, result.inside) == (best.hits, best.inside)]
+        if tied:
+            text = text + ';\n; Verdict: ambiguous, bases {:s} fit equally well, {:.1%} of targets on instruction starts\n'.format(
+                ', '.join(util.hex_intel(result.base, address_width) for result in [best] + tied[:count - 1]),
+                best.score)
+        else:
+            text = text + ';\n; Verdict: base {:s}, {:.1%} of targets on instruction starts, runner-up {:.1%}\n'.format(
+                util.hex_intel(best.base, address_width), best.score, runner_up)
+    return text
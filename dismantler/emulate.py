@@ -0,0 +1,1026 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Emulation of 8080, 8085 and Z80 code to discover entries dynamically.
+
+Static disassembly cannot follow jumps through addresses computed from
+data. Running the ROM for a while, from reset, finds the instructions
+that such jumps reach; each one executed is then available as an entry
+for disassemble().
+
+Opcodes are decoded with the same x, y, z, p and q fields, and the same
+register, register pair, condition and ALU numbering, as the
+disassemblers, following http://z80.info/decoding.htm. A handler is
+built for each opcode once, so that running is one table lookup and
+one call per instruction. Opcodes the disassembler flags as invalid
+stop emulation, as do the Z80 DD and FD prefixes, which the Z80
+disassembler does not decode yet. Block transfer, search and I/O
+instructions run to completion as one instruction.
+
+Memory is 64K bytes. The ROM image is mapped read-only at its base
+address; RAM spans are writable, and by default every other address is
+RAM. Reads of unmapped addresses return FFh, as from an open bus.
+
+Input ports return FFh unless scripted. An I/O script holds one
+directive per line:
+
+    in PORT VALUE [VALUE ...] [repeat]
+
+Reads of PORT return the values in turn; the last value is returned
+from then on, or the values are repeated if 'repeat' is given. Text
+following '#' or ';' is a comment.
+
+Example:
+    emu = dismantler.emulate.emulator(rom, ram=[(0x8000, 0xFFFF)])
+    emu.run(entry=0, budget=1000000, interrupt=(10000, 0x38))
+    dismantler.emulate.apply(rom, emu)
+"""
+
+from . import annotations
+from . import rom_base
+from . import util
+
+# Reasons for emulation stopping
+stop_budget, stop_halt, stop_invalid, stop_range = list(range(4))
+
+stop_names = ['BUDGET', 'HALT', 'INVALID_OPCODE', 'OUT_OF_RANGE']
+
+# Flag bits, at the same positions on all three CPUs
+_fs, _fz, _fh, _fp, _fn, _fc = 0x80, 0x40, 0x10, 0x04, 0x02, 0x01
+
+# Mask and value of F for which each condition holds, numbered as in the
+# disassemblers' _cc tables: NZ, Z, NC, C, PO, PE, P, M
+_cond = [(_fz, 0), (_fz, _fz), (_fc, 0), (_fc, _fc),
+         (_fp, 0), (_fp, _fp), (_fs, 0), (_fs, _fs)]
+
+# Sign and zero flags, and those with even parity, of each byte value
+_sz  = bytes((v & _fs) | (_fz if v == 0 else 0) for v in range(0x100))
+_szp = bytes(_sz[v] | (_fp if bin(v).count('1') % 2 == 0 else 0) for v in range(0x100))
+
+# Signed value of each displacement byte
+_disp = [v - 0x100 if v & 0x80 else v for v in range(0x100)]
+
+# Indices of registers in the register list. B to A are numbered as in
+# the disassemblers' _r tables, with F in place of (HL).
+_B, _C, _D, _E, _H, _L, _F, _A, _SP, _IFF, _I, _R, _IM = list(range(13))
+
+# Offset of the Z80 alternate register set from the main one
+_alt = 13
+
+# (high, low) register indices of the register pairs numbered as in the
+# disassemblers' _rp and _rp2 tables; SP is handled separately
+_pairs  = [(_B, _C), (_D, _E), (_H, _L), None]
+_pairs2 = [(_B, _C), (_D, _E), (_H, _L), (_A, _F)]
+
+
+class _stop(Exception):
+    """Raised by an instruction handler to stop emulation."""
+
+    def __init__(self, pc, reason):
+        Exception.__init__(self)
+        self.pc     = pc
+        self.reason = reason
+
+
+class port_script(object):
+    """Values returned by successive reads of one input port."""
+
+    def __init__(self, values, repeat=False):
+        """Keyword arguments:
+        values -- Non-empty list of byte values.
+        repeat -- Repeat the values, rather than returning the last one from then on.
+        """
+
+        self.values = list(values)
+        self.repeat = repeat
+        self.n      = 0
+
+    def read(self):
+        """Return the next value."""
+
+        if self.n < len(self.values):
+            value = self.values[self.n]
+            self.n = self.n + 1
+            if self.repeat and (self.n == len(self.values)):
+                self.n = 0
+            return value
+        return self.values[-1]
+
+
+def read_io_script(f, filename='<io script>'):
+    """Read an I/O script.
+
+    Keyword arguments:
+    f        -- Open text file or other iterable of lines.
+    filename -- Name used in error messages.
+
+    Returns:
+    Dictionary of port number -> port_script.
+    """
+
+    scripts = {}
+    for lineno, line in enumerate(f, 1):
+        for mark in '#;':
+            line = line.split(mark, 1)[0]
+        fields = line.split()
+        if not fields:
+            continue
+        where = '{:s}:{:d}'.format(filename, lineno)
+        try:
+            repeat = fields[-1] == 'repeat'
+            if repeat:
+                fields = fields[:-1]
+            if (fields[0] != 'in') or (len(fields) < 3):
+                raise ValueError('expected: in PORT VALUE [VALUE ...] [repeat]')
+            port   = annotations.parse_number(fields[1])
+            values = [annotations.parse_number(field) for field in fields[2:]]
+            if not all(0 <= value <= 0xFF for value in [port] + values):
+                raise ValueError('port and values must be bytes')
+        except ValueError as e:
+            raise ValueError('{:s}: {:s}: {:s}'.format(where, str(e), line.strip()))
+        scripts[port] = port_script(values, repeat)
+    return scripts
+
+
+class emulator(object):
+    """Emulated CPU, memory and I/O ports for one ROM image.
+
+    Every address executed is recorded in executed_map, one byte per
+    address of the 64K address space.
+    """
+
+    def __init__(self, rom, ram=None, io=None):
+        """Create emulator for a ROM image.
+
+        Keyword arguments:
+        rom -- Object derived from rom_base whose emulation attribute is
+               '8080', '8085' or 'z80'.
+        ram -- List of (start, end) address spans of RAM, or None for
+               every address outside the ROM image.
+        io  -- Dictionary of port number -> port_script, as from read_io_script().
+        """
+
+        if rom.emulation not in ('8080', '8085', 'z80'):
+            raise ValueError('No emulator for {:s}.'.format(str(rom.description)))
+        if rom.max_address > 0xFFFF:
+            raise ValueError('ROM image extends beyond 64K address space.')
+
+        self.rom  = rom
+        self.io   = {} if io is None else io
+        self.mem  = bytearray(b'\xFF' * 0x10000)
+        self.writable = bytearray(0x10000)
+        if ram is None:
+            self.mem      = bytearray(0x10000)
+            self.writable = bytearray(b'\x01' * 0x10000)
+        else:
+            for start, end in ram:
+                self.mem[start:end + 1]      = bytes(end - start + 1)
+                self.writable[start:end + 1] = b'\x01' * (end - start + 1)
+        lo, hi = rom.base_address, rom.max_address + 1
+        self.mem[lo:hi]      = bytes(rom.rom)
+        self.writable[lo:hi] = bytes(hi - lo)
+
+        self.regs = [0] * (2*_alt)
+        self.regs[_SP] = 0xFFFF
+        self.pc   = 0
+        self.executed_map = bytearray(0x10000)
+        self.n_executed   = 0
+        self.stop_reason  = None
+        self.outputs      = {}  # Port number -> number of writes
+        self.ops = self._build(rom.emulation)
+
+    def _io_in(self, port):
+        """Return value read from an input port."""
+
+        script = self.io.get(port)
+        return 0xFF if script is None else script.read()
+
+    def _io_out(self, port, value):
+        """Record a write to an output port."""
+
+        self.outputs[port] = self.outputs.get(port, 0) + 1
+
+    def _build(self, cpu):
+        """Return list of 256 instruction handlers for opcodes of a CPU.
+
+        Each handler takes the address of the instruction and returns the
+        address of the next one, or raises _stop.
+        """
+
+        r, mem, wr = self.regs, self.mem, self.writable
+        io_in, io_out = self._io_in, self._io_out
+        z80 = cpu == 'z80'
+        sz, szp, disp = _sz, _szp, _disp
+
+        def invalid(pc):
+            raise _stop(pc, stop_invalid)
+
+        def read16(a):
+            return mem[a] | (mem[(a + 1) & 0xFFFF] << 8)
+
+        def write8(a, v):
+            if wr[a]:
+                mem[a] = v
+
+        def write16(a, v):
+            if wr[a]:
+                mem[a] = v & 0xFF
+            a = (a + 1) & 0xFFFF
+            if wr[a]:
+                mem[a] = v >> 8
+
+        def push(v):
+            sp = (r[_SP] - 2) & 0xFFFF
+            r[_SP] = sp
+            write16(sp, v)
+
+        def pop():
+            sp = r[_SP]
+            r[_SP] = (sp + 2) & 0xFFFF
+            return read16(sp)
+
+        self._push = push
+
+        # 8-bit arithmetic and logic, setting flags. Sign, zero and carry
+        # are the same on all three CPUs; the Z80 has overflow where the
+        # 8080 has parity after arithmetic, and a subtract flag.
+        if z80:
+            def add(v, c):
+                a = r[_A]
+                res = a + v + c
+                r[_F] = sz[res & 0xFF] | (res >> 8) | ((a ^ v ^ res) & _fh) \
+                        | (((a ^ v ^ 0x80) & (a ^ res) & 0x80) >> 5)
+                r[_A] = res & 0xFF
+
+            def sub(v, c):
+                a = r[_A]
+                res = a - v - c
+                r[_F] = sz[res & 0xFF] | ((res >> 8) & _fc) | ((a ^ v ^ res) & _fh) \
+                        | (((a ^ v) & (a ^ res) & 0x80) >> 5) | _fn
+                return res & 0xFF
+
+            def ana(v):
+                r[_A] = res = r[_A] & v
+                r[_F] = szp[res] | _fh
+        else:
+            def add(v, c):
+                a = r[_A]
+                res = a + v + c
+                r[_F] = szp[res & 0xFF] | (res >> 8) | ((a ^ v ^ res) & _fh)
+                r[_A] = res & 0xFF
+
+            def sub(v, c):
+                a = r[_A]
+                res = a - v - c
+                r[_F] = szp[res & 0xFF] | ((res >> 8) & _fc) | (~(a ^ v ^ res) & _fh)
+                return res & 0xFF
+
+            def ana(v):
+                a = r[_A]
+                r[_A] = res = a & v
+                r[_F] = szp[res] | (((a | v) & 0x08) << 1)
+
+        def alu_add(v):
+            add(v, 0)
+
+        def alu_adc(v):
+            add(v, r[_F] & _fc)
+
+        def alu_sub(v):
+            r[_A] = sub(v, 0)
+
+        def alu_sbc(v):
+            r[_A] = sub(v, r[_F] & _fc)
+
+        def alu_xra(v):
+            r[_A] = res = r[_A] ^ v
+            r[_F] = szp[res]
+
+        def alu_ora(v):
+            r[_A] = res = r[_A] | v
+            r[_F] = szp[res]
+
+        def alu_cmp(v):
+            sub(v, 0)
+
+        alu = [alu_add, alu_adc, alu_sub, alu_sbc, ana, alu_xra, alu_ora, alu_cmp]
+
+        def inc8(v):
+            res = (v + 1) & 0xFF
+            f = (r[_F] & _fc) | (_fh if (res & 0x0F) == 0 else 0)
+            r[_F] = f | ((sz[res] | (_fp if res == 0x80 else 0)) if z80 else szp[res])
+            return res
+
+        def dec8(v):
+            res = (v - 1) & 0xFF
+            if z80:
+                r[_F] = (r[_F] & _fc) | (_fh if (res & 0x0F) == 0x0F else 0) | sz[res] \
+                        | (_fp if res == 0x7F else 0) | _fn
+            else:
+                r[_F] = (r[_F] & _fc) | (_fh if (res & 0x0F) != 0x0F else 0) | szp[res]
+            return res
+
+        def get_pair(p):
+            if p == 3:
+                return r[_SP]
+            hi, lo = _pairs[p]
+            return (r[hi] << 8) | r[lo]
+
+        def set_pair(p, v):
+            if p == 3:
+                r[_SP] = v
+            else:
+                hi, lo = _pairs[p]
+                r[hi] = v >> 8
+                r[lo] = v & 0xFF
+
+        env = dict(locals())
+        ops = [self._handler(cpu, opcode, env) for opcode in range(0x100)]
+
+        if z80:
+            cb = [self._cb_handler(opcode, env) for opcode in range(0x100)]
+            ed = [self._ed_handler(opcode, env) for opcode in range(0x100)]
+
+            def prefix_cb(pc):
+                return cb[mem[pc + 1]](pc)
+
+            def prefix_ed(pc):
+                return ed[mem[pc + 1]](pc)
+
+            ops[0xCB] = prefix_cb
+            ops[0xED] = prefix_ed
+        return ops
+
+    def _handler(self, cpu, opcode, env):
+        """Return handler for an unprefixed opcode."""
+
+        r, mem, wr = env['r'], env['mem'], env['wr']
+        read16, write8, write16 = env['read16'], env['write8'], env['write16']
+        push, pop = env['push'], env['pop']
+        get_pair, set_pair = env['get_pair'], env['set_pair']
+        inc8, dec8, alu = env['inc8'], env['dec8'], env['alu']
+        io_in, io_out = env['io_in'], env['io_out']
+        szp, disp, invalid = env['szp'], env['disp'], env['invalid']
+        z80 = cpu == 'z80'
+        x = (opcode >> 6) & 0x03
+        y = (opcode >> 3) & 0x07
+        z = opcode & 0x07
+        p = y >> 1
+        q = y & 0x01
+
+        if x == 1:
+            if (y == 6) and (z == 6):
+                def op(pc):
+                    raise _stop(pc, stop_halt)
+            elif z == 6:
+                def op(pc, d=y):
+                    r[d] = mem[(r[_H] << 8) | r[_L]]
+                    return pc + 1
+            elif y == 6:
+                def op(pc, s=z):
+                    write8((r[_H] << 8) | r[_L], r[s])
+                    return pc + 1
+            else:
+                def op(pc, d=y, s=z):
+                    r[d] = r[s]
+                    return pc + 1
+            return op
+
+        if x == 2:
+            if z == 6:
+                def op(pc, f=alu[y]):
+                    f(mem[(r[_H] << 8) | r[_L]])
+                    return pc + 1
+            else:
+                def op(pc, f=alu[y], s=z):
+                    f(r[s])
+                    return pc + 1
+            return op
+
+        if x == 0:
+            if z == 0:
+                if y == 0:
+                    def op(pc):
+                        return pc + 1
+                elif not z80:
+                    if (cpu == '8085') and (y == 4):
+                        # RIM: no interrupts pending or masked
+                        def op(pc):
+                            r[_A] = 0x00
+                            return pc + 1
+                    elif (cpu == '8085') and (y == 6):
+                        # SIM
+                        def op(pc):
+                            return pc + 1
+                    else:
+                        op = invalid
+                elif y == 1:
+                    # EX AF, AF'
+                    def op(pc):
+                        r[_A], r[_A + _alt] = r[_A + _alt], r[_A]
+                        r[_F], r[_F + _alt] = r[_F + _alt], r[_F]
+                        return pc + 1
+                elif y == 2:
+                    # DJNZ
+                    def op(pc):
+                        r[_B] = b = (r[_B] - 1) & 0xFF
+                        if b:
+                            return (pc + 2 + disp[mem[pc + 1]]) & 0xFFFF
+                        return pc + 2
+                elif y == 3:
+                    # JR
+                    def op(pc):
+                        return (pc + 2 + disp[mem[pc + 1]]) & 0xFFFF
+                else:
+                    # JR cc
+                    def op(pc, cond=_cond[y - 4]):
+                        if r[_F] & cond[0] == cond[1]:
+                            return (pc + 2 + disp[mem[pc + 1]]) & 0xFFFF
+                        return pc + 2
+                return op
+
+            if z == 1:
+                if q == 0:
+                    def op(pc, p=p):
+                        set_pair(p, mem[pc + 1] | (mem[pc + 2] << 8))
+                        return pc + 3
+                else:
+                    def op(pc, p=p):
+                        hl = ((r[_H] << 8) | r[_L]) + get_pair(p)
+                        r[_F] = (r[_F] & ~(_fc | _fn)) | (hl >> 16)
+                        r[_H] = (hl >> 8) & 0xFF
+                        r[_L] = hl & 0xFF
+                        return pc + 1
+                return op
+
+            if z == 2:
+                if p < 2:
+                    hi, lo = _pairs[p]
+                    if q == 0:
+                        def op(pc, hi=hi, lo=lo):
+                            write8((r[hi] << 8) | r[lo], r[_A])
+                            return pc + 1
+                    else:
+                        def op(pc, hi=hi, lo=lo):
+                            r[_A] = mem[(r[hi] << 8) | r[lo]]
+                            return pc + 1
+                elif p == 2:
+                    if q == 0:
+                        def op(pc):
+                            write16(mem[pc + 1] | (mem[pc + 2] << 8), (r[_H] << 8) | r[_L])
+                            return pc + 3
+                    else:
+                        def op(pc):
+                            v = read16(mem[pc + 1] | (mem[pc + 2] << 8))
+                            r[_H] = v >> 8
+                            r[_L] = v & 0xFF
+                            return pc + 3
+                else:
+                    if q == 0:
+                        def op(pc):
+                            write8(mem[pc + 1] | (mem[pc + 2] << 8), r[_A])
+                            return pc + 3
+                    else:
+                        def op(pc):
+                            r[_A] = mem[mem[pc + 1] | (mem[pc + 2] << 8)]
+                            return pc + 3
+                return op
+
+            if z == 3:
+                step = 1 if q == 0 else 0xFFFF
+                def op(pc, p=p, step=step):
+                    set_pair(p, (get_pair(p) + step) & 0xFFFF)
+                    return pc + 1
+                return op
+
+            if z in (4, 5):
+                f = inc8 if z == 4 else dec8
+                if y == 6:
+                    def op(pc, f=f):
+                        a = (r[_H] << 8) | r[_L]
+                        write8(a, f(mem[a]))
+                        return pc + 1
+                else:
+                    def op(pc, f=f, d=y):
+                        r[d] = f(r[d])
+                        return pc + 1
+                return op
+
+            if z == 6:
+                if y == 6:
+                    def op(pc):
+                        write8((r[_H] << 8) | r[_L], mem[pc + 1])
+                        return pc + 2
+                else:
+                    def op(pc, d=y):
+                        r[d] = mem[pc + 1]
+                        return pc + 2
+                return op
+
+            # z == 7: rotates and flag operations
+            keep = ~(_fc | _fh | _fn) if z80 else ~_fc
+            if y == 0:
+                def op(pc):
+                    a = r[_A]
+                    c = a >> 7
+                    r[_A] = ((a << 1) | c) & 0xFF
+                    r[_F] = (r[_F] & keep) | c
+                    return pc + 1
+            elif y == 1:
+                def op(pc):
+                    a = r[_A]
+                    c = a & 1
+                    r[_A] = (a >> 1) | (c << 7)
+                    r[_F] = (r[_F] & keep) | c
+                    return pc + 1
+            elif y == 2:
+                def op(pc):
+                    a = r[_A]
+                    r[_A] = ((a << 1) | (r[_F] & _fc)) & 0xFF
+                    r[_F] = (r[_F] & keep) | (a >> 7)
+                    return pc + 1
+            elif y == 3:
+                def op(pc):
+                    a = r[_A]
+                    r[_A] = (a >> 1) | ((r[_F] & _fc) << 7)
+                    r[_F] = (r[_F] & keep) | (a & 1)
+                    return pc + 1
+            elif y == 4:
+                # DAA
+                def op(pc):
+                    a, f = r[_A], r[_F]
+                    corr, c = 0, f & _fc
+                    if (f & _fh) or ((a & 0x0F) > 9):
+                        corr = 0x06
+                    if c or (a > 0x99):
+                        corr, c = corr | 0x60, _fc
+                    res = ((a - corr) if (f & _fn) else (a + corr)) & 0xFF
+                    r[_A] = res
+                    r[_F] = szp[res] | c | ((a ^ res) & _fh) | (f & _fn)
+                    return pc + 1
+            elif y == 5:
+                # CMA
+                def op(pc):
+                    r[_A] = r[_A] ^ 0xFF
+                    if z80:
+                        r[_F] = r[_F] | _fh | _fn
+                    return pc + 1
+            elif y == 6:
+                # STC
+                def op(pc):
+                    r[_F] = (r[_F] & keep) | _fc
+                    return pc + 1
+            else:
+                # CMC
+                def op(pc):
+                    c = r[_F] & _fc
+                    r[_F] = (r[_F] & keep) | (c ^ _fc) | ((c << 4) if z80 else 0)
+                    return pc + 1
+            return op
+
+        # x == 3
+        if z == 0:
+            def op(pc, cond=_cond[y]):
+                if r[_F] & cond[0] == cond[1]:
+                    return pop()
+                return pc + 1
+            return op
+
+        if z == 1:
+            if q == 0:
+                hi, lo = _pairs2[p]
+                def op(pc, hi=hi, lo=lo):
+                    v = pop()
+                    r[hi] = v >> 8
+                    r[lo] = v & 0xFF
+                    return pc + 1
+            elif p == 0:
+                def op(pc):
+                    return pop()
+            elif p == 1:
+                if not z80:
+                    return invalid
+                # EXX
+                def op(pc):
+                    for n in (_B, _C, _D, _E, _H, _L):
+                        r[n], r[n + _alt] = r[n + _alt], r[n]
+                    return pc + 1
+            elif p == 2:
+                def op(pc):
+                    return (r[_H] << 8) | r[_L]
+            else:
+                def op(pc):
+                    r[_SP] = (r[_H] << 8) | r[_L]
+                    return pc + 1
+            return op
+
+        if z == 2:
+            def op(pc, cond=_cond[y]):
+                if r[_F] & cond[0] == cond[1]:
+                    return mem[pc + 1] | (mem[pc + 2] << 8)
+                return pc + 3
+            return op
+
+        if z == 3:
+            if y == 0:
+                def op(pc):
+                    return mem[pc + 1] | (mem[pc + 2] << 8)
+            elif y == 1:
+                # CB prefix on the Z80, installed by _build()
+                op = invalid
+            elif y == 2:
+                def op(pc):
+                    io_out(mem[pc + 1], r[_A])
+                    return pc + 2
+            elif y == 3:
+                def op(pc):
+                    r[_A] = io_in(mem[pc + 1])
+                    return pc + 2
+            elif y == 4:
+                def op(pc):
+                    sp = r[_SP]
+                    v = read16(sp)
+                    write16(sp, (r[_H] << 8) | r[_L])
+                    r[_H] = v >> 8
+                    r[_L] = v & 0xFF
+                    return pc + 1
+            elif y == 5:
+                def op(pc):
+                    r[_D], r[_H] = r[_H], r[_D]
+                    r[_E], r[_L] = r[_L], r[_E]
+                    return pc + 1
+            elif y == 6:
+                def op(pc):
+                    r[_IFF] = 0
+                    return pc + 1
+            else:
+                def op(pc):
+                    r[_IFF] = 1
+                    return pc + 1
+            return op
+
+        if z == 4:
+            def op(pc, cond=_cond[y]):
+                if r[_F] & cond[0] == cond[1]:
+                    push(pc + 3)
+                    return mem[pc + 1] | (mem[pc + 2] << 8)
+                return pc + 3
+            return op
+
+        if z == 5:
+            if q == 0:
+                hi, lo = _pairs2[p]
+                def op(pc, hi=hi, lo=lo):
+                    push((r[hi] << 8) | r[lo])
+                    return pc + 1
+            elif p == 0:
+                def op(pc):
+                    push(pc + 3)
+                    return mem[pc + 1] | (mem[pc + 2] << 8)
+            else:
+                # DD, ED and FD prefixes; ED is installed by _build() on the Z80
+                op = invalid
+            return op
+
+        if z == 6:
+            def op(pc, f=alu[y]):
+                f(mem[pc + 1])
+                return pc + 2
+            return op
+
+        # z == 7: RST
+        def op(pc, target=8*y):
+            push(pc + 1)
+            return target
+        return op
+
+    def _cb_handler(self, opcode, env):
+        """Return handler for a Z80 CB-prefixed opcode."""
+
+        r, mem, write8, szp = env['r'], env['mem'], env['write8'], env['szp']
+        x = (opcode >> 6) & 0x03
+        y = (opcode >> 3) & 0x07
+        z = opcode & 0x07
+
+        if z == 6:
+            def get():
+                return mem[(r[_H] << 8) | r[_L]]
+
+            def put(v):
+                write8((r[_H] << 8) | r[_L], v)
+        else:
+            def get(z=z):
+                return r[z]
+
+            def put(v, z=z):
+                r[z] = v
+
+        if x == 0:
+            def op(pc, y=y):
+                v = get()
+                c = r[_F] & _fc
+                if y == 0:
+                    c, v = v >> 7, ((v << 1) | (v >> 7)) & 0xFF
+                elif y == 1:
+                    c, v = v & 1, (v >> 1) | ((v & 1) << 7)
+                elif y == 2:
+                    c, v = v >> 7, ((v << 1) | c) & 0xFF
+                elif y == 3:
+                    c, v = v & 1, (v >> 1) | (c << 7)
+                elif y == 4:
+                    c, v = v >> 7, (v << 1) & 0xFF
+                elif y == 5:
+                    c, v = v & 1, (v >> 1) | (v & 0x80)
+                elif y == 6:
+                    c, v = v >> 7, ((v << 1) | 1) & 0xFF
+                else:
+                    c, v = v & 1, v >> 1
+                put(v)
+                r[_F] = szp[v] | c
+                return pc + 2
+        elif x == 1:
+            def op(pc, bit=1 << y):
+                v = get() & bit
+                r[_F] = (r[_F] & _fc) | _fh | (0 if v else (_fz | _fp)) | (v & _fs)
+                return pc + 2
+        elif x == 2:
+            def op(pc, mask=0xFF ^ (1 << y)):
+                put(get() & mask)
+                return pc + 2
+        else:
+            def op(pc, bit=1 << y):
+                put(get() | bit)
+                return pc + 2
+        return op
+
+    def _ed_handler(self, opcode, env):
+        """Return handler for a Z80 ED-prefixed opcode."""
+
+        r, mem = env['r'], env['mem']
+        read16, write8, write16 = env['read16'], env['write8'], env['write16']
+        pop, get_pair, set_pair = env['pop'], env['get_pair'], env['set_pair']
+        io_in, io_out = env['io_in'], env['io_out']
+        sz, szp, sub, invalid = env['sz'], env['szp'], env['sub'], env['invalid']
+        x = (opcode >> 6) & 0x03
+        y = (opcode >> 3) & 0x07
+        z = opcode & 0x07
+        p = y >> 1
+        q = y & 0x01
+
+        if x == 1:
+            if z == 0:
+                def op(pc, d=y):
+                    v = io_in(r[_C])
+                    if d != 6:
+                        r[d] = v
+                    r[_F] = (r[_F] & _fc) | szp[v]
+                    return pc + 2
+            elif z == 1:
+                def op(pc, s=y):
+                    io_out(r[_C], 0 if s == 6 else r[s])
+                    return pc + 2
+            elif z == 2:
+                def op(pc, p=p, q=q):
+                    hl, v, c = (r[_H] << 8) | r[_L], get_pair(p), r[_F] & _fc
+                    res = (hl + v + c) if q else (hl - v - c)
+                    out = res & 0xFFFF
+                    sign = (hl ^ v ^ 0x8000) if q else (hl ^ v)
+                    r[_F] = ((out >> 8) & _fs) | (0 if out else _fz) | ((res >> 16) & _fc) \
+                            | (((sign & (hl ^ res) & 0x8000) >> 13)) | (0 if q else _fn)
+                    r[_H] = out >> 8
+                    r[_L] = out & 0xFF
+                    return pc + 2
+            elif z == 3:
+                if q == 0:
+                    def op(pc, p=p):
+                        write16(mem[pc + 2] | (mem[pc + 3] << 8), get_pair(p))
+                        return pc + 4
+                else:
+                    def op(pc, p=p):
+                        set_pair(p, read16(mem[pc + 2] | (mem[pc + 3] << 8)))
+                        return pc + 4
+            elif z == 4:
+                # NEG
+                def op(pc):
+                    a = r[_A]
+                    r[_A] = 0
+                    r[_A] = sub(a, 0)
+                    return pc + 2
+            elif z == 5:
+                # RETN, RETI
+                def op(pc):
+                    return pop()
+            elif z == 6:
+                def op(pc, mode=(0, 0, 1, 2, 0, 0, 1, 2)[y]):
+                    r[_IM] = mode
+                    return pc + 2
+            elif y == 0:
+                def op(pc):
+                    r[_I] = r[_A]
+                    return pc + 2
+            elif y == 1:
+                def op(pc):
+                    r[_R] = r[_A]
+                    return pc + 2
+            elif y in (2, 3):
+                # LD A, I and LD A, R; R is not counted, so it stands still
+                def op(pc, s=_I if y == 2 else _R):
+                    r[_A] = v = r[s]
+                    r[_F] = (r[_F] & _fc) | sz[v] | (_fp if r[_IFF] else 0)
+                    return pc + 2
+            elif y in (4, 5):
+                # RRD and RLD
+                def op(pc, left=(y == 5)):
+                    a = (r[_H] << 8) | r[_L]
+                    m, acc = mem[a], r[_A]
+                    if left:
+                        write8(a, ((m << 4) | (acc & 0x0F)) & 0xFF)
+                        acc = (acc & 0xF0) | (m >> 4)
+                    else:
+                        write8(a, ((acc << 4) | (m >> 4)) & 0xFF)
+                        acc = (acc & 0xF0) | (m & 0x0F)
+                    r[_A] = acc
+                    r[_F] = (r[_F] & _fc) | szp[acc]
+                    return pc + 2
+            else:
+                def op(pc):
+                    return pc + 2
+            return op
+
+        if (x == 2) and (z <= 3) and (y >= 4):
+            step   = 1 if (y & 1) == 0 else 0xFFFF
+            repeat = y >= 6
+
+            if z == 0:
+                # LDI, LDD, LDIR, LDDR
+                def op(pc, step=step, repeat=repeat):
+                    hl, de, bc = (r[_H] << 8) | r[_L], (r[_D] << 8) | r[_E], (r[_B] << 8) | r[_C]
+                    while True:
+                        write8(de, mem[hl])
+                        hl, de, bc = (hl + step) & 0xFFFF, (de + step) & 0xFFFF, (bc - 1) & 0xFFFF
+                        if (not repeat) or (bc == 0):
+                            break
+                    r[_H], r[_L], r[_D], r[_E] = hl >> 8, hl & 0xFF, de >> 8, de & 0xFF
+                    r[_B], r[_C] = bc >> 8, bc & 0xFF
+                    r[_F] = (r[_F] & (_fs | _fz | _fc)) | (_fp if bc else 0)
+                    return pc + 2
+            elif z == 1:
+                # CPI, CPD, CPIR, CPDR
+                def op(pc, step=step, repeat=repeat):
+                    hl, bc, c = (r[_H] << 8) | r[_L], (r[_B] << 8) | r[_C], r[_F] & _fc
+                    while True:
+                        res = sub(mem[hl], 0)
+                        hl, bc = (hl + step) & 0xFFFF, (bc - 1) & 0xFFFF
+                        if (not repeat) or (bc == 0) or (res == 0):
+                            break
+                    r[_H], r[_L], r[_B], r[_C] = hl >> 8, hl & 0xFF, bc >> 8, bc & 0xFF
+                    r[_F] = (r[_F] & ~(_fp | _fc)) | (_fp if bc else 0) | c
+                    return pc + 2
+            elif z == 2:
+                # INI, IND, INIR, INDR
+                def op(pc, step=step, repeat=repeat):
+                    hl = (r[_H] << 8) | r[_L]
+                    while True:
+                        write8(hl, io_in(r[_C]))
+                        hl = (hl + step) & 0xFFFF
+                        r[_B] = (r[_B] - 1) & 0xFF
+                        if (not repeat) or (r[_B] == 0):
+                            break
+                    r[_H], r[_L] = hl >> 8, hl & 0xFF
+                    r[_F] = (r[_F] & _fc) | sz[r[_B]] | _fn
+                    return pc + 2
+            else:
+                # OUTI, OUTD, OTIR, OTDR
+                def op(pc, step=step, repeat=repeat):
+                    hl = (r[_H] << 8) | r[_L]
+                    while True:
+                        r[_B] = (r[_B] - 1) & 0xFF
+                        io_out(r[_C], mem[hl])
+                        hl = (hl + step) & 0xFFFF
+                        if (not repeat) or (r[_B] == 0):
+                            break
+                    r[_H], r[_L] = hl >> 8, hl & 0xFF
+                    r[_F] = (r[_F] & _fc) | sz[r[_B]] | _fn
+                    return pc + 2
+            return op
+
+        return invalid
+
+    def _run(self, pc, count):
+        """Execute up to count instructions from pc.
+
+        Returns:
+        Tuple of (next pc, number of instructions executed, stop reason or None).
+        """
+
+        ops, mem, executed = self.ops, self.mem, self.executed_map
+        n = 0
+        try:
+            for n in range(count):
+                executed[pc] = 1
+                pc = ops[mem[pc]](pc)
+            return (pc, count, None)
+        except _stop as e:
+            return (e.pc, n, e.reason)
+        except IndexError:
+            # Instruction or operand runs past the top of memory
+            return (pc, n, stop_range)
+
+    def run(self, entry=0, budget=1000000, interrupt=None):
+        """Run from an entry address.
+
+        Keyword arguments:
+        entry     -- Address to start at.
+        budget    -- Maximum number of instructions to execute.
+        interrupt -- If specified, (period, address) tuple: every period
+                     instructions, if interrupts are enabled, call address
+                     as an interrupt handler. A halted CPU waits for the
+                     next interrupt.
+
+        Returns:
+        Reason emulation stopped: one of the stop_* codes.
+        """
+
+        pc, remaining, reason = entry, budget, stop_budget
+        while remaining > 0:
+            count = remaining if interrupt is None else min(remaining, interrupt[0])
+            pc, n, reason = self._run(pc, count)
+            self.n_executed = self.n_executed + n
+            remaining = remaining - n
+            if reason is stop_halt:
+                if (interrupt is None) or not self.regs[_IFF]:
+                    break
+                remaining = remaining - (count - n)
+                pc = pc + 1
+            elif reason is not None:
+                break
+            if (interrupt is not None) and self.regs[_IFF]:
+                self.regs[_IFF] = 0
+                self._push(pc)
+                pc = interrupt[1]
+            reason = stop_budget
+        self.pc          = pc
+        self.stop_reason = reason
+        return reason
+
+    def executed(self):
+        """Return sorted list of executed addresses within the ROM image."""
+
+        lo, hi = self.rom.base_address, self.rom.max_address + 1
+        return [lo + idx for idx, flag in enumerate(self.executed_map[lo:hi]) if flag]
+
+
+def apply(rom, emu, create_labels=True, breakpoints=[]):
+    """Disassemble from the addresses executed by an emulator.
+
+    Each executed address within the ROM which is not yet an instruction
+    is passed to disassemble() in address order; disassembling one
+    usually classifies those following it.
+
+    Keyword arguments:
+    rom           -- Object derived from rom_base, usually after disassemble().
+    emu           -- emulator which has run this ROM.
+    create_labels -- As for disassemble().
+    breakpoints   -- As for disassemble().
+
+    Returns:
+    List of addresses passed to disassemble() as entries.
+    """
+
+    entries = []
+    for address in emu.executed():
+        if rom.data_type[address - rom.base_address] is not rom_base.type_instruction:
+            rom.disassemble(entries=[address], create_labels=create_labels,
+                            breakpoints=breakpoints)
+            entries.append(address)
+    return entries
+
+
+def report(emu):
+    """Return text summary of an emulation run."""
+
+    executed = emu.executed()
+    text = '; Emulation: {:d} instructions, stopped by {:s} at {:s}.\n'.format(
+        emu.n_executed, stop_names[emu.stop_reason], emu.rom.format_address(emu.pc))
+    text = text + '; {:d} ROM addresses executed.\n'.format(len(executed))
+    for port in sorted(emu.outputs):
+        text = text + '; Port {:s}: {:d} writes.\n'.format(util.hex8_intel(port), emu.outputs[port])
+    return text
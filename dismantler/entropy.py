@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Map the entropy and byte distribution of a ROM image.
+
+The image is divided into blocks of step bytes, and each block is
+characterized by a window of window bytes centered on it:
+
+    fill   -- One byte value makes up most of the window.
+    text   -- Printable ASCII, CR and LF make up most of the window.
+    high   -- Shannon entropy of the window is close to that of random
+              bytes, as in compressed or encrypted data. Machine code
+              for 8-bit CPUs is well below it.
+    normal -- Anything else, such as code and ordinary data.
+
+Consecutive blocks of the same kind are merged into regions. Regions of
+high entropy can be classified as data, and excluded from disassembly,
+before traversal begins.
+
+Example:
+    regions = dismantler.entropy.regions(data, base_address)
+    sys.stdout.write(dismantler.entropy.report(regions))
+"""
+
+import collections
+import math
+
+from . import util
+
+# Kinds of region
+kind_fill, kind_text, kind_normal, kind_high = list(range(4))
+
+kind_names = ['FILL', 'TEXT', 'NORMAL', 'HIGH']
+
+# Window and block sizes in bytes
+window = 256
+step   = 64
+
+# Entropy in bits per byte at or above which a window is high entropy.
+# Random bytes give about 7.2 over a 256-byte window.
+high_entropy = 6.9
+
+# Fraction of a window made up of one value for fill, or of text characters for text
+fill_fraction = 0.9
+text_fraction = 0.9
+
+_text_bytes = bytes(range(0x20, 0x7F)) + b'\r\n'
+
+
+def _entropy(counts, n):
+    """Return Shannon entropy in bits per byte of byte counts totalling n."""
+
+    if n == 0:
+        return 0.0
+    return max(0.0, math.log(n, 2) - sum(c*math.log(c, 2) for c in counts)/n)
+
+
+def entropy_map(data, window=window, step=step):
+    """Characterize each block of an image.
+
+    Keyword arguments:
+    data   -- Binary image.
+    window -- Number of bytes in the window centered on each block.
+    step   -- Number of bytes in each block.
+
+    Returns:
+    List of (offset, kind, entropy) tuples, one per block.
+    """
+
+    data   = bytes(data)
+    margin = max(0, (window - step) // 2)
+    blocks = []
+    for offset in range(0, len(data), step):
+        lo = max(0, min(offset - margin, len(data) - window))
+        chunk  = data[lo:lo + window]
+        counts = collections.Counter(chunk)
+        n      = len(chunk)
+        value  = _entropy(counts.values(), n)
+        if counts.most_common(1)[0][1] >= fill_fraction*n:
+            kind = kind_fill
+        elif n - len(chunk.translate(None, _text_bytes)) >= text_fraction*n:
+            kind = kind_text
+        elif value >= high_entropy:
+            kind = kind_high
+        else:
+            kind = kind_normal
+        blocks.append((offset, kind, value))
+    return blocks
+
+
+def regions(data, base_address=0, window=window, step=step):
+    """Return the regions of an image.
+
+    Keyword arguments:
+    data         -- Binary image.
+    base_address -- Address of first byte of image.
+    window       -- As for entropy_map().
+    step         -- As for entropy_map().
+
+    Returns:
+    List of (start address, end address, kind, mean entropy) tuples in
+    address order.
+    """
+
+    runs = []  # [start, end, kind, entropy total, number of blocks]
+    for offset, kind, value in entropy_map(data, window, step):
+        end = base_address + min(offset + step, len(data)) - 1
+        if runs and (runs[-1][2] is kind):
+            runs[-1][1] = end
+            runs[-1][3] = runs[-1][3] + value
+            runs[-1][4] = runs[-1][4] + 1
+        else:
+            runs.append([base_address + offset, end, kind, value, 1])
+    return [(start, end, kind, total/count) for start, end, kind, total, count in runs]
+
+
+def high_spans(regions, min_length=window):
+    """Return (start, end) addresses of high-entropy regions at least min_length bytes long."""
+
+    return [(start, end) for start, end, kind, value in regions
+            if (kind is kind_high) and (end - start + 1 >= min_length)]
+
+
+def report(regions, format_address=None):
+    """Return text table of regions.
+
+    Keyword arguments:
+    regions        -- List of regions from regions().
+    format_address -- Function formatting an address, such as a rom
+                      object's format_address(). Default is util.hex_intel().
+    """
+
+    if format_address is None:
+        format_address = util.hex_intel
+    text = '; Entropy map:\n;\n'
+    text = text + '; {:>8s} {:>8s} {:>7s} {:6s} {:>7s}\n'.format('Start', 'End', 'Bytes', 'Kind', 'Entropy')
+    for start, end, kind, value in regions:
+        text = text + '; {:>8s} {:>8s} {:7d} {:6s} {:7.2f}\n'.format(
+            format_address(start), format_address(end), end - start + 1, kind_names[kind], value)
+    return text
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Basic blocks and control flow graph of a disassembled ROM image.
+
+Example:
+    rom.disassemble()
+    graph = dismantler.flowgraph.flowgraph(rom)
+    for start, end, n_insns in graph.blocks():
+        ...
+"""
+
+import array
+import bisect
+import json
+
+from . import rom_base
+
+# Kinds of control flow edge:
+# edge_fall: Execution continues with the following instruction,
+#            including the return address of a call (after any
+#            inline arguments).
+# edge_jump: Jump or branch to a computed destination.
+# edge_call: Subroutine call.
+
+edge_fall, edge_jump, edge_call = list(range(3))
+
+edge_names = ['FALL', 'JUMP', 'CALL']
+
+
+class flowgraph(object):
+    """Basic blocks and control flow edges, stored in compact integer arrays.
+
+    Blocks are numbered in address order. Block i spans addresses
+    block_start[i] to block_end[i] (the address of its last instruction),
+    occupies block_size[i] bytes and contains block_insns[i] instructions.
+    Its outgoing edges are edge_dest[j] and edge_kind[j] for
+    edge_first[i] <= j < edge_first[i+1].
+    Edge destinations are addresses; edge_block[j] is the index of the
+    destination block, or -1 if the destination is not a block start.
+    """
+
+    def __init__(self, rom):
+        """Build basic blocks and edges from a disassembled ROM.
+
+        Keyword arguments:
+        rom -- Object derived from rom_base, after disassemble() has been called.
+        """
+
+        self.rom = rom
+        base      = rom.base_address
+        data_type = rom.data_type
+        rom_len   = rom.rom_len
+
+        # Collect instructions in address order with their lengths
+        insn_addrs = array.array('l')
+        insn_lens  = array.array('l')
+        idx = 0
+        while idx < rom_len:
+            n = 1
+            if (data_type[idx] in (rom_base.type_instruction, rom_base.type_error)) \
+               and ((idx + base) in rom.successors):
+                while ((idx + n) < rom_len) and (data_type[idx + n] is rom_base.type_operand):
+                    n = n + 1
+                insn_addrs.append(idx + base)
+                insn_lens.append(n)
+            idx = idx + n
+        insn_set = set(insn_addrs)
+
+        # Classify the edges of each instruction, and find block leaders
+        leaders = set(rom.entry_addrs)
+        leaders.update(rom.vector_dests)
+        leaders.update(rom.xref)
+        insn_edges = []
+        for address, length in zip(insn_addrs, insn_lens):
+            edges = []
+            call_dest = rom.call_sites.get(address)
+            resume    = rom.resume_addrs.get(address, address + length)
+            for dest in rom.successors[address]:
+                if dest == call_dest:
+                    kind = edge_call
+                elif dest == resume:
+                    kind = edge_fall
+                else:
+                    kind = edge_jump
+                if kind is not edge_fall:
+                    leaders.add(dest)
+                edges.append((dest, kind))
+            insn_edges.append(edges)
+
+        # Split instruction stream into blocks
+        self.block_start = array.array('l')
+        self.block_end   = array.array('l')
+        self.block_insns = array.array('l')
+        self.block_size  = array.array('l')
+        self.edge_first  = array.array('l')
+        self.edge_dest   = array.array('l')
+        self.edge_kind   = bytearray()
+
+        in_block = False
+        for address, length, edges in zip(insn_addrs, insn_lens, insn_edges):
+            if (not in_block) or (address in leaders):
+                if in_block:
+                    # Previous block falls through into this leader
+                    self.edge_first.append(len(self.edge_dest))
+                    self.edge_dest.append(address)
+                    self.edge_kind.append(edge_fall)
+                self.block_start.append(address)
+                self.block_end.append(address)
+                self.block_insns.append(0)
+                self.block_size.append(0)
+                in_block = True
+            self.block_end[-1]   = address
+            self.block_insns[-1] = self.block_insns[-1] + 1
+            self.block_size[-1]  = self.block_size[-1] + length
+
+            next_addr = address + length
+            if (edges != [(next_addr, edge_fall)]) or (next_addr not in insn_set):
+                # Control transfer, halt, or fall into something not decoded
+                self.edge_first.append(len(self.edge_dest))
+                for dest, kind in edges:
+                    self.edge_dest.append(dest)
+                    self.edge_kind.append(kind)
+                in_block = False
+        if in_block:
+            self.edge_first.append(len(self.edge_dest))
+        self.edge_first.append(len(self.edge_dest))
+
+        self.block_index = dict((start, i) for i, start in enumerate(self.block_start))
+        self.edge_block  = array.array('l', [self.block_index.get(dest, -1) for dest in self.edge_dest])
+
+    def __len__(self):
+        return len(self.block_start)
+
+    def blocks(self):
+        """Iterate over blocks as (start, end, number of instructions) tuples."""
+
+        return zip(self.block_start, self.block_end, self.block_insns)
+
+    def block_edges(self, block):
+        """Iterate over outgoing edges of a block as (dest, kind) tuples.
+
+        Keyword arguments:
+        block -- Block index.
+        """
+
+        lo, hi = self.edge_first[block], self.edge_first[block + 1]
+        return zip(self.edge_dest[lo:hi], self.edge_kind[lo:hi])
+
+    def edges(self):
+        """Iterate over all edges as (source block start, dest, kind) tuples."""
+
+        for block, start in enumerate(self.block_start):
+            for dest, kind in self.block_edges(block):
+                yield (start, dest, kind)
+
+    def block_at(self, address):
+        """Return index of the block containing address, or None."""
+
+        i = bisect.bisect_right(self.block_start, address) - 1
+        if (i >= 0) and (address <= self.block_end[i]):
+            return i
+        return None
+
+    def _name(self, address):
+        """Return label or hex string for address."""
+
+        return self.rom.label_map.get(address, self.rom.format_address(address))
+
+    def to_dot(self):
+        """Return control flow graph in Graphviz DOT format."""
+
+        lines = ['digraph cfg {', '  node [shape=box, fontname="monospace"];']
+        for start, end, n_insns in self.blocks():
+            lines.append('  "{:04X}" [label="{:s}\\n{:04X}-{:04X} ({:d})"];'.format(
+                start, self._name(start), start, end, n_insns))
+        styles = ['solid', 'bold', 'dashed']
+        for start, dest, kind in self.edges():
+            lines.append('  "{:04X}" -> "{:04X}" [style={:s}];'.format(start, dest, styles[kind]))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """Return control flow graph as a JSON string."""
+
+        blocks = []
+        for block, (start, end, n_insns) in enumerate(self.blocks()):
+            blocks.append({'start': start, 'end': end, 'instructions': n_insns,
+                           'label': self.rom.label_map.get(start),
+                           'edges': [{'dest': dest, 'kind': edge_names[kind]}
+                                     for dest, kind in self.block_edges(block)]})
+        return json.dumps({'blocks': blocks}, indent=1) + '\n'
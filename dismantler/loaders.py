@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Loaders for raw binary, Intel HEX and Motorola S-record images.
+
+Every loader returns a tuple of (segments, start), where segments is a
+list of (address, bytearray) tuples in address order and start is the
+start address given in the file, or None. Hex files are parsed line by
+line in one streaming pass; consecutive records are appended in place
+to the current segment, so a dump with scattered records yields one
+segment per contiguous run. Record checksums are verified, and errors
+raise ValueError naming the file and line.
+
+Images of several chips, such as even/odd byte-interleaved pairs or
+low/high halves, are merged with combine().
+
+Images may also be read straight out of zip archives, one member at a
+time, without extracting them to disk.
+
+Example:
+    with open('rom.hex', 'rb') as f:
+        segments, start = dismantler.loaders.load(f, 'rom.hex')
+    for member in dismantler.loaders.archive_members('board.zip', '*.bin'):
+        segments, start = dismantler.loaders.load_member('board.zip', member)
+"""
+
+import fnmatch
+import io
+import os
+import zipfile
+
+# Image formats
+formats = ['binary', 'ihex', 'srec']
+
+# File name extensions of each format; anything else is raw binary
+extensions = {'.hex': 'ihex', '.ihx': 'ihex', '.ihex': 'ihex', '.h86': 'ihex', '.a43': 'ihex',
+              '.s19': 'srec', '.s28': 'srec', '.s37': 'srec', '.srec': 'srec',
+              '.mot': 'srec', '.sx': 'srec'}
+
+# Intel HEX extended address and start record types -> number of data bytes
+_ihex_extended = {0x02: 2, 0x03: 4, 0x04: 2, 0x05: 4}
+
+# S-record data record types -> number of address bytes
+_srec_data  = {'1': 2, '2': 3, '3': 4}
+_srec_start = {'9': 2, '8': 3, '7': 4}
+
+
+def format_for(name):
+    """Return image format implied by a file name's extension."""
+
+    return extensions.get(os.path.splitext(name)[1].lower(), 'binary')
+
+
+class _segment_builder(object):
+    """Collect data records into segments, extending the current one in place."""
+
+    def __init__(self):
+        self.segments = []     # [address, bytearray] in order of creation
+        self._end     = None   # Address following the current segment
+
+    def add(self, address, data):
+        if address == self._end:
+            self.segments[-1][1] += data
+        else:
+            self.segments.append([address, bytearray(data)])
+        self._end = address + len(data)
+
+    def result(self):
+        """Return segments in address order, merging any which are adjacent or overlap."""
+
+        merged = []
+        for address, data in sorted(self.segments, key=lambda segment: segment[0]):
+            if merged and (address <= merged[-1][0] + len(merged[-1][1])):
+                start, run = merged[-1]
+                offset = address - start
+                run[offset:offset + len(data)] = data
+            else:
+                merged.append((address, data))
+        return merged
+
+
+def _record_bytes(text, where):
+    """Return bytes of a hex record body, raising ValueError if malformed."""
+
+    try:
+        return bytes.fromhex(text)
+    except ValueError:
+        raise ValueError('{:s}: invalid hex digits'.format(where))
+
+
+def parse_ihex(lines, name='<ihex>'):
+    """Parse Intel HEX records.
+
+    Keyword arguments:
+    lines -- Iterable of lines, as bytes or str.
+    name  -- File name used in error messages.
+
+    Returns:
+    Tuple of (segments, start address or None).
+    """
+
+    builder = _segment_builder()
+    upper   = 0     # Extended segment or linear address
+    start   = None
+    for lineno, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('ascii', 'replace')
+        line = line.strip()
+        if not line:
+            continue
+        where = '{:s}:{:d}'.format(name, lineno)
+        if line[0] != ':':
+            raise ValueError('{:s}: record does not begin with ":"'.format(where))
+        record = _record_bytes(line[1:], where)
+        if (len(record) < 5) or (len(record) != record[0] + 5):
+            raise ValueError('{:s}: record length mismatch'.format(where))
+        if sum(record) & 0xFF:
+            raise ValueError('{:s}: checksum error'.format(where))
+        count, kind = record[0], record[3]
+        offset      = (record[1] << 8) | record[2]
+        data        = record[4:4 + count]
+        if (kind in _ihex_extended) and (count != _ihex_extended[kind]):
+            raise ValueError('{:s}: bad extended address record'.format(where))
+        if kind == 0x00:
+            builder.add(upper + offset, data)
+        elif kind == 0x01:
+            break
+        elif kind == 0x02:
+            upper = ((data[0] << 8) | data[1]) << 4
+        elif kind == 0x04:
+            upper = ((data[0] << 8) | data[1]) << 16
+        elif kind == 0x03:
+            start = (((data[0] << 8) | data[1]) << 4) + ((data[2] << 8) | data[3])
+        elif kind == 0x05:
+            start = (data[0] << 24) | (data[1] << 16) | (data[2] << 8) | data[3]
+        else:
+            raise ValueError('{:s}: unknown record type {:02X}'.format(where, kind))
+    return (builder.result(), start)
+
+
+def parse_srec(lines, name='<srec>'):
+    """Parse Motorola S-records.
+
+    Keyword arguments:
+    lines -- Iterable of lines, as bytes or str.
+    name  -- File name used in error messages.
+
+    Returns:
+    Tuple of (segments, start address or None).
+    """
+
+    builder = _segment_builder()
+    start   = None
+    for lineno, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('ascii', 'replace')
+        line = line.strip()
+        if not line:
+            continue
+        where = '{:s}:{:d}'.format(name, lineno)
+        if (line[0] not in 'Ss') or (len(line) < 4):
+            raise ValueError('{:s}: record does not begin with "S"'.format(where))
+        kind   = line[1]
+        record = _record_bytes(line[2:], where)
+        if len(record) != record[0] + 1:
+            raise ValueError('{:s}: record length mismatch'.format(where))
+        if (sum(record) & 0xFF) != 0xFF:
+            raise ValueError('{:s}: checksum error'.format(where))
+        if kind in _srec_data:
+            n = _srec_data[kind]
+            builder.add(int.from_bytes(record[1:1 + n], 'big'), record[1 + n:-1])
+        elif kind in _srec_start:
+            n = _srec_start[kind]
+            start = int.from_bytes(record[1:1 + n], 'big')
+        elif kind not in '0456':
+            raise ValueError('{:s}: unknown record type S{:s}'.format(where, kind))
+    return (builder.result(), start)
+
+
+def load(f, name=None, fmt=None):
+    """Load an image from an open binary file.
+
+    Keyword arguments:
+    f    -- File object opened in binary mode.
+    name -- File name, used to choose the format and in error messages.
+            Defaults to f.name.
+    fmt  -- One of formats. If not specified, chosen by file name extension.
+
+    Returns:
+    Tuple of (segments, start address or None).
+    """
+
+    if name is None:
+        name = getattr(f, 'name', '<image>')
+    if fmt is None:
+        fmt = format_for(name)
+    if fmt == 'ihex':
+        return parse_ihex(f, name)
+    if fmt == 'srec':
+        return parse_srec(f, name)
+    if fmt == 'binary':
+        return ([(0, bytearray(f.read()))], None)
+    raise ValueError('Unknown image format {:s}'.format(fmt))
+
+
+def is_archive(name):
+    """Return True if a file name names a zip archive."""
+
+    return os.path.splitext(name)[1].lower() == '.zip'
+
+
+def archive_members(archive, pattern='*'):
+    """Return sorted names of archive members matching a shell-style pattern.
+
+    Keyword arguments:
+    archive -- Path or open binary file of a zip archive, or a ZipFile.
+    pattern -- Pattern matched against the full member name, e.g. '*.bin'.
+    """
+
+    if isinstance(archive, zipfile.ZipFile):
+        names = archive.namelist()
+    else:
+        with zipfile.ZipFile(archive) as z:
+            names = z.namelist()
+    return sorted(name for name in names
+                  if (not name.endswith('/')) and fnmatch.fnmatchcase(name, pattern))
+
+
+def load_member(archive, member, fmt=None):
+    """Load an image from one member of a zip archive, reading it into memory.
+
+    Keyword arguments:
+    archive -- Path or open binary file of a zip archive, or a ZipFile.
+    member  -- Member name.
+    fmt     -- As for load(), chosen by the member name's extension if not specified.
+
+    Returns:
+    Tuple of (segments, start address or None).
+    """
+
+    if isinstance(archive, zipfile.ZipFile):
+        data = archive.read(member)
+        where = '{:s}:{:s}'.format(archive.filename or '<zip>', member)
+    else:
+        with zipfile.ZipFile(archive) as z:
+            data = z.read(member)
+            where = '{:s}:{:s}'.format(z.filename or '<zip>', member)
+    if fmt is None:
+        fmt = format_for(member)
+    if fmt == 'binary':
+        return ([(0, bytearray(data))], None)
+    return load(io.BytesIO(data), where, fmt)
+
+
+def flatten(segments, fill=0xFF):
+    """Return (address, bytearray) of one contiguous image, filling holes.
+
+    A single segment is returned without copying.
+    """
+
+    if len(segments) == 1:
+        return segments[0]
+    if not segments:
+        return (0, bytearray())
+    base = segments[0][0]
+    end  = segments[-1][0] + len(segments[-1][1])
+    image = bytearray([fill]) * (end - base)
+    for address, data in segments:
+        image[address - base:address - base + len(data)] = data
+    return (base, image)
+
+
+def combine(images, interleave=True):
+    """Merge images of several chips into one contiguous image.
+
+    Keyword arguments:
+    images     -- List of (address, bytearray) chip images, e.g. from flatten().
+                  Their addresses are ignored, except that of the first.
+    interleave -- If True, chips supply successive bytes in turn (even/odd
+                  for a pair), and must all be the same size. Otherwise
+                  they are concatenated, e.g. low then high half.
+
+    Returns:
+    Tuple of (address of first image, combined bytearray).
+    """
+
+    if len(images) == 1:
+        return images[0]
+    base  = images[0][0]
+    total = sum(len(data) for address, data in images)
+    if not interleave:
+        image = bytearray(total)
+        offset = 0
+        for address, data in images:
+            image[offset:offset + len(data)] = data
+            offset = offset + len(data)
+        return (base, image)
+
+    n = len(images)
+    if any(len(data) != len(images[0][1]) for address, data in images):
+        raise ValueError('Interleaved chip images differ in size.')
+    image = bytearray(total)
+    for k, (address, data) in enumerate(images):
+        image[k::n] = data
+    return (base, image)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Inference of subroutines which never return.
+
+Error handlers, jumps to reset and similar routines never return to
+their caller, so the bytes following a call to them are usually data
+rather than code. A subroutine may return if a return instruction is
+reachable from its entry, where the fall-through after a call is only
+followed if the called subroutine may itself return. This is solved as
+a least fixpoint over the control flow graph.
+
+Once non-returning subroutines are known, disassembly is redone without
+following the fall-through of calls to them, and the analysis repeated
+until no more are found.
+"""
+
+from . import flowgraph
+from . import rom_base
+
+
+def _return_blocks(graph):
+    """Return set of indices of blocks containing an instruction which may return.
+
+    A conditional return does not end its block, so any instruction of a
+    block may be a return site.
+    """
+
+    blocks = set()
+    for site in graph.rom.return_sites:
+        block = graph.block_at(site)
+        if block is not None:
+            blocks.add(block)
+    return blocks
+
+
+def _may_return(graph, entry, returns, analyzed, return_blocks):
+    """Return True if a return is reachable from a subroutine entry.
+
+    Keyword arguments:
+    graph         -- flowgraph object.
+    entry         -- Entry address of subroutine.
+    returns       -- Set of subroutine entries already known to return.
+    analyzed      -- Set of subroutine entries being analyzed. Calls to any
+                     other address are assumed to return.
+    return_blocks -- Set of blocks containing a return, from _return_blocks().
+    """
+
+    edge_first, edge_block, edge_dest, edge_kind = \
+        graph.edge_first, graph.edge_block, graph.edge_dest, graph.edge_kind
+
+    start = graph.block_index[entry]
+    seen  = set([start])
+    work  = [start]
+    while work:
+        block = work.pop()
+        if block in return_blocks:
+            return True
+        lo, hi = edge_first[block], edge_first[block + 1]
+
+        # Fall-through after a call to a subroutine not known to return is cut
+        cut_fall = False
+        for j in range(lo, hi):
+            if edge_kind[j] is flowgraph.edge_call:
+                callee = edge_dest[j]
+                if (callee in analyzed) and (callee not in returns):
+                    cut_fall = True
+
+        for j in range(lo, hi):
+            kind = edge_kind[j]
+            if (kind is flowgraph.edge_call) or (cut_fall and (kind is flowgraph.edge_fall)):
+                continue
+            dest_block = edge_block[j]
+            if dest_block < 0:
+                # Flow leaves decoded code; assume the worst
+                return True
+            if dest_block not in seen:
+                seen.add(dest_block)
+                work.append(dest_block)
+    return False
+
+
+def find_no_return(graph):
+    """Return set of called subroutine entries from which no return is reachable.
+
+    Keyword arguments:
+    graph -- flowgraph object for a disassembled ROM.
+    """
+
+    analyzed = set(dest for dest in graph.rom.call_sites.values()
+                   if dest in graph.block_index)
+    returns  = set()
+    blocks   = _return_blocks(graph)
+    changed  = True
+    while changed:
+        changed = False
+        for entry in sorted(analyzed - returns):
+            if _may_return(graph, entry, returns, analyzed, blocks):
+                returns.add(entry)
+                changed = True
+    return analyzed - returns
+
+
+def disassemble(rom, max_passes=8, **kwargs):
+    """Disassemble ROM, inferring and honoring non-returning subroutines.
+
+    Subroutines already in rom.no_return, such as user-declared ones,
+    are kept. Each one found gets a NO_RETURN diagnostic.
+
+    Keyword arguments:
+    rom        -- Object derived from rom_base, not yet disassembled.
+    max_passes -- Maximum number of times to redo disassembly.
+    Other keyword arguments are passed to rom.disassemble().
+
+    Returns:
+    Set of entry addresses of non-returning subroutines.
+    """
+
+    state = rom.save_state()
+    for n in range(max_passes):
+        rom.disassemble(**kwargs)
+        found = find_no_return(flowgraph.flowgraph(rom))
+        if (found <= rom.no_return) or (n == max_passes - 1):
+            break
+        rom.no_return = rom.no_return | found
+        rom.restore_state(state)
+
+    for entry in sorted(rom.no_return):
+        if (entry >= rom.base_address) and (entry <= rom.max_address):
+            rom._diagnose(rom_base.diag_no_return, entry)
+    return rom.no_return
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Lazy registry of supported CPU types.
+
+CPU modules are only imported when their key is first looked up, so that
+listing CPUs or printing help does not pay for importing every decoder.
+Third-party CPU modules may register themselves through the
+'dismantler.cpus' entry point group, naming the class derived from
+rom_base, for example:
+
+    entry_points={'dismantler.cpus': ['6502 = mypackage.rom_6502:rom_6502']}
+"""
+
+import importlib
+import sys
+
+# Entry point group searched for third-party CPU modules
+entry_point_group = 'dismantler.cpus'
+
+# Built-in CPU types: key -> (module name, class name, description).
+# The description is duplicated here so that CPUs can be listed without
+# importing their decoders; it must match the class description attribute.
+builtin_cpus = {'1802': ('dismantler.rom_1802', 'rom_1802', 'RCA CDP1802 COSMAC'),
+                '8080': ('dismantler.rom_8080', 'rom_8080', 'Intel 8080'),
+                '8085': ('dismantler.rom_8085', 'rom_8085', 'Intel 8085'),
+                'z80':  ('dismantler.rom_z80',  'rom_z80',
+                         'Zilog Z80 (DD and FD prefixed instructions not implemented yet)')}
+
+_plugins = None   # key -> (entry point, description), once discovered
+_classes = {}     # key -> imported class
+
+
+def _entry_points():
+    """Return list of entry points in the dismantler.cpus group."""
+
+    try:
+        from importlib import metadata
+    except ImportError:
+        return []
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=entry_point_group))
+    return list(eps.get(entry_point_group, []))
+
+
+def plugins():
+    """Return dictionary of third-party CPU types, discovering them on first use.
+
+    Returns:
+    Dictionary of key -> (entry point, description). Built-in keys take
+    precedence and are never shadowed by plugins."""
+
+    global _plugins
+    if _plugins is None:
+        _plugins = {}
+        for ep in _entry_points():
+            if (ep.name in builtin_cpus) or (ep.name in _plugins):
+                continue
+            description = None
+            dist = getattr(ep, 'dist', None)
+            if dist is not None:
+                description = dist.metadata['Summary']
+            if not description:
+                description = ep.value
+            _plugins[ep.name] = (ep, description)
+    return _plugins
+
+
+def keys():
+    """Return sorted list of all known CPU type keys."""
+
+    return sorted(list(builtin_cpus.keys()) + list(plugins().keys()))
+
+
+def is_known(key):
+    """Return True if key names a built-in or plugin CPU type."""
+
+    return (key in builtin_cpus) or (key in plugins())
+
+
+def description(key):
+    """Return description of a CPU type without importing its module."""
+
+    if key in builtin_cpus:
+        return builtin_cpus[key][2]
+    return plugins()[key][1]
+
+
+def cpu_class(key):
+    """Return the class derived from rom_base for a CPU type, importing it if needed."""
+
+    if key not in _classes:
+        if key in builtin_cpus:
+            modname, clsname, desc = builtin_cpus[key]
+            cls = getattr(importlib.import_module(modname), clsname)
+        elif key in plugins():
+            cls = plugins()[key][0].load()
+        else:
+            raise KeyError(key)
+        _classes[key] = cls
+    return _classes[key]
+
+
+def cpu_module(key):
+    """Return the module defining a CPU type, importing it if needed."""
+
+    return sys.modules[cpu_class(key).__module__]
+
+
+class lazy_map(object):
+    """Read-only dictionary keyed by CPU type, loading values on demand.
+
+    Membership tests and iteration only consult registry metadata; the
+    CPU module is imported when a value is first requested.
+    """
+
+    def __init__(self, getter):
+        """Lazy map constructor.
+
+        Keyword arguments:
+        getter -- Function taking a CPU type key and returning its value.
+        """
+
+        self._getter = getter
+        self._cache  = {}
+
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if not is_known(key):
+                raise KeyError(key)
+            self._cache[key] = self._getter(key)
+        return self._cache[key]
+
+    def __contains__(self, key):
+        return is_known(key)
+
+    def __iter__(self):
+        return iter(keys())
+
+    def __len__(self):
+        return len(keys())
+
+    def keys(self):
+        return keys()
+
+    def values(self):
+        return [self[key] for key in keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in keys()]
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
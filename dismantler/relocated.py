@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Code which is copied out of ROM and executed at another address.
+
+Boot code often copies a block of ROM into RAM and runs it there. A
+relocated_image declares such blocks as regions: the bytes at a ROM
+range are analyzed as if located at their runtime address, by a
+separate CPU object viewing the ROM through a memoryview, so nothing is
+copied. Control flow from the ROM into a region's runtime addresses is
+followed into the region and vice versa, with cross-references recorded
+on both sides, and labels created on one side are shared with the side
+which defines the address.
+
+The ROM bytes of each region are classified as data in the ROM itself,
+with a comment pointing to the runtime address.
+
+Example:
+    image = dismantler.relocated.relocated_image(rom)
+    image.add_region(0x1000, 0x13FF, 0xC000)
+    image.disassemble(entries=[0x0000])
+    sys.stdout.write(image.listing())
+"""
+
+from . import rom_base
+from . import segments
+from . import util
+
+
+class region(object):
+    """ROM range executed at a different runtime address."""
+
+    def __init__(self, rom_start, rom_end, runtime, rom):
+        """Region constructor.
+
+        Keyword arguments:
+        rom_start -- ROM address of first byte.
+        rom_end   -- ROM address of last byte.
+        runtime   -- Runtime address of first byte.
+        rom       -- Object derived from rom_base, analyzing the region at runtime addresses.
+        """
+
+        self.rom_start = rom_start
+        self.rom_end   = rom_end
+        self.runtime   = runtime
+        self.rom       = rom
+        self.name      = rom.format_address(runtime)
+
+    def to_runtime(self, address):
+        """Return runtime address of a ROM address within the region."""
+
+        return address - self.rom_start + self.runtime
+
+    def to_rom(self, address):
+        """Return ROM address of a runtime address within the region."""
+
+        return address - self.runtime + self.rom_start
+
+
+class relocated_image(object):
+    """ROM image with ranges which execute at other addresses."""
+
+    def __init__(self, rom):
+        """Relocated image constructor.
+
+        Keyword arguments:
+        rom -- Object derived from rom_base for the whole ROM image.
+        """
+
+        self.rom          = rom
+        self.regions      = []  # region objects, in the order declared
+        self.region_hooks = []  # Functions called with each newly created region's rom object
+        self._scanned     = {}  # rom object -> number of successors already followed
+
+    def add_region(self, start, end, runtime):
+        """Declare that ROM bytes from start to end execute at runtime address.
+
+        Keyword arguments:
+        start   -- ROM address of first byte.
+        end     -- ROM address of last byte.
+        runtime -- Runtime address of first byte.
+
+        Returns:
+        The new region object.
+        """
+
+        rom = self.rom
+        if (start < rom.base_address) or (end > rom.max_address) or (end < start):
+            raise ValueError('Relocated range {:s}..{:s} is not within ROM.'.format(
+                rom.format_address(start), rom.format_address(end)))
+        lo   = start - rom.base_address
+        view = memoryview(rom.rom)[lo:lo + end - start + 1]
+        reloc_rom = type(rom)(rom=view, base_address=runtime,
+                              label_map=dict(rom.label_map), port_map=rom.port_map)
+        reloc_rom.address_width = rom.address_width
+        reloc = region(start, end, runtime, reloc_rom)
+        if self._owner(runtime) is not None or self._owner(reloc_rom.max_address) is not None:
+            # Runtime addresses shadow other code; keep automatic labels distinct
+            reloc_rom.label_qualifier = 'R{:0{:d}X}'.format(runtime, util.hex_digits(rom.address_width))
+        self.regions.append(reloc)
+
+        # From the ROM's point of view, the region is data copied elsewhere
+        rom.set_data8_range(start, end)
+        rom.comments[lo] += 'Executes at {:s}. '.format(rom.format_address(runtime))
+        reloc_rom.comments[0] += 'Copied from ROM {:s}. '.format(rom.format_address(start))
+
+        for hook in self.region_hooks:
+            hook(reloc_rom)
+        return reloc
+
+    def _owner(self, address, exclude=None):
+        """Return the rom object whose address range contains address, or None.
+
+        Regions take precedence over the ROM, since they are only reached
+        by flow which has left the ROM or another region.
+        """
+
+        for reloc in self.regions:
+            rom = reloc.rom
+            if (rom is not exclude) and (address >= rom.base_address) and (address <= rom.max_address):
+                return rom
+        rom = self.rom
+        if (rom is not exclude) and (address >= rom.base_address) and (address <= rom.max_address):
+            return rom
+        return None
+
+    def region_at(self, address):
+        """Return the region whose ROM range contains address, or None."""
+
+        for reloc in self.regions:
+            if (address >= reloc.rom_start) and (address <= reloc.rom_end):
+                return reloc
+        return None
+
+    def region_running_at(self, address):
+        """Return the region whose runtime range contains address, or None."""
+
+        for reloc in self.regions:
+            if (address >= reloc.rom.base_address) and (address <= reloc.rom.max_address):
+                return reloc
+        return None
+
+    def disassemble(self, entries=[0], create_labels=True, breakpoints=[],
+                    vectors=[], vector_tables=[]):
+        """Disassemble the ROM and every region reachable from it.
+
+        Keyword arguments are as for rom_base.disassemble(). Entries are
+        ROM addresses, or runtime addresses of a region. Breakpoints,
+        vectors and vector tables are ROM addresses, and do not apply to
+        the regions.
+        """
+
+        pending = {}  # rom object -> list of entries to visit
+        order   = [self.rom] + [reloc.rom for reloc in self.regions]
+
+        for address in entries:
+            if (address >= self.rom.base_address) and (address <= self.rom.max_address):
+                owner = self.rom
+            else:
+                owner = self._owner(address)
+            if owner is not None:
+                pending.setdefault(owner, []).append(address)
+        pending.setdefault(self.rom, [])
+        kwargs = {self.rom: {'vectors': vectors, 'vector_tables': vector_tables}}
+
+        while pending:
+            rom   = min(pending, key=order.index)
+            batch = pending.pop(rom)
+            rom.disassemble(entries=batch, create_labels=create_labels,
+                            breakpoints=(breakpoints if rom is self.rom else []),
+                            **kwargs.pop(rom, {}))
+
+            self._scanned[rom] = segments.follow_exits(rom, self._scanned.get(rom, 0), self._owner,
+                                                       pending, create_labels)
+
+        segments.share_labels(order, self._owner)
+
+    def filter_diagnostics(self, **kwargs):
+        """Return list of diagnostics from the ROM and all regions.
+
+        Keyword arguments are passed to rom_base.filter_diagnostics().
+        """
+
+        diags = self.rom.filter_diagnostics(**kwargs)
+        for reloc in self.regions:
+            diags = diags + reloc.rom.filter_diagnostics(**kwargs)
+        return diags
+
+    def diagnostic_report(self, max_lines=None, min_severity=rom_base.severity_info):
+        """Return diagnostic reports of the ROM and all regions.
+
+        Keyword arguments are as for rom_base.diagnostic_report().
+        """
+
+        report = self.rom.diagnostic_report(max_lines, min_severity)
+        for reloc in self.regions:
+            report = report + '; Relocated region at {:s}:\n'.format(reloc.name)
+            report = report + reloc.rom.diagnostic_report(max_lines, min_severity)
+        return report
+
+    def listing(self, source=False):
+        """Return listing of the ROM followed by each region at its runtime address.
+
+        Keyword arguments:
+        source -- If True, output assembler source format.
+        """
+
+        listing_str = self.rom.listing(source=source)
+        for reloc in self.regions:
+            listing_str = listing_str + '; Relocated region: ROM {:s}..{:s} executes at {:s}\n\n'.format(
+                self.rom.format_address(reloc.rom_start), self.rom.format_address(reloc.rom_end),
+                reloc.name)
+            listing_str = listing_str + reloc.rom.listing(source=source)
+        return listing_str
@@ -45,12 +45,27 @@ _opCx = ['LBR',  'LBQ',  'LBZ',  'LBDF', 'NOP',  'LSNQ', 'LSNZ', 'LSNF',
 _opFx = ['LDX',  'OR',   'AND',  'XOR',  'ADD',  'SD',   'SHR',  'SM',
          'LDI',  'ORI',  'ANI',  'XRI',  'ADI',  'SDI',  'SHL',  'SMI']
 
+# Clock cycles of each opcode: eight per machine cycle, two machine
+# cycles per instruction and three for long branches and skips (Cx),
+# whether or not their condition is met
+_cycles = bytes(24 if (op & 0xF0) == 0xC0 else 16 for op in range(0x100))
+
 class rom_1802(rom_base.rom_base):
     """ROM image containing RCA CDP1802 code to be disassembled."""
 
 
     description = 'RCA CDP1802 COSMAC'
 
+    # Words are stored MSB first, as in long branch operands
+    big_endian = True
+
+    # Length in bytes of the longest instruction
+    max_insn_length = 3
+
+    # Clock cycles of each opcode
+    cycle_table       = _cycles
+    cycle_table_taken = _cycles
+
     # Pre-defined names for special auto-created labels
     special_labels = default_labels
 
@@ -76,23 +91,23 @@ class rom_1802(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
         self._set_data8_intel(address, access_addr)
 
     def set_data16(self, address, access_addr=None):
-        """Classify location as 16-bit little-endian data, Intel format.
+        """Classify location as 16-bit big-endian data, Intel format.
 
         Keyword arguments:
-        address     -- Address of LSB location to reclassify.
+        address     -- Address of MSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
-        self._set_data16_le_intel(address, access_addr)
+        self._set_data16_be_intel(address, access_addr)
 
 
     def set_vector(self, address, access_addr=None):
@@ -103,16 +118,95 @@ class rom_1802(rom_base.rom_base):
         desired.
 
         Keyword arguments:
-        address     -- Address of LSB location to reclassify.
+        address     -- Address of MSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
 
         Returns:
         Address contained at specified location.
         """
 
-        return self._set_vector16_le_intel(address, access_addr)
+        return self._set_vector16_be_intel(address, access_addr)
+
+    def set_data8_range(self, start, end, access_addr=None):
+        """Classify range of locations as 8-bit data, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data8_range_intel(start, end, access_addr)
+
+
+    def set_data16_array(self, address, count, access_addr=None):
+        """Classify array of 16-bit big-endian words as data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of MSB of first word to reclassify.
+        count       -- Number of words in the array.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data16_array_be_intel(address, count, access_addr)
+
+
+    def set_vector_table(self, address, count, access_addr=None):
+        """Classify table of pointers to executable code and return their contents.
+
+        Keyword arguments:
+        address     -- Address of MSB of first vector to reclassify.
+        count       -- Number of vectors in the table.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        List of addresses contained in the table.
+        """
+
+        return self._set_vector16_table_be_intel(address, count, access_addr)
+
+
+    def set_strings(self, address, count=1, terminator=0x00, end=None, access_addr=None):
+        """Classify run of terminated strings as text, Intel format.
+
+        Keyword arguments:
+        address     -- Address of first character of first string.
+        count       -- Number of consecutive strings, or None to continue
+                       until end or the end of the ROM.
+        terminator  -- Terminating byte value, or None for strings whose
+                       last character has bit 7 set.
+        end         -- If specified, address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        Address following the last classified string.
+        """
+
+        return self._set_strings_intel(address, count, terminator, end, access_addr)
+
+
+    def set_table(self, start, end, access_addr=None):
+        """Classify range of locations as a byte table, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_table_intel(start, end, access_addr)
 
     def disasm_single(self, address, create_label=True):
         """Disassemble a single instruction.
@@ -135,17 +229,17 @@ class rom_1802(rom_base.rom_base):
 
         if self.data_type[idx] is rom_base.type_operand:
             # Trying to disassemble another instruction's operand
-            self.comments[idx] += 'WARNING: Tried to disassemble an operand. '
+            self._diagnose(rom_base.diag_skip_operand, address)
             return []
 
         if self.data_type[idx] in rom_base.data_types:
             # Trying to disassemble a data byte
-            self.comments[idx] += 'WARNING: Tried to disassemble data. '
+            self._diagnose(rom_base.diag_skip_data, address)
             return []
 
         if self.data_type[idx] is rom_base.type_error:
             # Trying to disassemble an error
-            self.comments[idx] += 'WARNING: Tried to disassemble location flagged as error. '
+            self._diagnose(rom_base.diag_skip_error, address)
             return []
 
         self.data_type[idx] = rom_base.type_instruction
@@ -209,7 +303,7 @@ class rom_1802(rom_base.rom_base):
                 next_addrs = [address + 1]
             elif N == 0x8:
                 self.data_type[idx]   = rom_base.type_error
-                self.comments[idx]    += 'ERROR: Reserved Opcode '
+                self._diagnose(rom_base.diag_reserved_opcode, address)
                 next_addrs = []
             else:
                 self.disassembly[idx] = 'INP  {:s}'.format(self._lookup_port8_intel(N & 0x7, create_label))
@@ -306,7 +400,8 @@ class rom_1802(rom_base.rom_base):
 
     def disassemble(self, entries=default_entries,
                     create_labels = True, single_step=False, valid_range=None,
-                    breakpoints=[], vectors=[]):
+                    breakpoints=[], vectors=[], vector_tables=[],
+                    resolve_overlaps=False):
         """Disassemble code, starting at specified entry point address(es).
 
         Keyword arguments:
@@ -333,12 +428,20 @@ class rom_1802(rom_base.rom_base):
         vectors       -- If specified, a list of addresses which are assumed to contain
                          pointers to executable code. Pointers are subject to label creation
                          and substitution, and will be added to entries list for disassembly.
+
+        vector_tables -- If specified, a list of (address, count) tuples describing tables
+                         of vectors. All pointers in all tables are classified in bulk and
+                         added to the entries list in a single batch.
+
+        resolve_overlaps -- If True, resolve overlapping instructions once all possible
+                         starts are known, independently of the order of entries.
         """
 
         # We are just changing the default entries argument value here, to default
         # to the RST intruction destination addresses.
         return rom_base.rom_base.disassemble(self, entries, create_labels,
-                                             single_step, valid_range, breakpoints, vectors)
+                                             single_step, valid_range, breakpoints, vectors,
+                                             vector_tables, resolve_overlaps)
     
 
     def listing(self, source=False):
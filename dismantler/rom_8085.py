@@ -42,12 +42,49 @@ default_entries = [0x00, 0x08, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38, 0x24, 0x2c, 0
 # There are no default port names
 default_ports = {}
 
+# Clock cycles (T-states) of each opcode; of conditional jumps, returns
+# and calls when the condition is not met
+_cycles = bytes([
+     4, 10,  7,  6,  4,  4,  7,  4, 10, 10,  7,  6,  4,  4,  7,  4,  # 00
+     7, 10,  7,  6,  4,  4,  7,  4, 10, 10,  7,  6,  4,  4,  7,  4,  # 10
+     4, 10, 16,  6,  4,  4,  7,  4, 10, 10, 16,  6,  4,  4,  7,  4,  # 20
+     4, 10, 13,  6, 10, 10, 10,  4, 10, 10, 13,  6,  4,  4,  7,  4,  # 30
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 40
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 50
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 60
+     7,  7,  7,  7,  7,  7,  5,  7,  4,  4,  4,  4,  4,  4,  7,  4,  # 70
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 80
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 90
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # A0
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # B0
+     6, 10,  7, 10,  9, 12,  7, 12,  6, 10,  7,  6,  9, 18,  7, 12,  # C0
+     6, 10,  7, 10,  9, 12,  7, 12,  6, 10,  7, 10,  9,  7,  7, 12,  # D0
+     6, 10,  7, 16,  9, 12,  7, 12,  6,  6,  7,  4,  9, 10,  7, 12,  # E0
+     6, 10,  7,  4,  9, 12,  7, 12,  6,  6,  7,  4,  9,  7,  7, 12   # F0
+])
+
+# Clock cycles when the condition of a jump, return or call is met
+_cycles_taken = bytes(12 if ((op & 0xC7) == 0xC0) or (op == 0xCB) else
+                      10 if ((op & 0xC7) == 0xC2) or (op in (0xDD, 0xFD)) else
+                      18 if (op & 0xC7) == 0xC4 else _cycles[op]
+                      for op in range(0x100))
+
 class rom_8085(rom_base.rom_base):
     """ROM image containing Intel 8085 code to be disassembled."""
 
 
     description = 'Intel 8085'
 
+    # Instruction set emulated by the emulate module
+    emulation = '8085'
+
+    # Length in bytes of the longest instruction
+    max_insn_length = 3
+
+    # Clock cycles of each opcode
+    cycle_table       = _cycles
+    cycle_table_taken = _cycles_taken
+
     # Pre-defined names for special auto-created labels
     special_labels = default_labels
 
@@ -73,7 +110,7 @@ class rom_8085(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
@@ -85,7 +122,7 @@ class rom_8085(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
@@ -102,7 +139,7 @@ class rom_8085(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
 
         Returns:
@@ -111,6 +148,85 @@ class rom_8085(rom_base.rom_base):
 
         return self._set_vector16_le_intel(address, access_addr)
 
+    def set_data8_range(self, start, end, access_addr=None):
+        """Classify range of locations as 8-bit data, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data8_range_intel(start, end, access_addr)
+
+
+    def set_data16_array(self, address, count, access_addr=None):
+        """Classify array of 16-bit little-endian words as data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of LSB of first word to reclassify.
+        count       -- Number of words in the array.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data16_array_le_intel(address, count, access_addr)
+
+
+    def set_vector_table(self, address, count, access_addr=None):
+        """Classify table of pointers to executable code and return their contents.
+
+        Keyword arguments:
+        address     -- Address of LSB of first vector to reclassify.
+        count       -- Number of vectors in the table.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        List of addresses contained in the table.
+        """
+
+        return self._set_vector16_table_le_intel(address, count, access_addr)
+
+
+    def set_strings(self, address, count=1, terminator=0x00, end=None, access_addr=None):
+        """Classify run of terminated strings as text, Intel format.
+
+        Keyword arguments:
+        address     -- Address of first character of first string.
+        count       -- Number of consecutive strings, or None to continue
+                       until end or the end of the ROM.
+        terminator  -- Terminating byte value, or None for strings whose
+                       last character has bit 7 set.
+        end         -- If specified, address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        Address following the last classified string.
+        """
+
+        return self._set_strings_intel(address, count, terminator, end, access_addr)
+
+
+    def set_table(self, start, end, access_addr=None):
+        """Classify range of locations as a byte table, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_table_intel(start, end, access_addr)
+
 
     def disasm_single(self, address, create_label=True):
         """Disassemble a single instruction.
@@ -133,15 +249,15 @@ class rom_8085(rom_base.rom_base):
 
         if self.data_type[idx] is rom_base.type_operand:
             # Trying to disassemble another instruction's operand
-            self.comments[idx] += 'WARNING: Disassembling an operand. '
+            self._diagnose(rom_base.diag_disasm_operand, address)
 
         if self.data_type[idx] in rom_base.data_types:
             # Trying to disassemble a data byte
-            self.comments[idx] += 'WARNING: Disassembling data. '
+            self._diagnose(rom_base.diag_disasm_data, address)
 
         if self.data_type[idx] is rom_base.type_error:
             # Trying to disassemble an error
-            self.comments[idx] += 'WARNING: Disassembling location flagged as error. '
+            self._diagnose(rom_base.diag_disasm_error, address)
 
         self.data_type[idx] = rom_base.type_instruction
         opcode     = self.rom[idx]
@@ -168,7 +284,7 @@ class rom_8085(rom_base.rom_base):
                     self.disassembly[idx] = 'SIM'
                     next_addrs = [address + 1]
                 else:
-                    self.comments[idx] += 'ERROR: invalid opcode {:s} '.format(util.hex8_intel(opcode))
+                    self._diagnose(rom_base.diag_invalid_opcode, address, None, (util.hex8_intel(opcode),))
                     self.data_type[idx] = rom_base.type_error
                     next_addrs = [address + 1]
 
@@ -284,6 +400,7 @@ class rom_8085(rom_base.rom_base):
             if z == 0:
                 # Conditional return
                 self.disassembly[idx] = 'R{:s}'.format(_cc[y])
+                self.add_return(address)
                 next_addrs = [address + 1]
 
             elif z == 1:
@@ -294,13 +411,16 @@ class rom_8085(rom_base.rom_base):
                 else:
                     if p == 0:
                         self.disassembly[idx] = 'RET'
+                        self.add_return(address)
                         next_addrs = []
                     elif p == 1:
-                        self.comments[idx] += 'ERROR: invalid opcode {:s} '.format(util.hex8_intel(opcode))
+                        self._diagnose(rom_base.diag_invalid_opcode, address, None, (util.hex8_intel(opcode),))
                         self.data_type[idx] = rom_base.type_error
                         next_addrs = []
                     elif p == 2:
                         self.disassembly[idx] = 'PCHL'
+                        # Computed jump, possibly used as a return
+                        self.add_return(address)
                         next_addrs = []
                     else:
                         self.disassembly[idx] = 'SPHL'
@@ -325,7 +445,7 @@ class rom_8085(rom_base.rom_base):
                     next_addrs = [word]
                     self.add_xref(address, word)
                 elif y == 1:
-                    self.comments[idx] += 'ERROR: invalid opcode {:s} '.format(util.hex8_intel(opcode))
+                    self._diagnose(rom_base.diag_invalid_opcode, address, None, (util.hex8_intel(opcode),))
                     self.data_type[idx] = rom_base.type_error
                     next_addrs = []
                 elif y == 2:
@@ -357,7 +477,7 @@ class rom_8085(rom_base.rom_base):
                 self.data_type[idx+2] = rom_base.type_operand
                 self.disassembly[idx] = 'C{:2s}  {:s}'.format(_cc[y], self._lookup_a16_intel(word, create_label, 'C_'))
                 next_addrs = [address + 3, word]
-                self.add_xref(address, word)
+                self.add_call(address, word)
 
             elif z == 5:
                 # PUSH and various ops
@@ -371,9 +491,9 @@ class rom_8085(rom_base.rom_base):
                         self.data_type[idx+2] = rom_base.type_operand
                         self.disassembly[idx] = 'CALL {:s}'.format(self._lookup_a16_intel(word, create_label, 'C_'))
                         next_addrs = [address + 3, word]
-                        self.add_xref(address, word)
+                        self.add_call(address, word)
                     else:
-                        self.comments[idx] += 'ERROR: invalid opcode {:s} '.format(util.hex8_intel(opcode))
+                        self._diagnose(rom_base.diag_invalid_opcode, address, None, (util.hex8_intel(opcode),))
                         self.data_type[idx] = rom_base.type_error
                         next_addrs = []
 
@@ -388,14 +508,15 @@ class rom_8085(rom_base.rom_base):
                 # Restart
                 self.disassembly[idx] = 'RST  {:d}'.format(y)
                 next_addrs = [y*8]
-                self.add_xref(address, y*8)
+                self.add_call(address, y*8)
 
         return next_addrs
 
 
     def disassemble(self, entries=default_entries,
                     create_labels = True, single_step=False, valid_range=None,
-                    breakpoints=[], vectors=[]):
+                    breakpoints=[], vectors=[], vector_tables=[],
+                    resolve_overlaps=False):
         """Disassemble code, starting at specified entry point address(es).
 
         Keyword arguments:
@@ -422,12 +543,20 @@ class rom_8085(rom_base.rom_base):
         vectors       -- If specified, a list of addresses which are assumed to contain
                          pointers to executable code. Pointers are subject to label creation
                          and substitution, and will be added to entries list for disassembly.
+
+        vector_tables -- If specified, a list of (address, count) tuples describing tables
+                         of vectors. All pointers in all tables are classified in bulk and
+                         added to the entries list in a single batch.
+
+        resolve_overlaps -- If True, resolve overlapping instructions once all possible
+                         starts are known, independently of the order of entries.
         """
 
         # We are just changing the default entries argument value here, to default
         # to the RST intruction destination addresses.
         return rom_base.rom_base.disassemble(self, entries, create_labels,
-                                             single_step, valid_range, breakpoints, vectors)
+                                             single_step, valid_range, breakpoints, vectors,
+                                             vector_tables, resolve_overlaps)
     
 
     def listing(self, source=False):
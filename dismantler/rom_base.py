@@ -21,6 +21,14 @@
 
 """Define abstract base class for ROM image to be disassembled."""
 
+import array
+import bisect
+import itertools
+import multiprocessing
+import operator
+import re
+import struct
+
 from . import util
 
 # Classifications of contents of a memory location:
@@ -30,20 +38,104 @@ from . import util
 # type_data*:       Location contains data.
 # type_vector*:     Location contains pointer to executable code.
 # type_error:       Illegal opcode found at address.
+# type_string:      Location contains 8-bit data which is part of a text string.
+# type_table:       Location contains 8-bit data which is part of a byte table.
 
 type_unknown, type_instruction, type_operand, type_data8, \
   type_data16H, type_data16L, type_vector16H, type_vector16L, \
-  type_error = list(range(9))
+  type_error, type_string, type_table = list(range(11))
 
 valid_types = [type_unknown, type_instruction, type_operand, type_data8,
                type_data16H, type_data16L, type_vector16H, type_vector16L,
-               type_error]
+               type_error, type_string, type_table]
+
+data_types  = [type_data8, type_data16H, type_data16L, type_vector16H, type_vector16L,
+               type_string, type_table]
 
-data_types  = [type_data8, type_data16H, type_data16L, type_vector16H, type_vector16L]
+# 8-bit data types which say more about a location than type_data8. Classifying
+# such a location as type_data8 leaves it unchanged, and refining type_data8
+# to one of them is not diagnosed.
+data8_types = [type_string, type_table]
 
 type_names  = ['UNKNOWN', 'INSTRUCTION', 'OPERAND', 'DATA8',
                'DATA16H', 'DATA16L', 'VECTOR16H', 'VECTOR16L',
-               'ERROR']
+               'ERROR', 'STRING', 'TABLE']
+
+# Maximum number of bytes listed on one line of a string or table
+string_line_bytes = 16
+table_line_bytes  = 8
+
+# Minimum number of locations in a chunk of a listing rendered by a worker process
+listing_chunk_bytes = 0x1000
+
+# Diagnostic severities, in increasing order of importance.
+severity_info, severity_warning, severity_error = list(range(3))
+
+severity_names = ['INFO', 'WARNING', 'ERROR']
+
+# Diagnostic codes for problems found during classification and disassembly:
+# diag_disasm_*:      Disassembly continued over a location already classified
+#                     as operand, data or error.
+# diag_skip_*:        Disassembly refused to continue over such a location.
+# diag_changed_type:  A location was reclassified to a different type.
+# diag_invalid_opcode:  Illegal opcode found at address.
+# diag_reserved_opcode: Reserved opcode found at address.
+# diag_no_return:     Subroutine was found never to return.
+# diag_overlap_rejected: A possible instruction start was not disassembled
+#                     because an overlapping instruction was preferred.
+
+diag_disasm_operand, diag_disasm_data, diag_disasm_error, \
+  diag_skip_operand, diag_skip_data, diag_skip_error, \
+  diag_changed_type, diag_invalid_opcode, diag_reserved_opcode, \
+  diag_no_return, diag_overlap_rejected = list(range(11))
+
+diag_names = ['DISASM_OPERAND', 'DISASM_DATA', 'DISASM_ERROR',
+              'SKIP_OPERAND', 'SKIP_DATA', 'SKIP_ERROR',
+              'CHANGED_TYPE', 'INVALID_OPCODE', 'RESERVED_OPCODE',
+              'NO_RETURN', 'OVERLAP_REJECTED']
+
+diag_severities = [severity_warning, severity_warning, severity_warning,
+                   severity_warning, severity_warning, severity_warning,
+                   severity_warning, severity_error, severity_error,
+                   severity_info, severity_warning]
+
+# Listing comment text for each code. Detail values are substituted
+# with str.format().
+diag_messages = ['WARNING: Disassembling an operand. ',
+                 'WARNING: Disassembling data. ',
+                 'WARNING: Disassembling location flagged as error. ',
+                 'WARNING: Tried to disassemble an operand. ',
+                 'WARNING: Tried to disassemble data. ',
+                 'WARNING: Tried to disassemble location flagged as error. ',
+                 'WARNING: Changed type {:s}->{:s}. ',
+                 'ERROR: invalid opcode {:s} ',
+                 'ERROR: Reserved Opcode ',
+                 'NOTE: Subroutine never returns. ',
+                 'WARNING: {:s} overlaps instruction at {:s}; not disassembled. ']
+
+# Provenance kinds, recording what first classified a location:
+# prov_none:      Location has not been classified, or provenance is not tracked.
+# prov_entry:     Location is an entry point.
+# prov_vector:    Location is the destination of a vector; parent is the vector address.
+# prov_successor: Location is a possible next instruction; parent is the instruction.
+# prov_operand:   Location is an operand; parent is the instruction.
+# prov_access:    Location was classified as data by an instruction; parent is the instruction.
+# prov_user:      Location was classified as data by the user.
+
+prov_none, prov_entry, prov_vector, prov_successor, prov_operand, \
+  prov_access, prov_user = list(range(7))
+
+prov_names  = ['NONE', 'ENTRY', 'VECTOR', 'SUCCESSOR', 'OPERAND', 'ACCESS', 'USER']
+
+# Kinds of inline argument following calls to a subroutine:
+# inline_bytes:       Fixed number of data bytes.
+# inline_string:      Bytes up to and including a terminator byte.
+# inline_string_bit7: Bytes up to and including one with bit 7 set.
+# inline_vectors:     Fixed number of pointers to executable code.
+
+inline_bytes, inline_string, inline_string_bit7, inline_vectors = list(range(4))
+
+inline_names = ['bytes', 'string', 'string_bit7', 'vectors']
 
 class rom_base(object):
     """Abstract base class for ROM image to be disassembled."""
@@ -55,18 +147,54 @@ class rom_base(object):
     data_type       = []  # Data type classifications of each ROM byte
     disassembly     = []  # Disassembled for each instruction
     comments        = []  # Comments for each byte of ROM
+    diagnostics     = []  # (code, address, source, severity, detail) tuples
+    diag_counts     = {}  # Number of diagnostics recorded for each code
+    prov_kind       = None  # Provenance kind of each ROM byte, if tracked
+    prov_parent     = None  # Provenance parent address of each ROM byte, if tracked
     label_map       = {}  # Address label map
     port_map        = {}  # IO port label map
     special_labels  = {}  # Auto-generated label names for special addresses
     special_ports   = {}  # Auto-generated label names for special IO ports
+    label_qualifier = ''  # Inserted in auto-generated labels within ROM, such as a bank name
+    address_width   = 16  # Number of bits in a memory address, for formatting addresses
+    big_endian      = False  # True if 16-bit words are stored MSB first
     xref            = {}  # Call/branch/jump cross-reference
     vector_addrs    = []  # Addresses of all vectors
     vector_dests    = []  # Addresses of all vector destinations
+    entry_addrs     = []  # Entry points reached during disassembly
+    successors      = {}  # Instruction address -> list of next instruction addresses
+    call_sites      = {}  # Call instruction address -> called address
+    return_sites    = set()  # Addresses of instructions which may return from a subroutine
+    no_return       = set()  # Addresses of subroutines known not to return
+    inline_args     = {}  # Subroutine address -> (inline kind, count or terminator)
+    resume_addrs    = {}  # Call address -> address execution resumes at after inline arguments
+    decode_lengths  = None  # While resolving overlaps: address -> (length, is error) of each decode
+    listing_processes = 1  # Worker processes rendering the listing; None for one per CPU
+    traversal_processes = 1  # Worker processes disassembling from the roots; None for one per CPU
 
     # Description of this processor:
     # Child classes must set this to a short string describing the processor.
     description = None
 
+    # Trained code model shipped with the CPU module:
+    # Child classes may set this to text from codemodel.code_model.dumps().
+    code_model = None
+
+    # Instruction set emulated by the emulate module:
+    # Child classes may set this to '8080', '8085' or 'z80'.
+    emulation = None
+
+    # Length in bytes of the longest instruction:
+    # Child classes should set this to the length for their CPU.
+    max_insn_length = 8
+
+    # Clock cycles (T-states) of each opcode, indexed by opcode:
+    # Child classes may set cycle_table to a 256-entry table, and
+    # cycle_table_taken to the cycles of each opcode when its condition
+    # is met (the same as cycle_table for unconditional instructions).
+    cycle_table       = None
+    cycle_table_taken = None
+
     def __init__(self, rom, base_address=0, label_map={}, port_map={}):
         """Object code item constructor.
 
@@ -86,6 +214,188 @@ class rom_base(object):
         self.comments      = ['']*self.rom_len
         self.label_map     = label_map
         self.port_map      = port_map
+        self.xref          = {}
+        self.diagnostics   = []
+        self.entry_addrs   = []
+        self.successors    = {}
+        self.call_sites    = {}
+        self.return_sites  = set()
+        self.no_return     = set()
+        self.inline_args   = {}
+        self.resume_addrs  = {}
+        self.diag_counts   = {}
+        self.vector_addrs  = []
+        self.vector_dests  = []
+
+    def track_provenance(self):
+        """Start recording what first classified each location.
+
+        Must be called before classifying or disassembling anything whose
+        provenance is of interest. Uses one byte and one address per location.
+        """
+
+        if self.prov_kind is None:
+            self.prov_kind   = bytearray(self.rom_len)
+            self.prov_parent = array.array('l', [-1]) * self.rom_len
+
+
+    def _record_provenance(self, idx, kind, parent):
+        """Record provenance of one location unless it already has one."""
+
+        if self.prov_kind[idx] is prov_none:
+            self.prov_kind[idx]   = kind
+            self.prov_parent[idx] = parent
+
+
+    def _record_instruction(self, address, kind, parent):
+        """Record provenance of an instruction and its operands after disassembly."""
+
+        idx = address - self.base_address
+        self._record_provenance(idx, kind, parent)
+        n = idx + 1
+        while (n < self.rom_len) and (self.data_type[n] is type_operand) \
+              and (self.prov_kind[n] is prov_none):
+            self._record_provenance(n, prov_operand, address)
+            n = n + 1
+
+
+    def explain(self, address):
+        """Explain why a location was classified the way it is.
+
+        Walks the chain of provenance parents back to the root entry point,
+        vector or user classification. Provenance must have been enabled
+        with track_provenance() before disassembly.
+
+        Keyword arguments:
+        address -- Address of location to explain.
+
+        Returns:
+        List of (address, type name, provenance kind name, parent address) tuples,
+        starting with the specified address. Parent address is None at the root.
+        """
+
+        if self.prov_kind is None:
+            raise ValueError('Provenance tracking is not enabled.')
+        chain = []
+        seen  = set()
+        while (address is not None) and (address not in seen):
+            seen.add(address)
+            idx = address - self.base_address
+            if (idx < 0) or (idx >= self.rom_len):
+                chain.append((address, 'EXTERNAL', prov_names[prov_none], None))
+                break
+            kind   = self.prov_kind[idx]
+            parent = self.prov_parent[idx]
+            if parent < 0:
+                parent = None
+            chain.append((address, type_names[self.data_type[idx]], prov_names[kind], parent))
+            address = parent
+        return chain
+
+
+    def _diagnose(self, code, address, source=None, detail=()):
+        """Record a diagnostic.
+
+        Keyword arguments:
+        code    -- One of the diag_* codes.
+        address -- Address the diagnostic applies to.
+        source  -- Address of instruction which triggered the diagnostic, if known.
+        detail  -- Tuple of values substituted into the diag_messages text.
+        """
+
+        self.diagnostics.append((code, address, source, diag_severities[code], detail))
+        self.diag_counts[code] = self.diag_counts.get(code, 0) + 1
+
+
+    def _retype(self, idx, new_type, access_addr=None):
+        """Set classification of one location, recording a diagnostic if it changes.
+
+        Keyword arguments:
+        idx         -- Index of location within ROM.
+        new_type    -- New classification.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source.
+        """
+
+        old_type = self.data_type[idx]
+        if (new_type is type_data8) and (old_type in data8_types):
+            new_type = old_type
+        if (old_type is not type_unknown) and (old_type is not new_type) \
+           and not ((old_type is type_data8) and (new_type in data8_types)):
+            self._diagnose(diag_changed_type, idx + self.base_address, access_addr,
+                           (type_names[old_type], type_names[new_type]))
+        self.data_type[idx] = new_type
+        if self.prov_kind is not None:
+            if access_addr is None:
+                self._record_provenance(idx, prov_user, -1)
+            else:
+                self._record_provenance(idx, prov_access, access_addr)
+
+
+    def diagnostic_text(self, diag):
+        """Return listing comment text for a diagnostic tuple."""
+
+        code, address, source, severity, detail = diag
+        if (code is diag_changed_type) and (source is not None):
+            return 'WARNING: Access from {:s} changed type {:s}->{:s}. '.format(
+                self.format_address(source), detail[0], detail[1])
+        return diag_messages[code].format(*detail)
+
+
+    def filter_diagnostics(self, codes=None, min_severity=severity_info, addr_range=None):
+        """Return list of diagnostics matching all of the given criteria.
+
+        Keyword arguments:
+        codes        -- If specified, collection of diag_* codes to include.
+        min_severity -- Minimum severity to include.
+        addr_range   -- If specified, (min_address, max_address) tuple.
+        """
+
+        if addr_range is None:
+            lo, hi = (float('-inf'), float('inf'))
+        else:
+            lo, hi = addr_range
+        if codes is not None:
+            codes = set(codes)
+        return [diag for diag in self.diagnostics
+                if (diag[3] >= min_severity) and (lo <= diag[1] <= hi)
+                and ((codes is None) or (diag[0] in codes))]
+
+
+    def diagnostic_report(self, max_lines=None, min_severity=severity_info):
+        """Return diagnostics summary and list, without generating a listing.
+
+        Keyword arguments:
+        max_lines    -- If specified, maximum number of individual diagnostics listed.
+        min_severity -- Minimum severity of individual diagnostics listed.
+        """
+
+        report = '; Diagnostics summary:\n\n'
+        for code in sorted(self.diag_counts):
+            report = report + ';   {:8s} {:16s} {:6d}\n'.format(severity_names[diag_severities[code]],
+                                                              diag_names[code],
+                                                              self.diag_counts[code])
+        report = report + '\n; Diagnostics:\n\n'
+        diags = self.filter_diagnostics(min_severity=min_severity)
+        diags.sort(key=lambda diag: diag[1])
+        if (max_lines is not None) and (len(diags) > max_lines):
+            omitted = len(diags) - max_lines
+            diags = diags[:max_lines]
+        else:
+            omitted = 0
+        for diag in diags:
+            code, address, source, severity, detail = diag
+            if source is None:
+                source_str = ''
+            else:
+                source_str = self.format_address(source)
+            report = report + '{:s}  {:16s} {:6s} {:s}\n'.format(self.format_address(address),
+                                                                   diag_names[code], source_str,
+                                                                   self.diagnostic_text(diag))
+        if omitted:
+            report = report + '; ({:d} more not shown)\n'.format(omitted)
+        return report
+
 
     def _set_data8_intel(self, address, access_addr=None):
         """Classify location as 8-bit data, Intel format.
@@ -93,25 +403,13 @@ class rom_base(object):
         Keyword arguments:
         address     -- Address of location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
         idx = address - self.base_address
         if (idx >= 0) and (idx < self.rom_len):
-            if (self.data_type[idx] is not type_unknown) \
-              and (self.data_type[idx] is not type_data8):
-                if access_addr is None:
-                    line = 'WARNING: Changed type {:s}->{:s}. '
-                    line = line.format(type_names[self.data_type[idx]],
-                                       type_names[type_data8])
-                else:
-                    line = 'WARNING: Access from {:s} changed type {:s}->{:s}. '
-                    line = line.format(util.hex16_intel(access_addr),
-                                       type_names[self.data_type[idx]],
-                                       type_names[type_data8])
-                self.comments[idx] += line 
-            self.data_type[idx] = type_data8
+            self._retype(idx, type_data8, access_addr)
             
 
     def _set_data16_le_intel(self, address, access_addr):
@@ -120,38 +418,16 @@ class rom_base(object):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
         idx = address - self.base_address
         if (idx >= 0) and (idx < self.rom_len):
-            if (self.data_type[idx] is not type_unknown) \
-              and (self.data_type[idx] is not type_data16L):
-                if access_addr is None:
-                    line = 'WARNING: Changed type {:s}->{:s}. '
-                    line = line.format(type_names[self.data_type[idx]],
-                                       type_names[type_data16L])
-                else:
-                    line = 'WARNING: Access from {:s} changed type {:s}->{:s}. '
-                    line = line.format(util.hex16_intel(access_addr),
-                                       type_names[self.data_type[idx]],
-                                       type_names[type_data16L])
-            self.data_type[idx] = type_data16L
+            self._retype(idx, type_data16L, access_addr)
         idx = idx + 1
         if (idx >= 0) and (idx < self.rom_len):
-            if (self.data_type[idx] is not type_unknown) \
-              and (self.data_type[idx] is not type_data16H):
-                if access_addr is None:
-                    line = 'WARNING: Changed type {:s}->{:s}. '
-                    line = line.format(type_names[self.data_type[idx]],
-                                       type_names[type_data16H])
-                else:
-                    line = 'WARNING: Access from {:s} changed type {:s}->{:s}. '
-                    line = line.format(util.hex16_intel(access_addr),
-                                       type_names[self.data_type[idx]],
-                                       type_names[type_data16H])
-            self.data_type[idx] = type_data16H
+            self._retype(idx, type_data16H, access_addr)
             
             
 
@@ -161,7 +437,7 @@ class rom_base(object):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         Returns:
         Address contained at specified location.
@@ -173,33 +449,11 @@ class rom_base(object):
             self.vector_addrs.append(address)
             
         if (idx >= 0) and (idx < self.rom_len):
-            if (self.data_type[idx] is not type_unknown) \
-              and (self.data_type[idx] is not type_vector16L):
-                if access_addr is None:
-                    line = 'WARNING: Changed type {:s}->{:s}. '
-                    line = line.format(type_names[self.data_type[idx]],
-                                       type_names[type_vector16L])
-                else:
-                    line = 'WARNING: Access from {:s} changed type {:s}->{:s}. '
-                    line = line.format(util.hex16_intel(access_addr),
-                                       type_names[self.data_type[idx]],
-                                       type_names[type_vector16L])
-            self.data_type[idx] = type_vector16L
+            self._retype(idx, type_vector16L, access_addr)
             vector = self.rom[idx]
         idx = idx + 1
         if (idx >= 0) and (idx < self.rom_len):
-            if (self.data_type[idx] is not type_unknown) \
-              and (self.data_type[idx] is not type_vector16H):
-                if access_addr is None:
-                    line = 'WARNING: Changed type {:s}->{:s}. '
-                    line = line.format(type_names[self.data_type[idx]],
-                                       type_names[type_vector16H])
-                else:
-                    line = 'WARNING: Access from {:s} changed type {:s}->{:s}. '
-                    line = line.format(util.hex16_intel(access_addr),
-                                       type_names[self.data_type[idx]],
-                                       type_names[type_vector16H])
-            self.data_type[idx] = type_vector16H
+            self._retype(idx, type_vector16H, access_addr)
             if vector is not None:
                 vector = vector | (self.rom[idx] << 8)
 
@@ -212,6 +466,261 @@ class rom_base(object):
             
             
 
+    def _set_data16_be_intel(self, address, access_addr):
+        """Classify location as 16-bit big-endian data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of MSB location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        idx = address - self.base_address
+        if (idx >= 0) and (idx < self.rom_len):
+            self._retype(idx, type_data16H, access_addr)
+        idx = idx + 1
+        if (idx >= 0) and (idx < self.rom_len):
+            self._retype(idx, type_data16L, access_addr)
+
+
+    def _set_vector16_be_intel(self, address, access_addr):
+        """Classify location as 16-bit big-endian vector, Intel format.
+
+        Keyword arguments:
+        address     -- Address of MSB location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        Returns:
+        Address contained at specified location.
+        """
+
+        idx = address - self.base_address
+        vector = None
+        if address not in self.vector_addrs:
+            self.vector_addrs.append(address)
+
+        if (idx >= 0) and (idx < self.rom_len):
+            self._retype(idx, type_vector16H, access_addr)
+            vector = self.rom[idx] << 8
+        idx = idx + 1
+        if (idx >= 0) and (idx < self.rom_len):
+            self._retype(idx, type_vector16L, access_addr)
+            if vector is not None:
+                vector = vector | self.rom[idx]
+
+        if vector is not None:
+            if vector not in self.vector_dests:
+                self.vector_dests.append(vector)
+
+        return vector
+
+
+    def _classify_span(self, address, pattern, count, access_addr=None):
+        """Classify count repetitions of a type pattern with one slice assignment.
+
+        Locations outside of the ROM are silently skipped, as with the
+        single-location _set_* functions. Locations which already had a
+        different classification get the same diagnostic.
+
+        Keyword arguments:
+        address     -- Address of first location to reclassify.
+        pattern     -- List of types for one element, e.g. [type_data16L, type_data16H].
+        count       -- Number of elements to classify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        start = address - self.base_address
+        lo    = max(start, 0)
+        hi    = min(start + len(pattern)*count, self.rom_len)
+        if lo >= hi:
+            return
+
+        new_types = (pattern*count)[lo-start:hi-start]
+        old_types = self.data_type[lo:hi]
+        if old_types != new_types:
+            for n, old, new in zip(range(hi - lo), old_types, new_types):
+                if (new is type_data8) and (old in data8_types):
+                    new_types[n] = old
+                elif (old is not type_unknown) and (old is not new) \
+                     and not ((old is type_data8) and (new in data8_types)):
+                    self._diagnose(diag_changed_type, lo + n + self.base_address, access_addr,
+                                   (type_names[old], type_names[new]))
+        self.data_type[lo:hi] = new_types
+        if self.prov_kind is not None:
+            if access_addr is None:
+                kind, parent = (prov_user, -1)
+            else:
+                kind, parent = (prov_access, access_addr)
+            for idx in range(lo, hi):
+                self._record_provenance(idx, kind, parent)
+
+
+    def _set_data8_range_intel(self, start, end, access_addr=None):
+        """Classify range of locations as 8-bit data, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        if end >= start:
+            self._classify_span(start, [type_data8], end - start + 1, access_addr)
+
+
+    def _set_data16_array_le_intel(self, address, count, access_addr=None):
+        """Classify array of 16-bit little-endian words as data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of LSB of first word to reclassify.
+        count       -- Number of words in the array.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._classify_span(address, [type_data16L, type_data16H], count, access_addr)
+
+
+    def _set_data16_array_be_intel(self, address, count, access_addr=None):
+        """Classify array of 16-bit big-endian words as data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of MSB of first word to reclassify.
+        count       -- Number of words in the array.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._classify_span(address, [type_data16H, type_data16L], count, access_addr)
+
+
+    def _set_vector16_table_le_intel(self, address, count, access_addr=None):
+        """Classify table of 16-bit little-endian vectors, Intel format.
+
+        Keyword arguments:
+        address     -- Address of LSB of first vector to reclassify.
+        count       -- Number of vectors in the table.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        Returns:
+        List of addresses contained in the vectors lying entirely within the ROM.
+        """
+
+        return self._set_vector16_table(address, count, access_addr,
+                                        [type_vector16L, type_vector16H], '<')
+
+
+    def _set_vector16_table_be_intel(self, address, count, access_addr=None):
+        """Classify table of 16-bit big-endian vectors, Intel format.
+
+        Keyword arguments are as for _set_vector16_table_le_intel(), except
+        that address is that of the MSB of the first vector.
+
+        Returns:
+        List of addresses contained in the vectors lying entirely within the ROM.
+        """
+
+        return self._set_vector16_table(address, count, access_addr,
+                                        [type_vector16H, type_vector16L], '>')
+
+
+    def _set_vector16_table(self, address, count, access_addr, pattern, order):
+        """Classify table of 16-bit vectors with the given type pattern and struct byte order."""
+
+        self._classify_span(address, pattern, count, access_addr)
+
+        known = set(self.vector_addrs)
+        for vec_addr in range(address, address + 2*count, 2):
+            if vec_addr not in known:
+                self.vector_addrs.append(vec_addr)
+                known.add(vec_addr)
+
+        # Only read vectors lying entirely within the ROM
+        idx   = address - self.base_address
+        first = max(0, (1 - idx) // 2)
+        last  = min(count, (self.rom_len - idx) // 2)
+        if last <= first:
+            return []
+        vectors = list(struct.unpack_from('{:s}{:d}H'.format(order, last - first),
+                                          self.rom, idx + 2*first))
+
+        known = set(self.vector_dests)
+        for vector in vectors:
+            if vector not in known:
+                self.vector_dests.append(vector)
+                known.add(vector)
+
+        return vectors
+
+
+    def _set_strings_intel(self, address, count=1, terminator=0x00, end=None,
+                           access_addr=None):
+        """Classify run of terminated strings as text, Intel format.
+
+        Keyword arguments:
+        address     -- Address of first character of first string.
+        count       -- Number of consecutive strings, or None to continue
+                       until end or the end of the ROM.
+        terminator  -- Terminating byte value (included in the string),
+                       or None for strings whose last character has bit 7 set.
+        end         -- If specified, address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        Returns:
+        Address following the last classified string.
+        """
+
+        idx = address - self.base_address
+        if end is None:
+            end_idx = self.rom_len - 1
+        else:
+            end_idx = min(end - self.base_address, self.rom_len - 1)
+        if terminator is None:
+            term_re = re.compile(b'[\x80-\xFF]')
+        else:
+            term_re = re.compile(re.escape(bytes([terminator])))
+
+        n = 0
+        idx = max(idx, 0)
+        while (idx <= end_idx) and ((count is None) or (n < count)):
+            match = term_re.search(self.rom, idx, end_idx + 1)
+            if match is None:
+                stop = end_idx
+            else:
+                stop = match.start()
+            self._classify_span(idx + self.base_address, [type_string],
+                                stop - idx + 1, access_addr)
+            idx = stop + 1
+            n = n + 1
+
+        return idx + self.base_address
+
+
+    def _set_table_intel(self, start, end, access_addr=None):
+        """Classify range of locations as a byte table, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        if end >= start:
+            self._classify_span(start, [type_table], end - start + 1, access_addr)
+
+
     def set_data8(self, address, access_addr=None):
         """Classify location as 8-bit data.
 
@@ -239,6 +748,51 @@ class rom_base(object):
 
         raise NotImplementedError('Virtual function must be defined by inheritor.')
 
+    def set_data8_range(self, start, end, access_addr=None):
+        """Classify range of locations as 8-bit data.
+
+        This virtual function must be defined in processor-specific classes,
+        typically by calling the appropriate _set_data* member function.
+        """
+
+        raise NotImplementedError('Virtual function must be defined by inheritor.')
+
+    def set_data16_array(self, address, count, access_addr=None):
+        """Classify array of count 16-bit words as data.
+
+        This virtual function must be defined in processor-specific classes,
+        typically by calling the appropriate _set_data* member function.
+        """
+
+        raise NotImplementedError('Virtual function must be defined by inheritor.')
+
+    def set_vector_table(self, address, count, access_addr=None):
+        """Classify table of count pointers to executable code and return their contents.
+
+        This virtual function must be defined in processor-specific classes,
+        typically by calling the appropriate _set_vector* member function.
+        """
+
+        raise NotImplementedError('Virtual function must be defined by inheritor.')
+
+    def set_strings(self, address, count=1, terminator=0x00, end=None, access_addr=None):
+        """Classify run of terminated strings as text and return following address.
+
+        This virtual function must be defined in processor-specific classes,
+        typically by calling the appropriate _set_strings* member function.
+        """
+
+        raise NotImplementedError('Virtual function must be defined by inheritor.')
+
+    def set_table(self, start, end, access_addr=None):
+        """Classify range of locations as a byte table.
+
+        This virtual function must be defined in processor-specific classes,
+        typically by calling the appropriate _set_table* member function.
+        """
+
+        raise NotImplementedError('Virtual function must be defined by inheritor.')
+
     def disasm_single(self, address, create_label=True):
         """Disassemble a single instruction.
 
@@ -249,6 +803,8 @@ class rom_base(object):
         * Set self.data_type for identified data addresses within ROM.
         * Disassemble the instruction. Set location to type_error and return []
           if instruction at address is invalid.
+        * Call add_call() for subroutine calls, or add_xref() for jumps and branches.
+        * Call add_return() for instructions which may return from a subroutine.
         * Return list of any computable addresses of next instruction to be executed.
           Typically begins with address following last operand byte, followed
           by branch address for conditional branch. May be [] for instructions
@@ -260,7 +816,8 @@ class rom_base(object):
         
 
     def disassemble(self, entries=[0], create_labels = True, single_step=False,
-                    valid_range=None, breakpoints=[], vectors=[]):
+                    valid_range=None, breakpoints=[], vectors=[], vector_tables=[],
+                    resolve_overlaps=False):
         """Disassemble code, starting at specified entry point address(es).
 
         Keyword arguments:
@@ -287,77 +844,456 @@ class rom_base(object):
         vectors       -- If specified, a list of addresses which are assumed to contain
                          pointers to executable code. Pointers are subject to label creation
                          and substitution, and will be added to entries list for disassembly.
+
+        vector_tables -- If specified, a list of (address, count) tuples describing tables
+                         of vectors. All pointers in all tables are classified in bulk and
+                         added to the entries list in a single batch.
+
+        resolve_overlaps -- If True, do not let the first path to reach a location decide
+                         how overlapping instructions are decoded. Every possible
+                         instruction start is decoded in a first pass, each set of
+                         overlapping ones is resolved once by _resolve_overlaps(), and
+                         disassembly is then redone without the rejected starts. The
+                         result does not depend on the order of entries.
         """
 
+        if resolve_overlaps:
+            state = self.save_state()
+            self.decode_lengths = {}
+            try:
+                self.disassemble(entries, create_labels, single_step, valid_range,
+                                 breakpoints, vectors, vector_tables)
+                roots    = set(entries) | set(self.vector_dests)
+                rejected = self._resolve_overlaps(roots, self.decode_lengths, self.successors)
+            finally:
+                self.decode_lengths = None
+            self.restore_state(state)
+            self.disassemble(entries, create_labels, single_step, valid_range,
+                             set(breakpoints) | set(rejected), vectors, vector_tables)
+
+            # Report rejected starts at the entries and instructions leading to them
+            sources = [(address, address, None)
+                       for address in set(entries) | set(self.vector_dests) if address in rejected]
+            sources.extend([(source, dest, source) for source in self.successors
+                            for dest in self.successors[source] if dest in rejected])
+            for address, dest, source in sorted(sources):
+                self._diagnose(diag_overlap_rejected, address, source,
+                               (self.format_address(dest), self.format_address(rejected[dest])))
+            return
+
         if valid_range is not None:
             valid_min, valid_max = valid_range
         else:
             valid_min = self.base_address
             valid_max = self.max_address
             
-        vecptrs = []
+        # Roots of the traversal: (address, provenance kind, parent address)
+        roots = [(entry, prov_entry, -1) for entry in entries]
         for vector in vectors:
             ptr = self.set_vector(vector)
-            vecptrs.append(ptr)
+            roots.append((ptr, prov_vector, vector))
             if create_labels:
                 self.lookup_address(ptr, True, 'V_')
 
-        for entry in (entries + vecptrs):
+        for address, count in vector_tables:
+            ptrs = self.set_vector_table(address, count)
+            roots.extend([(ptr, prov_vector, address + 2*n) for n, ptr in enumerate(ptrs)])
+            if create_labels:
+                for ptr in ptrs:
+                    self.lookup_address(ptr, True, 'V_')
+
+        groups = self._traversal_groups(roots, single_step)
+        if len(groups) > 1:
+            self._traverse_parallel(groups, create_labels, single_step, valid_min, valid_max,
+                                    breakpoints)
+        else:
+            self._traverse(roots, create_labels, single_step, valid_min, valid_max, breakpoints)
+
+
+    def _traverse(self, roots, create_labels, single_step, valid_min, valid_max, breakpoints):
+        """Disassemble from each root in turn, for disassemble().
+
+        Keyword arguments:
+        roots         -- List of (address, provenance kind, parent address) tuples.
+        create_labels -- As for disassemble().
+        single_step   -- As for disassemble().
+        valid_min     -- Lowest address to disassemble.
+        valid_max     -- Highest address to disassemble.
+        breakpoints   -- As for disassemble().
+        """
+
+        # Depth-first traversal with an explicit stack. Each stack entry is an
+        # iterator over (address, kind, parent) tuples still to be visited, so
+        # locations are visited in the same order as a recursive traversal.
+        stack = [iter(roots)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+            entry, kind, parent = item
             if (entry>=valid_min) and (entry<=valid_max) and (entry not in breakpoints):
 
                 if (entry < self.base_address) or (entry > self.max_address):
                     raise IndexError('Disassembly address outside of valid range.')
 
+                idx = entry - self.base_address
+                if self.decode_lengths is not None:
+                    # While resolving overlaps, decode every possible instruction
+                    # start, and measure it without operands of other decodes
+                    for n in range(idx, min(idx + self.max_insn_length, self.rom_len)):
+                        if self.data_type[n] is type_operand:
+                            self.data_type[n] = type_unknown
+                was_instruction = self.data_type[idx] is type_instruction
                 next_addr_list = self.disasm_single(entry, create_labels)
-            
+
+                # Keep the successors of newly disassembled instructions
+                if (not was_instruction) and (self.data_type[idx] in (type_instruction, type_error)):
+                    if entry in self.call_sites:
+                        next_addr_list = self._call_successors(entry, next_addr_list)
+                    self.successors[entry] = next_addr_list
+                    if self.decode_lengths is not None:
+                        self.decode_lengths[entry] = (self._insn_length(entry),
+                                                      self.data_type[idx] is type_error)
+                    if kind is prov_entry:
+                        self.entry_addrs.append(entry)
+
+                if self.prov_kind is not None:
+                    self._record_instruction(entry, kind, parent)
+
                 if not single_step:
-                    self.disassemble(next_addr_list, create_labels, False, (valid_min,valid_max), breakpoints)
+                    stack.append(iter([(addr, prov_successor, entry) for addr in next_addr_list]))
 
 
-    def _listing_a16_d8_intel(self, source=False):
-        """Produce listing in Intel format for 8-bit data, 16-bit address system.
+    def _traversal_groups(self, roots, single_step):
+        """Return list of consecutive groups of roots for worker processes.
+
+        Returns one group of all roots if disassembly runs in this process.
+        """
+
+        processes = self.traversal_processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        n_groups = min(processes, len(roots))
+        if (processes <= 1) or (n_groups <= 1) or single_step or (self.decode_lengths is not None) \
+           or multiprocessing.current_process().daemon:
+            return [roots]
+        return [roots[k*len(roots) // n_groups:(k + 1)*len(roots) // n_groups] for k in range(n_groups)]
+
+
+    def _traverse_parallel(self, groups, create_labels, single_step, valid_min, valid_max,
+                           breakpoints):
+        """Disassemble groups of roots speculatively in worker processes, for disassemble().
+
+        Each group is disassembled in a worker from a snapshot of the
+        state, recording every location it reads or writes. Results are
+        merged in order up to the first group which used a location
+        changed by an earlier group, or created a label that an earlier
+        group named differently. The remaining groups are then
+        disassembled again from the merged state. Code shared with an
+        earlier group is not followed again, so the remaining groups
+        usually merge in the next round. The first group of each round
+        always merges, and the state is the same as from _traverse().
+
+        Workers claim the locations they write in a shared array, and a
+        group stops as soon as it writes a location claimed by an earlier
+        group, since it could not be merged in this round.
+        """
+
+        args = (create_labels, single_step, valid_min, valid_max, breakpoints)
+        while len(groups) > 1:
+            processes = min(len(groups), self.traversal_processes or multiprocessing.cpu_count())
+            claims    = multiprocessing.RawArray('i', len(self.rom))
+            pool = multiprocessing.Pool(processes, _traversal_init, (self, claims) + args)
+            try:
+                results = pool.map(_traversal_work, enumerate(groups))
+            finally:
+                pool.close()
+                pool.join()
+
+            if results[0] is None:
+                # Redo a failed group here, so that any exception is raised
+                self._traverse(groups[0], *args)
+                groups = groups[1:]
+                continue
+
+            changed = set()
+            merged  = 0
+            for result in results:
+                if (not result) or (not changed.isdisjoint(result['used'])) \
+                   or any(self.label_map.get(address, name) != name
+                          for address, name in result['label_map'].items()) \
+                   or any(self.port_map.get(port, name) != name
+                          for port, name in result['port_map'].items()):
+                    break
+                self._merge_traversal(result)
+                changed.update(result['locations'])
+                merged = merged + 1
+            groups = groups[merged:]
+
+        for roots in groups:
+            self._traverse(roots, *args)
+
+
+    def _merge_traversal(self, result):
+        """Apply the changes made by one group of _traverse_parallel()."""
+
+        arrays = self._location_state()
+        for idx, values in result['locations'].items():
+            for array_, value in zip(arrays, values):
+                array_[idx] = value
+        for name in ('label_map', 'port_map', 'successors', 'call_sites', 'resume_addrs'):
+            getattr(self, name).update(result[name])
+        for dest, sources in result['xref'].items():
+            for source in sources:
+                self.add_xref(source, dest)
+        for name in ('vector_addrs', 'vector_dests'):
+            for address in result[name]:
+                if address not in getattr(self, name):
+                    getattr(self, name).append(address)
+        self.entry_addrs.extend(result['entry_addrs'])
+        self.return_sites.update(result['return_sites'])
+        for diag in result['diagnostics']:
+            self.diagnostics.append(diag)
+            self.diag_counts[diag[0]] = self.diag_counts.get(diag[0], 0) + 1
+
+
+    def _location_state(self):
+        """Return list of the per-location arrays of classification and disassembly state."""
+
+        arrays = [self.data_type, self.disassembly, self.comments]
+        if self.prov_kind is not None:
+            arrays.extend([self.prov_kind, self.prov_parent])
+        return arrays
+
+
+    def _resolve_overlaps(self, roots, lengths, successors):
+        """Choose among overlapping instruction starts.
+
+        Starts which overlap, directly or through a chain of others, form
+        one conflict. Each start is scored: 1, plus 4 if it is an entry or
+        vector destination, plus 2 for each jump or call and 1 for each
+        fall-through reaching it, plus 1 if it falls through to another
+        decoded start, minus 3 if its opcode is invalid. The set of
+        non-overlapping starts with the highest total score is kept, and
+        the others are rejected. Starts only reachable through rejected
+        ones are left out and the conflicts resolved again, until the
+        rejections no longer change.
 
         Keyword arguments:
+        roots      -- Set of entry and vector destination addresses.
+        lengths    -- Dictionary of address -> (length, is error) of every decode.
+        successors -- Dictionary of address -> list of next instruction addresses.
 
-        source   -- If True, output assembler soruce format. Otherwise,
-                    output listing format with addres and data columns.
+        Returns:
+        Dictionary of rejected start address -> address of an overlapping
+        start kept instead.
         """
-        
-        listing_str = ''
-        if source:
-            indentation = ''
-        else:
-            indentation = ' '*24
-        
-        # Output any labels outside of ROM range
-        listing_str = listing_str + '{:s}; External References:\n\n'.format(indentation)
-        for address in sorted(self.label_map):
-            if (address < self.base_address) or (address > self.max_address):
-                line = '{:s}{:16s}  EQU  {:s}\n'
-                line = line.format(indentation, self.label_map[address], util.hex16_intel(address))
-                listing_str = listing_str + line 
 
-        # Output the IO port map
-        listing_str = listing_str + '\n{:s}; IO Port Map:\n\n'.format(indentation)
-        for port in sorted(self.port_map):
-            line = '{:s}{:16s}  EQU  {:s}\n'
-            line = line.format(indentation, self.port_map[port], util.hex8_intel(port))
-            listing_str = listing_str + line 
-            
-        # Begin code listing
-        listing_str = listing_str + '\n{:s}; ROM Disassembly:\n\n'.format(indentation)
-        address     = self.base_address
-        idx         = 0
-        previdx     = 0
+        rejected = {}
+        for n in range(8):
+            # Starts reachable without passing through rejected ones, and the
+            # rejected starts they lead to, which compete again
+            reachable = set()
+            work = sorted(address for address in roots if address in lengths)
+            while work:
+                address = work.pop()
+                if (address in reachable) or (address in rejected):
+                    continue
+                reachable.add(address)
+                work.extend(addr for addr in successors.get(address, [])
+                            if (addr in lengths) and (addr not in reachable))
+            candidates = reachable | set(address for address in rejected if address in roots)
+            for address in reachable:
+                candidates.update(addr for addr in successors.get(address, []) if addr in rejected)
+
+            score = dict((address, 1.0) for address in candidates)
+            for address in candidates:
+                if address in roots:
+                    score[address] += 4
+                length, is_error = lengths[address]
+                if is_error:
+                    score[address] -= 3
+                if address + length in candidates:
+                    score[address] += 1
+            for address in reachable:
+                length = lengths[address][0]
+                for addr in set(successors.get(address, [])):
+                    if addr in candidates:
+                        score[addr] += 1 if addr == address + length else 2
+
+            # Group overlapping starts into conflicts, in address order
+            conflicts = []
+            end = None
+            for address in sorted(candidates):
+                if (end is not None) and (address < end):
+                    conflicts[-1].append(address)
+                else:
+                    conflicts.append([address])
+                    end = address
+                end = max(end, address + lengths[address][0])
+
+            new_rejected = {}
+            for starts in conflicts:
+                if len(starts) < 2:
+                    continue
+
+                # Weighted interval scheduling: best[i] is the best total score
+                # of the first i starts in order of end address
+                starts = sorted(starts, key=lambda address: (address + lengths[address][0], address))
+                ends   = [address + lengths[address][0] for address in starts]
+                best   = [(0.0, [])]
+                for i, address in enumerate(starts):
+                    j = bisect.bisect_right(ends, address, 0, i)
+                    take = best[j][0] + max(0.25, score[address])
+                    if take > best[i][0]:
+                        best.append((take, best[j][1] + [address]))
+                    else:
+                        best.append(best[i])
+                kept = best[-1][1]
+                for address in starts:
+                    overlapping = [addr for addr in kept
+                                   if (addr < address + lengths[address][0])
+                                   and (address < addr + lengths[addr][0])]
+                    if (address not in kept) and overlapping:
+                        new_rejected[address] = min(overlapping)
+
+            if new_rejected == rejected:
+                break
+            rejected = new_rejected
+        return rejected
+
+
+    def set_inline_args(self, routine, kind, value=1):
+        """Declare the inline arguments which follow calls to a subroutine.
+
+        Execution resumes after the inline arguments, which are classified
+        as data when each call is disassembled.
 
-        line = '\n{:s}                  ORG  {:s}\n\n'
-        line = line.format(indentation, util.hex16_intel(self.base_address))
-        listing_str = listing_str + line
+        Keyword arguments:
+        routine -- Address of called subroutine.
+        kind    -- One of the inline_* kinds.
+        value   -- Number of bytes or vectors for inline_bytes and inline_vectors,
+                   or the terminating byte value for inline_string.
+        """
+
+        if kind not in (inline_bytes, inline_string, inline_string_bit7, inline_vectors):
+            raise ValueError('Invalid inline argument kind.')
+        self.inline_args[routine] = (kind, value)
+
+
+    def _insn_length(self, address):
+        """Return length of disassembled instruction, counting its operand bytes."""
+
+        idx = address - self.base_address
+        n   = 1
+        while ((idx + n) < self.rom_len) and (self.data_type[idx + n] is type_operand):
+            n = n + 1
+        return n
+
+
+    def cycles(self, address):
+        """Return clock cycles of the instruction at address.
+
+        Returns:
+        (cycles, cycles_taken) tuple. cycles_taken is the number of
+        cycles when the condition of a conditional jump, call, return or
+        repeat is met, and cycles when it is not. Returns None if the
+        CPU module has no cycle table."""
+
+        if self.cycle_table is None:
+            return None
+        opcode = self.rom[address - self.base_address]
+        return (self.cycle_table[opcode], self.cycle_table_taken[opcode])
+
+
+    def _call_successors(self, address, next_addrs):
+        """Adjust successors of a newly disassembled call for its called subroutine.
+
+        Applies any inline argument rule for the subroutine, and removes the
+        fall-through if the subroutine never returns.
+
+        Keyword arguments:
+        address    -- Address of call instruction.
+        next_addrs -- Successors returned by disasm_single().
+
+        Returns:
+        List of successors: the resume address (if any), then the call
+        destination, then any inline vectors.
+        """
+
+        target  = self.call_sites[address]
+        rule    = self.inline_args.get(target)
+        vectors = []
+        if rule is not None:
+            kind, value = rule
+            start = address + self._insn_length(address)
+            if kind is inline_bytes:
+                self.set_data8_range(start, start + value - 1, address)
+                resume = start + value
+            elif kind is inline_string:
+                resume = self.set_strings(start, 1, value, None, address)
+            elif kind is inline_string_bit7:
+                resume = self.set_strings(start, 1, None, None, address)
+            else:
+                vectors = self.set_vector_table(start, value, address)
+                resume = start + 2*value
+            self.resume_addrs[address] = resume
+            next_addrs = [resume, target] + vectors
+
+        if target in self.no_return:
+            # Calls to subroutines which never return do not fall through
+            next_addrs = [target] + vectors
+        return next_addrs
+
+
+    def _data_line_length(self, idx, limit):
+        """Return number of string or table locations to list on one line.
+
+        A line ends after limit locations, before a change of type or a
+        location which is labeled or referenced, and for strings after a
+        terminator: NUL, LF, CR not followed by LF, or a byte with bit 7 set.
+
+        Keyword arguments:
+        idx   -- Index of first location of the line.
+        limit -- Maximum number of locations on the line.
+        """
+
+        kind = self.data_type[idx]
+        n    = 1
+        while (n < limit) and ((idx + n) < self.rom_len) and (self.data_type[idx + n] is kind):
+            if kind is type_string:
+                val = self.rom[idx + n - 1]
+                if (val in (0x00, 0x0A)) or (val >= 0x80) \
+                   or ((val == 0x0D) and (self.rom[idx + n] != 0x0A)):
+                    break
+            address = self.base_address + idx + n
+            if (address in self.label_map) or (address in self.xref) or (address in self.vector_dests):
+                break
+            n = n + 1
+        return n
+
+
+    def _listing_lines_a16_d8_intel(self, comments, start, end, previdx, source=False):
+        """Return the listing lines of a range of locations, for _listing_a16_d8_intel().
+
+        Keyword arguments:
+        comments -- Comments of each location, with diagnostics rendered.
+        start    -- Index of the first location of a line.
+        end      -- Index after the last location; a line may run past it.
+        previdx  -- Index of the first location of the line before start,
+                    or start if there is none.
+        source   -- If True, output assembler source format.
+        """
 
-        while address <= self.max_address:
+        digits  = util.hex_digits(self.address_width)
+        address = self.base_address + start
+        idx     = start
+        lines   = []
+        while idx < end:
             n = 1
             data_str = '{:02X}'.format(self.rom[idx])
-            comment  = self.comments[idx]
+            comment  = comments[idx]
 
             if address in self.label_map:
                 label = self.label_map[address] + ':'
@@ -368,23 +1304,53 @@ class rom_base(object):
                 code_str = self.disassembly[idx]
                 while ((idx + n) < len(self.data_type)) and self.data_type[idx + n] is type_operand:
                     data_str = data_str + ' {:02X}'.format(self.rom[idx + n])
-                    if len(self.comments[idx + n]) > 0:
-                        comment = comment + ' ' + self.comments[idx + n]
+                    if len(comments[idx + n]) > 0:
+                        comment = comment + ' ' + comments[idx + n]
                     n = n + 1
 
+            elif self.data_type[idx] in data8_types:
+                if self.data_type[idx] is type_string:
+                    n = self._data_line_length(idx, string_line_bytes)
+                    code_str = 'DB   {:s}'.format(util.text_intel(self.rom[idx:idx + n]))
+                else:
+                    n = self._data_line_length(idx, table_line_bytes)
+                    code_str = 'DB   {:s}'.format(', '.join(util.hex8_intel(val)
+                                                            for val in self.rom[idx:idx + n]))
+                for k in range(idx + 1, idx + n):
+                    data_str = data_str + ' {:02X}'.format(self.rom[k])
+                    if len(comments[k]) > 0:
+                        comment = comment + ' ' + comments[k]
+                if len(data_str) > 16:
+                    # Keep the columns aligned; the bytes are all in the operand
+                    data_str = data_str[:14] + ' +'
+
             elif self.data_type[idx] is type_data8:
                 code_str = 'DB   {:s}'.format(util.hex8_intel(self.rom[idx]))
 
             elif (self.data_type[idx] is type_data16L) and (self.data_type[idx+1] is type_data16H):
                 word = self.rom[idx] | (self.rom[idx+1] << 8)
                 code_str = 'DW   {:s}'.format(util.hex16_intel(word))
-                comment = comment + ' ' + self.comments[idx + 1]
+                comment = comment + ' ' + comments[idx + 1]
                 n = n + 1
 
             elif (self.data_type[idx] is type_vector16L) and (self.data_type[idx+1] is type_vector16H):
                 word = self.rom[idx] | (self.rom[idx+1] << 8)
                 code_str = 'DW   {:s}'.format(self.lookup_address(word, False))
-                comment = comment + ' ' + self.comments[idx + 1]
+                comment = comment + ' ' + comments[idx + 1]
+                n = n + 1
+
+            elif self.big_endian and ((idx + 1) < self.rom_len) \
+                 and (self.data_type[idx] is type_data16H) and (self.data_type[idx+1] is type_data16L):
+                word = (self.rom[idx] << 8) | self.rom[idx+1]
+                code_str = 'DW   {:s}'.format(util.hex16_intel(word))
+                comment = comment + ' ' + comments[idx + 1]
+                n = n + 1
+
+            elif self.big_endian and ((idx + 1) < self.rom_len) \
+                 and (self.data_type[idx] is type_vector16H) and (self.data_type[idx+1] is type_vector16L):
+                word = (self.rom[idx] << 8) | self.rom[idx+1]
+                code_str = 'DW   {:s}'.format(self.lookup_address(word, False))
+                comment = comment + ' ' + comments[idx + 1]
                 n = n + 1
 
             elif (self.data_type[idx] is type_unknown):
@@ -398,8 +1364,8 @@ class rom_base(object):
                 line = '{lbl:17s} {code:24s}; {comm:s}\n'
                 line = line.format(lbl=label, code=code_str, comm=comment)
             else:
-                line = '{addr:04X}  {dstr:16s}  {lbl:17s} {code:24s}; {comm:s}\n'
-                line = line.format(addr=address, dstr=data_str, lbl=label, code=code_str, comm=comment)
+                line = '{addr:0{digits}X}  {dstr:16s}  {lbl:17s} {code:24s}; {comm:s}\n'
+                line = line.format(addr=address, digits=digits, dstr=data_str, lbl=label, code=code_str, comm=comment)
 
             # Insert extra line breaks to improve readability
             if address in self.xref:
@@ -425,12 +1391,120 @@ class rom_base(object):
                 # Line break after block of data
                 line = '\n' + line
 
-            listing_str = listing_str + line
+            lines.append(line)
 
             address = address + n
             previdx = idx
             idx     = idx + n
 
+
+        return ''.join(lines)
+
+
+    def _listing_chunks(self):
+        """Return (start, end, previdx) index tuples of listing chunks for worker processes.
+
+        Chunks split the ROM between two instructions, where the line
+        before the split is known without rendering up to it. Returns one
+        chunk of the whole ROM if the listing is rendered in this process.
+        """
+
+        processes = self.listing_processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        n_chunks = min(4*processes, self.rom_len // listing_chunk_bytes)
+        if (processes <= 1) or (n_chunks <= 1) or multiprocessing.current_process().daemon:
+            return [(0, self.rom_len, 0)]
+
+        data_type = self.data_type
+        chunks    = []
+        start     = 0
+        previdx   = 0
+        for k in range(1, n_chunks):
+            idx = max(k*self.rom_len // n_chunks, start + 1)
+            while idx < self.rom_len:
+                # Split before an instruction which follows another instruction
+                # and its operands
+                if data_type[idx] is type_instruction:
+                    prev = idx - 1
+                    while (prev > start) and (data_type[prev] is type_operand):
+                        prev = prev - 1
+                    if data_type[prev] is type_instruction:
+                        break
+                idx = idx + 1
+            if idx >= self.rom_len:
+                break
+            chunks.append((start, idx, previdx))
+            start   = idx
+            previdx = prev
+        chunks.append((start, self.rom_len, previdx))
+        return chunks
+
+
+    def _listing_a16_d8_intel(self, source=False):
+        """Produce listing in Intel format for 8-bit data, 16-bit address system.
+
+        Keyword arguments:
+
+        source   -- If True, output assembler soruce format. Otherwise,
+                    output listing format with addres and data columns.
+        """
+        
+        listing_str = ''
+        digits      = util.hex_digits(self.address_width)
+        if source:
+            indentation = ''
+        else:
+            indentation = ' '*(20 + digits)
+        
+        # Output any labels outside of ROM range, and labels of operand
+        # locations, which no listing line starts at
+        listing_str = listing_str + '{:s}; External References:\n\n'.format(indentation)
+        for address in sorted(self.label_map):
+            if (address < self.base_address) or (address > self.max_address):
+                line = '{:s}{:16s}  EQU  {:s}\n'
+                line = line.format(indentation, self.label_map[address], self.format_address(address))
+                listing_str = listing_str + line 
+            elif self.data_type[address - self.base_address] is type_operand:
+                line = '{:s}{:16s}  EQU  {:s}\n'
+                line = line.format(indentation, self.label_map[address], self._operand_address(address))
+                listing_str = listing_str + line
+
+        # Output the IO port map
+        listing_str = listing_str + '\n{:s}; IO Port Map:\n\n'.format(indentation)
+        for port in sorted(self.port_map):
+            line = '{:s}{:16s}  EQU  {:s}\n'
+            line = line.format(indentation, self.port_map[port], util.hex8_intel(port))
+            listing_str = listing_str + line 
+            
+        # Begin code listing
+        listing_str = listing_str + '\n{:s}; ROM Disassembly:\n\n'.format(indentation)
+
+        line = '\n{:s}                  ORG  {:s}\n\n'
+        line = line.format(indentation, self.format_address(self.base_address))
+        listing_str = listing_str + line
+
+        # Render diagnostics into a copy of the comments
+        comments = list(self.comments)
+        for diag in self.diagnostics:
+            diag_idx = diag[1] - self.base_address
+            if (diag_idx >= 0) and (diag_idx < self.rom_len):
+                comments[diag_idx] += self.diagnostic_text(diag)
+
+        # Render chunks of the ROM in worker processes if requested, each
+        # starting from a snapshot of this object
+        chunks = self._listing_chunks()
+        if len(chunks) > 1:
+            processes = min(len(chunks), self.listing_processes or multiprocessing.cpu_count())
+            pool = multiprocessing.Pool(processes, _listing_init, (self, comments, source))
+            try:
+                listing_str = listing_str + ''.join(pool.map(_listing_work, chunks))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            listing_str = listing_str + self._listing_lines_a16_d8_intel(comments, 0, self.rom_len, 0, source)
+
         listing_str = listing_str + '\n{:s}                  END\n\n'.format(indentation)
 
         # Output cross-reference
@@ -485,13 +1559,37 @@ class rom_base(object):
         elif create_label:
             if address in self.special_labels:
                 label = self.special_labels[address]
+            elif self.label_qualifier and (address >= self.base_address) \
+                 and (address <= self.max_address):
+                label = '{:s}{:s}_{:0{:d}X}'.format(prefix, self.label_qualifier, address,
+                                                   util.hex_digits(self.address_width))
             else:
-                label = '{:s}{:04X}'.format(prefix, address)
+                label = '{:s}{:0{:d}X}'.format(prefix, address, util.hex_digits(self.address_width))
             self.label_map[address] = label
             return label
         else:
-            return util.hex16_intel(address)
+            return self.format_address(address)
         
+    def _operand_address(self, address):
+        """Return operand location address relative to the label of its instruction.
+
+        Returns label+offset if the instruction containing address has a
+        label, and otherwise the address as a hex constant.
+        """
+
+        idx = address - self.base_address
+        while (idx > 0) and (self.data_type[idx] is type_operand):
+            idx = idx - 1
+        start = idx + self.base_address
+        if (self.data_type[idx] is type_instruction) and (start in self.label_map):
+            return '{:s}+{:d}'.format(self.label_map[start], address - start)
+        return self.format_address(address)
+
+    def format_address(self, address):
+        """Return memory address as a hex constant of address_width bits, Intel format."""
+
+        return util.hex_intel(address, self.address_width)
+
     def _lookup_port8_intel(self, port, create_label=True, prefix='P_'):
         """Look up port in IO port map, returning symbol name or hex string.
 
@@ -551,3 +1649,187 @@ class rom_base(object):
             self.xref[dest] = [source]
     
 
+
+    def add_call(self, source, dest):
+        """Record subroutine call and add it to cross-reference dictionary.
+
+        Keyword arguments:
+        source -- Address of calling instruction.
+        dest   -- Address of called function."""
+
+        self.call_sites[source] = dest
+        self.add_xref(source, dest)
+
+
+    def add_return(self, source):
+        """Record instruction which may return from a subroutine.
+
+        Keyword arguments:
+        source -- Address of return instruction."""
+
+        self.return_sites.add(source)
+
+
+    def save_state(self):
+        """Return a copy of the classification and disassembly state.
+
+        The copy may later be passed to restore_state(), for example to
+        redo disassembly with different assumptions.
+        """
+
+        state = {}
+        for name in ('data_type', 'disassembly', 'comments', 'diagnostics',
+                     'vector_addrs', 'vector_dests', 'entry_addrs'):
+            state[name] = list(getattr(self, name))
+        for name in ('diag_counts', 'label_map', 'port_map', 'successors', 'call_sites',
+                     'resume_addrs'):
+            state[name] = dict(getattr(self, name))
+        state['xref']         = dict((dest, list(sources)) for dest, sources in self.xref.items())
+        state['return_sites'] = set(self.return_sites)
+        if self.prov_kind is not None:
+            state['prov_kind']   = bytearray(self.prov_kind)
+            state['prov_parent'] = self.prov_parent[:]
+        return state
+
+
+    def restore_state(self, state):
+        """Restore classification and disassembly state saved by save_state().
+
+        The state may be restored more than once.
+        """
+
+        for name in ('data_type', 'disassembly', 'comments', 'diagnostics',
+                     'vector_addrs', 'vector_dests', 'entry_addrs'):
+            setattr(self, name, list(state[name]))
+        for name in ('diag_counts', 'label_map', 'port_map', 'successors', 'call_sites',
+                     'resume_addrs'):
+            setattr(self, name, dict(state[name]))
+        self.xref         = dict((dest, list(sources)) for dest, sources in state['xref'].items())
+        self.return_sites = set(state['return_sites'])
+        if 'prov_kind' in state:
+            self.prov_kind   = bytearray(state['prov_kind'])
+            self.prov_parent = state['prov_parent'][:]
+
+
+# ROM object, comments and source flag shared by listing worker processes
+_listing_snapshot = None
+
+
+def _listing_init(rom, comments, source):
+    """Listing worker process initializer: keep a read-only snapshot of the ROM."""
+
+    global _listing_snapshot
+    _listing_snapshot = (rom, comments, source)
+
+
+def _listing_work(chunk):
+    """Listing worker process entry point: return the lines of one chunk."""
+
+    rom, comments, source = _listing_snapshot
+    start, end, previdx = chunk
+    return rom._listing_lines_a16_d8_intel(comments, start, end, previdx, source)
+
+
+def _changed_locations(before, after):
+    """Return indices at which copies of per-location arrays differ from the arrays."""
+
+    changed = set()
+    for old, new in zip(before, after):
+        changed.update(itertools.compress(itertools.count(), map(operator.ne, old, new)))
+    return changed
+
+
+class _traversal_conflict(Exception):
+    """Raised when a traversal worker writes a location claimed by an earlier group."""
+
+
+class _recording_list(list):
+    """List recording the index of every element read or written.
+
+    Written elements are claimed for group number `group` in the shared
+    array `claims`, which holds one plus the number of the earliest group
+    that wrote each element, or zero. Writing an element claimed by an
+    earlier group raises _traversal_conflict.
+    """
+
+    def __init__(self, values, group, claims):
+        list.__init__(self, values)
+        self.used   = set()
+        self.group  = group
+        self.claims = claims
+
+    def _indices(self, key):
+        if isinstance(key, slice):
+            return range(*key.indices(len(self)))
+        return [key % len(self)]
+
+    def __getitem__(self, key):
+        if (key.__class__ is int) and (key >= 0):
+            self.used.add(key)
+        else:
+            self.used.update(self._indices(key))
+        return list.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        claim = self.group + 1
+        for idx in self._indices(key):
+            if 0 < self.claims[idx] < claim:
+                raise _traversal_conflict()
+            self.claims[idx] = claim
+            self.used.add(idx)
+        list.__setitem__(self, key, value)
+
+
+# ROM object, its state, claims array and disassemble() arguments shared by
+# traversal worker processes
+_traversal_snapshot = None
+
+
+def _traversal_init(rom, claims, *args):
+    """Traversal worker process initializer: keep a snapshot of the ROM and its state."""
+
+    global _traversal_snapshot
+    _traversal_snapshot = (rom, rom.save_state(), claims, args)
+
+
+def _traversal_work(task):
+    """Traversal worker process entry point: disassemble a group of roots from the snapshot.
+
+    Keyword arguments:
+    task -- Tuple of group number and list of roots.
+
+    Returns:
+    Dictionary of the changes made to the snapshot state, with the set
+    of locations used, False if the group wrote a location claimed by an
+    earlier group, or None if disassembly raised an exception.
+    """
+
+    group, roots = task
+    rom, state, claims, args = _traversal_snapshot
+    rom.restore_state(state)
+    rom.data_type = _recording_list(rom.data_type, group, claims)
+    before = [list(values) for values in rom._location_state()]
+    try:
+        rom._traverse(roots, *args)
+    except _traversal_conflict:
+        return False
+    except Exception:
+        # The group is disassembled again in the parent process, raising
+        # the exception at the same point as without worker processes
+        return None
+
+    after  = rom._location_state()
+    result = {'used': rom.data_type.used}
+    result['locations'] = dict((idx, tuple(values[idx] for values in after))
+                               for idx in _changed_locations(before, after))
+    result['used'].update(result['locations'])
+    for name in ('label_map', 'port_map', 'successors', 'call_sites', 'resume_addrs'):
+        old = state[name]
+        result[name] = dict((key, value) for key, value in getattr(rom, name).items()
+                            if (key not in old) or (old[key] != value))
+    result['xref'] = dict((dest, sources[len(state['xref'].get(dest, [])):])
+                          for dest, sources in rom.xref.items())
+    for name in ('vector_addrs', 'vector_dests', 'entry_addrs', 'diagnostics'):
+        result[name] = getattr(rom, name)[len(state[name]):]
+    result['return_sites'] = rom.return_sites - state['return_sites']
+    return result
@@ -47,12 +47,74 @@ default_entries = [0x00, 0x08, 0x10, 0x18, 0x20, 0x28, 0x30, 0x38, 0x66]
 # There are no default port names
 default_ports = {}
 
+# Clock cycles (T-states) of each unprefixed opcode; of conditional
+# jumps, returns and calls when the condition is not met. CB and ED
+# prefixed opcodes are counted in their own tables, including the prefix.
+_cycles = bytes([
+     4, 10,  7,  6,  4,  4,  7,  4,  4, 11,  7,  6,  4,  4,  7,  4,  # 00
+     8, 10,  7,  6,  4,  4,  7,  4, 12, 11,  7,  6,  4,  4,  7,  4,  # 10
+     7, 10, 16,  6,  4,  4,  7,  4,  7, 11, 16,  6,  4,  4,  7,  4,  # 20
+     7, 10, 13,  6, 11, 11, 10,  4,  7, 11, 13,  6,  4,  4,  7,  4,  # 30
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 40
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 50
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 60
+     7,  7,  7,  7,  7,  7,  4,  7,  4,  4,  4,  4,  4,  4,  7,  4,  # 70
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 80
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # 90
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # A0
+     4,  4,  4,  4,  4,  4,  7,  4,  4,  4,  4,  4,  4,  4,  7,  4,  # B0
+     5, 10, 10, 10, 10, 11,  7, 11,  5, 10, 10,  4, 10, 17,  7, 11,  # C0
+     5, 10, 10, 11, 10, 11,  7, 11,  5,  4, 10, 11, 10,  4,  7, 11,  # D0
+     5, 10, 10, 19, 10, 11,  7, 11,  5,  4, 10,  4, 10,  4,  7, 11,  # E0
+     5, 10, 10,  4, 10, 11,  7, 11,  5,  6, 10,  4, 10,  4,  7, 11   # F0
+])
+
+# Clock cycles when the condition of a jump, return or call is met
+_cycles_taken = bytes(13 if op == 0x10 else 12 if op in (0x20, 0x28, 0x30, 0x38) else
+                      11 if (op & 0xC7) == 0xC0 else 17 if (op & 0xC7) == 0xC4 else _cycles[op]
+                      for op in range(0x100))
+
+_cycles_cb = bytes((12 if (op & 0xC0) == 0x40 else 15) if (op & 0x07) == 6 else 8
+                   for op in range(0x100))
+
+# ED prefixed opcodes; of block instructions when they do not repeat
+_cycles_ed = bytes([
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 00
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 10
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 20
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 30
+    12, 12, 15, 20,  8, 14,  8,  9, 12, 12, 15, 20,  8, 14,  8,  9,  # 40
+    12, 12, 15, 20,  8, 14,  8,  9, 12, 12, 15, 20,  8, 14,  8,  9,  # 50
+    12, 12, 15, 20,  8, 14,  8, 18, 12, 12, 15, 20,  8, 14,  8, 18,  # 60
+    12, 12, 15, 20,  8, 14,  8,  8, 12, 12, 15, 20,  8, 14,  8,  8,  # 70
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 80
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # 90
+    16, 16, 16, 16,  8,  8,  8,  8, 16, 16, 16, 16,  8,  8,  8,  8,  # A0
+    16, 16, 16, 16,  8,  8,  8,  8, 16, 16, 16, 16,  8,  8,  8,  8,  # B0
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # C0
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # D0
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  # E0
+     8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8,  8   # F0
+])
+
+_cycles_ed_taken = bytes(21 if (op & 0xF4) == 0xB0 else _cycles_ed[op] for op in range(0x100))
+
 class rom_z80(rom_base.rom_base):
     """ROM image containing Zilog z80 code to be disassembled."""
 
 
     description = 'Zilog Z80 (DD and FD prefixed instructions not implemented yet)'
 
+    # Instruction set emulated by the emulate module
+    emulation = 'z80'
+
+    # Length in bytes of the longest instruction
+    max_insn_length = 4
+
+    # Clock cycles of each opcode
+    cycle_table       = _cycles
+    cycle_table_taken = _cycles_taken
+
     # Pre-defined names for special auto-created labels
     special_labels = default_labels
 
@@ -78,7 +140,7 @@ class rom_z80(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
@@ -90,7 +152,7 @@ class rom_z80(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
         """
 
@@ -107,7 +169,7 @@ class rom_z80(rom_base.rom_base):
         Keyword arguments:
         address     -- Address of LSB location to reclassify.
         access_addr -- Address of instruction which triggered this
-                       classification. Used for warning comment
+                       classification. Recorded as the diagnostic source
                        if change indicates probable disassembly error.
 
         Returns:
@@ -116,6 +178,85 @@ class rom_z80(rom_base.rom_base):
 
         return self._set_vector16_le_intel(address, access_addr)
 
+    def set_data8_range(self, start, end, access_addr=None):
+        """Classify range of locations as 8-bit data, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data8_range_intel(start, end, access_addr)
+
+
+    def set_data16_array(self, address, count, access_addr=None):
+        """Classify array of 16-bit little-endian words as data, Intel format.
+
+        Keyword arguments:
+        address     -- Address of LSB of first word to reclassify.
+        count       -- Number of words in the array.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_data16_array_le_intel(address, count, access_addr)
+
+
+    def set_vector_table(self, address, count, access_addr=None):
+        """Classify table of pointers to executable code and return their contents.
+
+        Keyword arguments:
+        address     -- Address of LSB of first vector to reclassify.
+        count       -- Number of vectors in the table.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        List of addresses contained in the table.
+        """
+
+        return self._set_vector16_table_le_intel(address, count, access_addr)
+
+
+    def set_strings(self, address, count=1, terminator=0x00, end=None, access_addr=None):
+        """Classify run of terminated strings as text, Intel format.
+
+        Keyword arguments:
+        address     -- Address of first character of first string.
+        count       -- Number of consecutive strings, or None to continue
+                       until end or the end of the ROM.
+        terminator  -- Terminating byte value, or None for strings whose
+                       last character has bit 7 set.
+        end         -- If specified, address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+
+        Returns:
+        Address following the last classified string.
+        """
+
+        return self._set_strings_intel(address, count, terminator, end, access_addr)
+
+
+    def set_table(self, start, end, access_addr=None):
+        """Classify range of locations as a byte table, Intel format.
+
+        Keyword arguments:
+        start       -- Address of first location to reclassify.
+        end         -- Address of last location to reclassify.
+        access_addr -- Address of instruction which triggered this
+                       classification. Recorded as the diagnostic source
+                       if change indicates probable disassembly error.
+        """
+
+        self._set_table_intel(start, end, access_addr)
+
 
     def disasm_single(self, address, create_label=True):
         """Disassemble a single instruction.
@@ -138,15 +279,15 @@ class rom_z80(rom_base.rom_base):
 
         if self.data_type[idx] is rom_base.type_operand:
             # Trying to disassemble another instruction's operand
-            self.comments[idx] += 'WARNING: Disassembling an operand. '
+            self._diagnose(rom_base.diag_disasm_operand, address)
 
         if self.data_type[idx] in rom_base.data_types:
             # Trying to disassemble a data byte
-            self.comments[idx] += 'WARNING: Disassembling data. '
+            self._diagnose(rom_base.diag_disasm_data, address)
 
         if self.data_type[idx] is rom_base.type_error:
             # Trying to disassemble an error
-            self.comments[idx] += 'WARNING: Disassembling location flagged as error. '
+            self._diagnose(rom_base.diag_disasm_error, address)
 
         self.data_type[idx] = rom_base.type_instruction
         opcode     = self.rom[idx]
@@ -300,6 +441,7 @@ class rom_z80(rom_base.rom_base):
             if z == 0:
                 # Conditional return
                 self.disassembly[idx] = 'RET  {:s}'.format(_cc[y])
+                self.add_return(address)
                 next_addrs = [address + 1]
 
             elif z == 1:
@@ -310,12 +452,15 @@ class rom_z80(rom_base.rom_base):
                 else:
                     if p == 0:
                         self.disassembly[idx] = 'RET'
+                        self.add_return(address)
                         next_addrs = []
                     elif p == 1:
                         self.disassembly[idx] = 'EXX'
                         next_addrs = [address + 1]
                     elif p == 2:
                         self.disassembly[idx] = 'JP   HL'
+                        # Computed jump, possibly used as a return
+                        self.add_return(address)
                         next_addrs = []
                     else:
                         self.disassembly[idx] = 'LD   SP, HL'
@@ -389,7 +534,7 @@ class rom_z80(rom_base.rom_base):
                 self.data_type[idx+2] = rom_base.type_operand
                 self.disassembly[idx] = 'CALL {:s}, {:s}'.format(_cc[y], self._lookup_a16_intel(word, create_label, 'C_'))
                 next_addrs = [address + 3, word]
-                self.add_xref(address, word)
+                self.add_call(address, word)
 
             elif z == 5:
                 # PUSH and various ops
@@ -403,7 +548,7 @@ class rom_z80(rom_base.rom_base):
                         self.data_type[idx+2] = rom_base.type_operand
                         self.disassembly[idx] = 'CALL {:s}'.format(self._lookup_a16_intel(word, create_label, 'C_'))
                         next_addrs = [address + 3, word]
-                        self.add_xref(address, word)
+                        self.add_call(address, word)
                     elif p == 1:
                     # DD prefix
                         raise NotImplementedError('DD prefixed instructions not implemented yet.')
@@ -420,8 +565,8 @@ class rom_z80(rom_base.rom_base):
                         self.data_type[idx+1] = rom_base.type_operand
 
                         if (x2 == 0) or (x2 == 3):
-                            self.comments[idx] += 'ERROR: invalid opcode ED{:s} '.format(util.hex8_intel(opcode2))
-                            self.comments[idx+1] = self.comments[idx]
+                            self._diagnose(rom_base.diag_invalid_opcode, address, None, ('ED' + util.hex8_intel(opcode2),))
+                            self._diagnose(rom_base.diag_invalid_opcode, address + 1, None, ('ED' + util.hex8_intel(opcode2),))
                             self.data_type[idx] = rom_base.type_error
                             self.data_type[idx+1] = rom_base.type_error
                             next_addrs = [address + 2]
@@ -468,8 +613,10 @@ class rom_z80(rom_base.rom_base):
                                 # Return from interrupt
                                 if y == 1:
                                     self.disassembly[idx] = 'RETI'
+                                    self.add_return(address)
                                 else:
                                     self.disassembly[idx] = 'RETN'
+                                    self.add_return(address)
                                 next_addrs = []
                             elif z2 == 6:
                                 # Set interrupt mode
@@ -495,10 +642,11 @@ class rom_z80(rom_base.rom_base):
                             # x2 == 2
                             if (z2 <= 3) and (y2 >= 4):
                                 # Block instructions
-                                self.disassembly[idx] = _bli[y2-4, z2]
+                                self.disassembly[idx] = _bli[y2-4][z2]
+                                next_addrs = [address + 2]
                             else:
-                                self.comments[idx] += 'ERROR: invalid opcode ED{:s} '.format(util.hex8_intel(opcode2))
-                                self.comments[idx+1] = self.comments[idx]
+                                self._diagnose(rom_base.diag_invalid_opcode, address, None, ('ED' + util.hex8_intel(opcode2),))
+                                self._diagnose(rom_base.diag_invalid_opcode, address + 1, None, ('ED' + util.hex8_intel(opcode2),))
                                 self.data_type[idx] = rom_base.type_error
                                 self.data_type[idx+1] = rom_base.type_error
                                 next_addrs = [address + 2]
@@ -518,14 +666,15 @@ class rom_z80(rom_base.rom_base):
                 # Restart
                 self.disassembly[idx] = 'RST  {:d}'.format(y*8)
                 next_addrs = [y*8]
-                self.add_xref(address, y*8)
+                self.add_call(address, y*8)
 
         return next_addrs
 
 
     def disassemble(self, entries=default_entries,
                     create_labels = True, single_step=False, valid_range=None,
-                    breakpoints=[], vectors=[]):
+                    breakpoints=[], vectors=[], vector_tables=[],
+                    resolve_overlaps=False):
         """Disassemble code, starting at specified entry point address(es).
 
         Keyword arguments:
@@ -552,12 +701,20 @@ class rom_z80(rom_base.rom_base):
         vectors       -- If specified, a list of addresses which are assumed to contain
                          pointers to executable code. Pointers are subject to label creation
                          and substitution, and will be added to entries list for disassembly.
+
+        vector_tables -- If specified, a list of (address, count) tuples describing tables
+                         of vectors. All pointers in all tables are classified in bulk and
+                         added to the entries list in a single batch.
+
+        resolve_overlaps -- If True, resolve overlapping instructions once all possible
+                         starts are known, independently of the order of entries.
         """
 
         # We are just changing the default entries argument value here, to default
         # to the RST intruction destination addresses.
         return rom_base.rom_base.disassemble(self, entries, create_labels,
-                                             single_step, valid_range, breakpoints, vectors)
+                                             single_step, valid_range, breakpoints, vectors,
+                                             vector_tables, resolve_overlaps)
     
 
     def listing(self, source=False):
@@ -572,6 +729,24 @@ class rom_z80(rom_base.rom_base):
         return rom_base.rom_base._listing_a16_d8_intel(self, source)
 
 
+    def cycles(self, address):
+        """Return clock cycles of the instruction at address.
+
+        Returns:
+        (cycles, cycles_taken) tuple, as for rom_base.cycles(), counting
+        CB and ED prefixed instructions from their own tables."""
+
+        idx    = address - self.base_address
+        opcode = self.rom[idx]
+        if (opcode == 0xCB) and (idx + 1 < self.rom_len):
+            opcode = self.rom[idx + 1]
+            return (_cycles_cb[opcode], _cycles_cb[opcode])
+        if (opcode == 0xED) and (idx + 1 < self.rom_len):
+            opcode = self.rom[idx + 1]
+            return (_cycles_ed[opcode], _cycles_ed_taken[opcode])
+        return (_cycles[opcode], _cycles_taken[opcode])
+
+
     def lookup_address(self, address, create_label=True, prefix='L_'):
         """Look up address in label map, returning symbol name or hex string.
 
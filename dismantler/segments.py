@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Sparse images made of separate segments.
+
+Hex files with scattered records, and the memory of CPUs with 20- or
+24-bit address spaces, often hold code and data in only a few places.
+A segmented_image stores each contiguous segment separately, so holes
+take no space, and analyzes each segment with its own CPU object.
+Control flow which leaves a segment is followed into the segment
+containing its destination, with cross-references recorded on both
+sides and labels shared with the segment which defines the address.
+
+Example:
+    image = dismantler.segments.segmented_image(dismantler.cpus['8085'], address_width=20)
+    image.add_records([(0x00000, code), (0x80000, more_code)])
+    image.disassemble(entries=[0x00000])
+    sys.stdout.write(image.listing())
+"""
+
+import bisect
+
+from . import rom_base
+
+
+def follow_exits(rom, start, owner_of, pending, create_labels):
+    """Queue control flow which leaves one address space in the spaces it reaches.
+
+    Keyword arguments:
+    rom           -- Object derived from rom_base, after disassemble().
+    start         -- Number of recorded instructions already followed.
+    owner_of      -- Function taking (address, rom) and returning the other rom
+                     object whose range contains address, or None.
+    pending       -- Dictionary of rom object -> list of entries, updated.
+    create_labels -- Create labels for destinations.
+
+    Returns:
+    Number of recorded instructions followed, for the next call.
+    """
+
+    items = list(rom.successors.items())
+    for source, dests in items[start:]:
+        for dest in dests:
+            if (dest >= rom.base_address) and (dest <= rom.max_address):
+                continue
+            owner = owner_of(dest, rom)
+            if owner is None:
+                continue
+            if rom.call_sites.get(source) == dest:
+                owner.add_call(source, dest)
+            else:
+                owner.add_xref(source, dest)
+            if (dest in rom.label_map) and (dest not in owner.label_map):
+                owner.label_map[dest] = rom.label_map[dest]
+            elif create_labels:
+                owner.lookup_address(dest, True)
+            pending.setdefault(owner, []).append(dest)
+    return len(items)
+
+
+def share_labels(roms, owner_of):
+    """Give each address space the labels other spaces created for its addresses.
+
+    Keyword arguments:
+    roms     -- List of rom objects.
+    owner_of -- Function as for follow_exits().
+    """
+
+    for rom in roms:
+        for address, label in list(rom.label_map.items()):
+            if (address >= rom.base_address) and (address <= rom.max_address):
+                continue
+            owner = owner_of(address, rom)
+            if (owner is not None) and (address not in owner.label_map):
+                owner.label_map[address] = label
+
+
+class segmented_image(object):
+    """Image made of non-overlapping segments, with holes between them."""
+
+    def __init__(self, cpu_class, address_width=16, label_map={}, port_map={}):
+        """Segmented image constructor.
+
+        Keyword arguments:
+        cpu_class     -- Class derived from rom_base used for every segment.
+        address_width -- Number of bits in a memory address.
+        label_map     -- Dictionary of address->label mappings, copied into every segment.
+        port_map      -- Dictionary of IO port->name mappings, shared by every segment.
+        """
+
+        self.cpu_class     = cpu_class
+        self.address_width = address_width
+        self.label_map     = label_map
+        self.port_map      = port_map
+        self.segments      = []  # rom objects, in address order
+        self.region_hooks  = []  # Functions called with each newly created segment's rom object
+        self._starts       = []  # Base address of each segment, for bisection
+        self._scanned      = {}  # rom object -> number of successors already followed
+
+    def add_segment(self, address, data):
+        """Add a segment of the image.
+
+        Keyword arguments:
+        address -- Address of first byte.
+        data    -- Contents of the segment, e.g. a bytearray or memoryview.
+
+        Returns:
+        The rom object analyzing the segment.
+        """
+
+        end = address + len(data) - 1
+        if (address < 0) or (end >= (1 << self.address_width)):
+            raise ValueError('Segment at {:X} does not fit in {:d}-bit address space.'.format(
+                address, self.address_width))
+        i = bisect.bisect_left(self._starts, address)
+        if ((i > 0) and (self.segments[i-1].max_address >= address)) \
+           or ((i < len(self._starts)) and (self._starts[i] <= end)):
+            raise ValueError('Segment at {:X} overlaps another segment.'.format(address))
+
+        rom = self.cpu_class(rom=data, base_address=address,
+                             label_map=dict(self.label_map), port_map=self.port_map)
+        rom.address_width = self.address_width
+        self.segments.insert(i, rom)
+        self._starts.insert(i, address)
+        for hook in self.region_hooks:
+            hook(rom)
+        return rom
+
+    def add_records(self, records):
+        """Add segments from (address, data) records, merging adjacent records.
+
+        Records may arrive in any order. Where records overlap, the later
+        one takes precedence.
+
+        Keyword arguments:
+        records -- Iterable of (address, data) tuples.
+        """
+
+        runs = []  # [start, bytearray] of merged runs, in address order
+        for address, data in sorted(records, key=lambda record: record[0]):
+            if runs and (address <= runs[-1][0] + len(runs[-1][1])):
+                start, run = runs[-1]
+                offset = address - start
+                run[offset:offset + len(data)] = data
+            else:
+                runs.append([address, bytearray(data)])
+        for address, run in runs:
+            self.add_segment(address, run)
+
+    def segment_at(self, address, exclude=None):
+        """Return the rom object of the segment containing address, or None.
+
+        Keyword arguments:
+        address -- Memory address.
+        exclude -- If specified, rom object never to return.
+        """
+
+        i = bisect.bisect_right(self._starts, address) - 1
+        if i >= 0:
+            rom = self.segments[i]
+            if (rom is not exclude) and (address <= rom.max_address):
+                return rom
+        return None
+
+    def disassemble(self, entries=[0], create_labels=True, breakpoints=[],
+                    vectors=[], vector_tables=[]):
+        """Disassemble every segment reachable from the entry points.
+
+        Keyword arguments are as for rom_base.disassemble(). Entries,
+        vectors and vector tables outside of every segment are ignored.
+        """
+
+        pending = {}  # rom object -> list of entries to visit
+        kwargs  = {}  # rom object -> vectors and vector tables for its first pass
+        for address in entries:
+            rom = self.segment_at(address)
+            if rom is not None:
+                pending.setdefault(rom, []).append(address)
+        for address in vectors:
+            rom = self.segment_at(address)
+            if rom is not None:
+                kwargs.setdefault(rom, {'vectors': [], 'vector_tables': []})['vectors'].append(address)
+                pending.setdefault(rom, [])
+        for address, count in vector_tables:
+            rom = self.segment_at(address)
+            if rom is not None:
+                kwargs.setdefault(rom, {'vectors': [], 'vector_tables': []})['vector_tables'].append(
+                    (address, count))
+                pending.setdefault(rom, [])
+
+        # Visit segments in address order, batching all entries queued for each
+        while pending:
+            rom = min(pending, key=lambda rom: rom.base_address)
+            rom.disassemble(entries=pending.pop(rom), create_labels=create_labels,
+                            breakpoints=breakpoints, **kwargs.pop(rom, {}))
+            self._scanned[rom] = follow_exits(rom, self._scanned.get(rom, 0), self.segment_at,
+                                              pending, create_labels)
+
+        share_labels(self.segments, self.segment_at)
+
+    def filter_diagnostics(self, **kwargs):
+        """Return list of diagnostics from all segments.
+
+        Keyword arguments are passed to rom_base.filter_diagnostics().
+        """
+
+        diags = []
+        for rom in self.segments:
+            diags = diags + rom.filter_diagnostics(**kwargs)
+        return diags
+
+    def diagnostic_report(self, max_lines=None, min_severity=rom_base.severity_info):
+        """Return diagnostic reports of all segments.
+
+        Keyword arguments are as for rom_base.diagnostic_report().
+        """
+
+        report = ''
+        for rom in self.segments:
+            report = report + '; Segment at {:s}:\n'.format(rom.format_address(rom.base_address))
+            report = report + rom.diagnostic_report(max_lines, min_severity)
+        return report
+
+    def listing(self, source=False):
+        """Return listing of every segment, in address order.
+
+        Keyword arguments:
+        source -- If True, output assembler source format.
+        """
+
+        listing_str = ''
+        for rom in self.segments:
+            listing_str = listing_str + '; Segment: {:s}..{:s}\n\n'.format(
+                rom.format_address(rom.base_address), rom.format_address(rom.max_address))
+            listing_str = listing_str + rom.listing(source=source)
+        return listing_str
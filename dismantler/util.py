@@ -12,11 +12,62 @@ def hex16_intel(val):
         valstr = '0'+valstr
     return valstr
 
+def hex_digits(width):
+    """Return number of hex digits needed for a value of width bits."""
+    return (width + 3) // 4
+
+def hex_intel(val, width=16):
+    """Return hex constant for value of width bits in Intel assembler format."""
+    valstr = '{:0{:d}X}h'.format(val, hex_digits(width))
+    if valstr[0] in ['A', 'B', 'C', 'D', 'E', 'F']:
+        valstr = '0'+valstr
+    return valstr
+
+def text_intel(data):
+    """Return DB operands for bytes in Intel assembler format, quoting printable text."""
+    items = []
+    text  = ''
+    for val in data:
+        if (val >= 0x20) and (val <= 0x7E):
+            text = text + ("''" if val == 0x27 else chr(val))
+        else:
+            if text:
+                items.append("'{:s}'".format(text))
+                text = ''
+            items.append(hex8_intel(val))
+    if text:
+        items.append("'{:s}'".format(text))
+    return ', '.join(items)
+
 def signed_byte(val):
     """Interpret data as signed 8-bit value, return integer."""
     val = val & 0xFF
     if val > 0x7F:
         val = ((val ^ 0xFF) + 1) * -1
     return val
-            
-    
+
+def parse_span(text):
+    """Parse ADDRESS, START..END or START:COUNT string.
+
+    Numbers use Python syntax, so 0x prefixes select hexadecimal.
+
+    Returns:
+    Tuple of (start, end, count). Exactly one of end and count is None,
+    except that a single address returns (address, None, 1)."""
+    if '..' in text:
+        start, end = text.split('..', 1)
+        start, end = int(start, 0), int(end, 0)
+        if end < start:
+            raise ValueError('range end precedes start: {:s}'.format(text))
+        return (start, end, None)
+    if ':' in text:
+        start, count = text.split(':', 1)
+        return (int(start, 0), None, int(count, 0))
+    return (int(text, 0), None, 1)
+
+def span_words(span):
+    """Return (start, count) of 16-bit words described by a parsed span."""
+    start, end, count = span
+    if count is None:
+        count = (end - start + 1) // 2
+    return (start, count)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Tests of dismantler.callgraph."""
+
+import unittest
+
+import dismantler.callgraph
+import dismantler.flowgraph
+import dismantler.rom_8080
+
+
+def _calls(code):
+    """Return call graph of {address: bytes} 8080 code entered at 0000h."""
+
+    image = bytearray(0x200)
+    for address, data in code.items():
+        image[address:address + len(data)] = data
+    rom = dismantler.rom_8080.rom_8080(image, 0, label_map={}, port_map={})
+    rom.disassemble(entries=[0x0000])
+    return dismantler.callgraph.callgraph(dismantler.flowgraph.flowgraph(rom))
+
+
+class test_returns(unittest.TestCase):
+
+    def test_conditional_return_mid_block(self):
+        # 0000: CALL 0100; HLT
+        # 0100: LDA 2000h; ORA A; RZ; JMP 0100
+        calls = _calls({0x0000: b'\xCD\x00\x01\x76',
+                        0x0100: b'\x3A\x00\x20\xB7\xC8\xC3\x00\x01'})
+        self.assertTrue(calls.subroutines[0x0100].returns)
+
+    def test_invalid_opcode(self):
+        # 0000: CALL 0100; HLT
+        # 0100: MVI A,5; invalid opcode D9h
+        calls = _calls({0x0000: b'\xCD\x00\x01\x76',
+                        0x0100: b'\x3E\x05\xD9'})
+        self.assertFalse(calls.subroutines[0x0100].returns)
+
+    def test_unconditional_return(self):
+        # 0000: CALL 0100; HLT
+        # 0100: MVI A,5; RET
+        calls = _calls({0x0000: b'\xCD\x00\x01\x76',
+                        0x0100: b'\x3E\x05\xC9'})
+        self.assertTrue(calls.subroutines[0x0100].returns)
+
+
+if __name__ == '__main__':
+    unittest.main()
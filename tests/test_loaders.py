@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Tests of dismantler.loaders."""
+
+import unittest
+
+from dismantler import loaders
+
+
+def _ihex(count, offset, kind, data):
+    """Return Intel HEX record text with a correct checksum."""
+
+    record = bytes([count, offset >> 8, offset & 0xFF, kind]) + bytes(data)
+    return ':' + (record + bytes([-sum(record) & 0xFF])).hex().upper()
+
+
+def _srec(kind, address, n, data):
+    """Return S-record text of an n-byte address with a correct checksum."""
+
+    record = bytes([n + len(data) + 1]) + address.to_bytes(n, 'big') + bytes(data)
+    return 'S' + kind + (record + bytes([~sum(record) & 0xFF])).hex().upper()
+
+
+class test_ihex(unittest.TestCase):
+
+    def test_data(self):
+        segments, start = loaders.parse_ihex([_ihex(2, 0x1000, 0x00, b'\x12\x34'),
+                                              _ihex(0, 0, 0x01, b'')])
+        self.assertEqual(segments, [(0x1000, bytearray(b'\x12\x34'))])
+        self.assertIsNone(start)
+
+    def test_checksum_error(self):
+        line = _ihex(1, 0, 0x00, b'\x55')
+        line = line[:-2] + '{:02X}'.format(int(line[-2:], 16) ^ 1)
+        with self.assertRaisesRegex(ValueError, 'x.hex:1: checksum error'):
+            loaders.parse_ihex([line], 'x.hex')
+
+    def test_segment_address(self):
+        # Type 02: segment 1000h -> base 10000h
+        segments, start = loaders.parse_ihex([_ihex(2, 0, 0x02, b'\x10\x00'),
+                                              _ihex(1, 0x0010, 0x00, b'\xAA')])
+        self.assertEqual(segments, [(0x10010, bytearray(b'\xAA'))])
+
+    def test_linear_address(self):
+        # Type 04: upper 16 bits 0002h -> base 20000h
+        segments, start = loaders.parse_ihex([_ihex(2, 0, 0x04, b'\x00\x02'),
+                                              _ihex(1, 0x0010, 0x00, b'\xAA'),
+                                              _ihex(4, 0, 0x05, b'\x00\x02\x00\x10')])
+        self.assertEqual(segments, [(0x20010, bytearray(b'\xAA'))])
+        self.assertEqual(start, 0x20010)
+
+    def test_short_extended_record(self):
+        for kind, count in ((0x02, 1), (0x03, 2), (0x04, 1), (0x05, 3)):
+            with self.assertRaisesRegex(ValueError, 'bad extended address record'):
+                loaders.parse_ihex([_ihex(count, 0, kind, bytes(count))])
+
+    def test_segment_merging(self):
+        # Out of order, adjacent and overlapping records merge; a gap splits
+        segments, start = loaders.parse_ihex([_ihex(2, 0x0002, 0x00, b'\x03\x04'),
+                                              _ihex(2, 0x0000, 0x00, b'\x01\x02'),
+                                              _ihex(2, 0x0003, 0x00, b'\x05\x06'),
+                                              _ihex(1, 0x0100, 0x00, b'\x07')])
+        self.assertEqual(segments, [(0x0000, bytearray(b'\x01\x02\x03\x05\x06')),
+                                    (0x0100, bytearray(b'\x07'))])
+
+
+class test_srec(unittest.TestCase):
+
+    def test_s2_s3(self):
+        segments, start = loaders.parse_srec([_srec('2', 0x012345, 3, b'\xAA\xBB'),
+                                              _srec('3', 0x01234567, 4, b'\xCC'),
+                                              _srec('7', 0x01234567, 4, b'')])
+        self.assertEqual(segments, [(0x012345, bytearray(b'\xAA\xBB')),
+                                    (0x01234567, bytearray(b'\xCC'))])
+        self.assertEqual(start, 0x01234567)
+
+    def test_checksum_error(self):
+        line = _srec('1', 0x0100, 2, b'\x55')
+        line = line[:-2] + '{:02X}'.format(int(line[-2:], 16) ^ 1)
+        with self.assertRaisesRegex(ValueError, 'x.s19:1: checksum error'):
+            loaders.parse_srec([line], 'x.s19')
+
+
+class test_combine(unittest.TestCase):
+
+    def test_interleave(self):
+        address, image = loaders.combine([(0x8000, bytearray(b'\x00\x02\x04')),
+                                          (0, bytearray(b'\x01\x03\x05'))])
+        self.assertEqual((address, image), (0x8000, bytearray(b'\x00\x01\x02\x03\x04\x05')))
+
+    def test_interleave_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            loaders.combine([(0, bytearray(2)), (0, bytearray(3))])
+
+    def test_concatenate(self):
+        address, image = loaders.combine([(0, bytearray(b'\x00\x01')), (0, bytearray(b'\x02'))],
+                                         interleave=False)
+        self.assertEqual(image, bytearray(b'\x00\x01\x02'))
+
+
+if __name__ == '__main__':
+    unittest.main()
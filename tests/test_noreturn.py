@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+##########################################################################
+# Copyright (C) 2015 Mark J. Blair, NF6X
+#
+# This file is part of dismantler.
+#
+#  dismantler is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  dismantler is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with dismantler.  If not, see <http://www.gnu.org/licenses/>.
+##########################################################################
+
+"""Tests of dismantler.noreturn."""
+
+import unittest
+
+import dismantler.noreturn
+import dismantler.rom_8080
+from dismantler import rom_base
+
+
+def _rom(code):
+    """Return 8080 ROM object holding {address: bytes} code in a blank 512-byte image."""
+
+    image = bytearray(0x200)
+    for address, data in code.items():
+        image[address:address + len(data)] = data
+    return dismantler.rom_8080.rom_8080(image, 0, label_map={}, port_map={})
+
+
+class test_no_return(unittest.TestCase):
+
+    def test_conditional_return_mid_block(self):
+        # 0000: CALL 0100; MVI A,5; OUT 10h; JMP 0003
+        # 0100: LDA 2000h; ORA A; RZ; JMP 0000
+        rom = _rom({0x0000: b'\xCD\x00\x01\x3E\x05\xD3\x10\xC3\x03\x00',
+                    0x0100: b'\x3A\x00\x20\xB7\xC8\xC3\x00\x00'})
+        found = dismantler.noreturn.disassemble(rom, entries=[0x0000])
+        self.assertNotIn(0x0100, found)
+        self.assertIs(rom.data_type[0x0003], rom_base.type_instruction)
+
+    def test_jump_only(self):
+        # 0000: CALL 0100; MVI A,5; 0100: JMP 0100
+        rom = _rom({0x0000: b'\xCD\x00\x01\x3E\x05',
+                    0x0100: b'\xC3\x00\x01'})
+        found = dismantler.noreturn.disassemble(rom, entries=[0x0000])
+        self.assertIn(0x0100, found)
+        self.assertIsNot(rom.data_type[0x0003], rom_base.type_instruction)
+
+
+if __name__ == '__main__':
+    unittest.main()